@@ -0,0 +1,149 @@
+import logging
+
+import pandas as pd
+
+# Способы сопоставления строк разных файлов по времени
+ALIGN_EXACT = 'exact'      # строки с одинаковым временем; в результат входят моменты времени всех файлов
+ALIGN_NEAREST = 'nearest'  # к каждой строке первого файла - ближайшая по времени строка другого файла
+ALIGN_FFILL = 'ffill'      # к каждой строке первого файла - последняя строка другого файла не позже неё
+ALIGN_MODES = (ALIGN_EXACT, ALIGN_NEAREST, ALIGN_FFILL)
+DEFAULT_ALIGN = ALIGN_EXACT
+
+# Служебное имя столбца времени при сопоставлении ближайших строк
+_TIME_KEY = '__align_time__'
+
+
+def parse_tolerance(value):
+    """
+    Допуск сопоставления по времени: строка pandas ('30min', '1h', '90s') или число минут.
+    Пустое значение - без ограничения (None). Неверное значение - ValueError.
+    """
+    if value is None or str(value).strip() == "":
+        return None
+    value = str(value).strip()
+    try:
+        tolerance = pd.Timedelta(minutes=float(value.replace(',', '.')))
+    except ValueError:
+        tolerance = pd.Timedelta(value)
+    if pd.isna(tolerance) or tolerance < pd.Timedelta(0):
+        raise ValueError(f"недопустимый допуск: {value}")
+    return tolerance
+
+
+def source_window(time_window, mode, tolerance=None):
+    """
+    Временное окно строк, которые нужно прочитать из второго и последующих файлов.
+    При сопоставлении с ближайшей или предыдущей строкой нужны и строки до (после) окна -
+    в пределах допуска, а без допуска - все.
+    """
+    if time_window is None or mode == ALIGN_EXACT:
+        return time_window
+    start, end = time_window
+    if start is not None:
+        start = start - tolerance if tolerance is not None else None
+    if end is not None and mode == ALIGN_NEAREST:
+        end = end + tolerance if tolerance is not None else None
+    return (start, end) if start is not None or end is not None else None
+
+
+def _is_time(time_column):
+    return time_column is not None and pd.api.types.is_datetime64_any_dtype(time_column)
+
+
+def _drop_missing_times(time_column, df, file_number):
+    """Отбрасывает строки без времени - их нельзя сопоставить с другими файлами"""
+    mask = time_column.notna().to_numpy()
+    if not mask.all():
+        logging.warning(f"Файл {file_number}: пропущено строк без времени: {int((~mask).sum())}")
+        time_column = time_column[mask]
+        df = df[mask]
+    return time_column, df
+
+
+def _sorted_by_time(time_column, df, file_number):
+    """Упорядочивает строки по времени (устойчиво), если файл ещё не упорядочен"""
+    if not time_column.is_monotonic_increasing:
+        logging.info(f"Файл {file_number}: строки упорядочены по времени перед сопоставлением")
+        order = time_column.to_numpy().argsort(kind='stable')
+        time_column = time_column.iloc[order]
+        df = df.iloc[order]
+    return time_column, df
+
+
+def _align_exact(parts):
+    """
+    Объединение по совпадающему времени. Строки каждого файла индексируются временем
+    (для повторяющихся значений, например при переводе часов, - парой (время, номер повтора)),
+    затем индексы упорядоченных файлов объединяются слиянием за линейное время.
+    """
+    prepared = []
+    has_repeats = False
+    for number, (time_column, df) in enumerate(parts, start=1):
+        time_column, df = _drop_missing_times(time_column, df, number)
+        time_column, df = _sorted_by_time(time_column, df, number)
+        has_repeats = has_repeats or not time_column.is_unique
+        prepared.append((time_column, df))
+
+    frames = []
+    for time_column, df in prepared:
+        times = pd.DatetimeIndex(time_column.to_numpy())
+        if has_repeats:
+            repeat = time_column.groupby(time_column.to_numpy(), sort=False).cumcount().to_numpy()
+            index = pd.MultiIndex.from_arrays([times, repeat])
+        else:
+            index = times
+        frames.append(df.set_axis(index, axis=0))
+
+    merged_df = pd.concat(frames, axis=1, sort=True)
+    times = merged_df.index.get_level_values(0) if has_repeats else merged_df.index
+    merged_df.reset_index(drop=True, inplace=True)
+    return pd.Series(times, index=merged_df.index), merged_df
+
+
+def _align_asof(parts, direction, tolerance):
+    """
+    Сопоставление с временной шкалой первого файла: к каждой его строке подбирается
+    ближайшая (direction='nearest') или последняя не более поздняя (direction='backward') строка
+    каждого другого файла, не дальше tolerance. Каждое сопоставление - одно слияние упорядоченных рядов.
+    """
+    base_time, base_df = _drop_missing_times(parts[0][0], parts[0][1], 1)
+    base_time, base_df = _sorted_by_time(base_time, base_df, 1)
+    base_time = base_time.reset_index(drop=True)
+    keys = pd.DataFrame({_TIME_KEY: base_time.astype('datetime64[ns]')})
+
+    aligned = [base_df.set_axis(keys.index, axis=0)]
+    for number, (time_column, df) in enumerate(parts[1:], start=2):
+        time_column, df = _drop_missing_times(time_column, df, number)
+        time_column, df = _sorted_by_time(time_column, df, number)
+        columns = df.columns
+        # Позиционные имена: в файле могут быть одинаковые названия столбцов
+        right = df.set_axis(range(len(columns)), axis=1).reset_index(drop=True)
+        right.insert(0, _TIME_KEY, time_column.astype('datetime64[ns]').to_numpy())
+        matched = pd.merge_asof(keys, right, on=_TIME_KEY, direction=direction, tolerance=tolerance)
+        aligned.append(matched.drop(columns=_TIME_KEY).set_axis(columns, axis=1))
+
+    return base_time, pd.concat(aligned, axis=1)
+
+
+def align_frames(parts, mode=DEFAULT_ALIGN, tolerance=None):
+    """
+    Объединяет подготовленные файлы по столбцам с сопоставлением строк по времени.
+
+    parts - [(столбец времени, DataFrame)] в порядке файлов (результат prepare_frame).
+    mode - ALIGN_EXACT, ALIGN_NEAREST или ALIGN_FFILL; tolerance (pd.Timedelta) ограничивает
+    расстояние до сопоставляемой строки в режимах nearest и ffill.
+    Возвращает (столбец времени, объединенный DataFrame) с общим индексом 0..N-1.
+    Если хотя бы в одном файле нет столбца времени, строки объединяются по порядку, как раньше.
+    """
+    if mode not in ALIGN_MODES:
+        raise ValueError(f"Неизвестный способ сопоставления по времени: {mode}")
+
+    if not all(_is_time(time_column) for time_column, _ in parts):
+        logging.warning("Не во всех файлах найден столбец времени: строки объединяются по порядку, без сопоставления")
+        return parts[0][0], pd.concat([df for _, df in parts], axis=1)
+
+    if mode == ALIGN_EXACT:
+        if tolerance is not None:
+            logging.info("Допуск не используется при точном совпадении времени")
+        return _align_exact(parts)
+    return _align_asof(parts, 'nearest' if mode == ALIGN_NEAREST else 'backward', tolerance)
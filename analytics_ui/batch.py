@@ -0,0 +1,207 @@
+"""
+Пакетное объединение файлов без графического интерфейса.
+
+Пример:
+    analytics-ui-batch "archive/*.xlsx" -o report.xlsx --start "2024-01-01 00:00" --end "2024-01-31 23:00"
+
+Коды завершения: 0 - отчёт сохранён, 1 - ошибка объединения, 2 - неверные аргументы
+или входные данные, 130 - прервано пользователем.
+"""
+import os
+import sys
+import glob
+import logging
+import argparse
+
+import pandas as pd
+
+from analytics_ui.rules import compile_rules
+from analytics_ui.file_cache import DiskCache
+from analytics_ui.align import ALIGN_MODES, DEFAULT_ALIGN, parse_tolerance
+from analytics_ui.readers import READERS, DEFAULT_READER, MergeCancelled, default_read_workers, resolve_reader
+from analytics_ui.report import COLOR_MODE_CONDITIONAL, COLOR_MODE_STATIC
+from analytics_ui.export import check_export_format
+from analytics_ui.profiling import MergeProfile
+from analytics_ui.pipeline import (
+    RULES_FILE_NAME, MergeError, resource_path, setup_logging, load_rules, measurement_nodes,
+    check_selection, build_merge_job, run_merge
+)
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_INTERRUPTED = 130
+
+
+def expand_inputs(patterns):
+    """Раскрывает шаблоны имён файлов; порядок файлов - порядок аргументов, внутри шаблона - по имени"""
+    files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        for file in matches:
+            if file not in files:
+                files.append(file)
+    return files
+
+
+def split_list(values):
+    """Значения, переданные повторением ключа и/или через точку с запятой"""
+    result = []
+    for value in values or ():
+        for item in value.split(';'):
+            item = item.strip()
+            if item and item not in result:
+                result.append(item)
+    return result
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='analytics-ui-batch',
+        description="Объединение Excel файлов и создание отчёта с Dashboard без графического интерфейса",
+    )
+    parser.add_argument('inputs', nargs='+', help="входные файлы .xlsx/.xls или шаблоны (например, \"data/*.xlsx\")")
+    parser.add_argument('-o', '--output', required=True,
+                        help="файл результата: отчёт .xlsx или только данные без оформления - "
+                             ".parquet, .feather, .csv")
+    parser.add_argument('--rules', default=None, help="файл правил названия столбцов (по умолчанию - поставляемый)")
+    parser.add_argument('-p', '--parameter', action='append', dest='parameters', metavar='ПАРАМЕТР',
+                        help="параметр для объединения; ключ можно повторять или перечислить через ';' "
+                             "(по умолчанию - все параметры)")
+    parser.add_argument('-n', '--node', action='append', dest='nodes', metavar='УЗЕЛ',
+                        help="узел измерения; ключ можно повторять или перечислить через ';' "
+                             "(по умолчанию - все узлы входных файлов)")
+    parser.add_argument('--start', help="начало периода, например \"2024-01-01 00:00\"")
+    parser.add_argument('--end', help="конец периода")
+    parser.add_argument('--align', choices=ALIGN_MODES, default=DEFAULT_ALIGN,
+                        help="сопоставление строк файлов по времени: exact - точное совпадение, "
+                             "nearest - ближайшее время, ffill - последнее известное значение "
+                             "(по умолчанию %(default)s)")
+    parser.add_argument('--tolerance', help="допуск для nearest/ffill: число минут или, например, \"30min\", \"1h\"")
+    parser.add_argument('--append', metavar='ПРЕДЫДУЩИЙ',
+                        help="дополнить предыдущий результат (отчёт .xlsx или файл данных): из входных файлов "
+                             "берутся только строки новее его последнего времени; -o может совпадать с ним")
+    parser.add_argument('--static-colors', action='store_true',
+                        help="раскрасить ячейки листа Данные готовыми форматами, без условного форматирования "
+                             "(большой отчёт быстрее открывается и прокручивается в Excel)")
+    parser.add_argument('--constant-memory', action='store_true',
+                        help="записывать отчёт построчно (режим xlsxwriter constant_memory): "
+                             "память при записи не растет с числом строк")
+    parser.add_argument('--workers', type=int, default=default_read_workers(),
+                        help="число процессов чтения файлов (по умолчанию %(default)s)")
+    parser.add_argument('--reader', choices=READERS, default=DEFAULT_READER,
+                        help="движок чтения Excel: auto - самый быстрый из установленных (calamine, если установлен "
+                             "python-calamine), openpyxl - openpyxl и xlrd (по умолчанию %(default)s)")
+    parser.add_argument('--no-cache', action='store_true', help="не использовать дисковый кэш прочитанных файлов")
+    parser.add_argument('--profile', action='store_true',
+                        help="вывести по окончании время и память по этапам и файлам "
+                             "(замеры всегда дописываются в profile.jsonl рядом с журналом)")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="замерять пик памяти Python-объектов по этапам через tracemalloc (медленнее)")
+    parser.add_argument('-q', '--quiet', action='store_true', help="не выводить ход выполнения")
+    return parser.parse_args(argv)
+
+
+def parse_datetime(value, name):
+    if not value:
+        return None
+    try:
+        return pd.to_datetime(value)
+    except Exception as e:
+        raise MergeError(f"Неверный формат {name} даты/времени: {str(e)}")
+
+
+def prepare_job(args):
+    """Составляет задание объединения по аргументам командной строки (MergeError - неверные входные данные)"""
+    try:
+        check_export_format(args.output)
+    except ValueError as e:
+        raise MergeError(f"Невозможно сохранить результат: {str(e)}")
+
+    files = expand_inputs(args.inputs)
+    missing = [file for file in files if not os.path.isfile(file)]
+    if missing:
+        raise MergeError(f"Файлы не найдены: {', '.join(missing)}")
+
+    # Правила проверяются до выбора параметров и узлов, которые из них берутся
+    rules_file = args.rules or resource_path(RULES_FILE_NAME)
+    if not os.path.isfile(rules_file):
+        raise MergeError(f"Файл правил не найден: {rules_file}")
+    rules = compile_rules(load_rules(rules_file))
+    if rules.empty:
+        raise MergeError(f"Не удалось загрузить правила (файл пуст или не читается): {rules_file}")
+
+    parameters = split_list(args.parameters) or list(rules.parameters)
+    unknown = [param for param in parameters if param not in rules.parameters]
+    if unknown:
+        raise MergeError(f"Параметры отсутствуют в файле правил: {', '.join(unknown)}")
+
+    available_nodes = measurement_nodes(rules, files)
+    nodes = split_list(args.nodes) or available_nodes
+    unknown = [node for node in nodes if node not in available_nodes]
+    if unknown:
+        raise MergeError(f"Узлы не найдены во входных файлах: {', '.join(unknown)}")
+
+    start_datetime = parse_datetime(args.start, "начальной")
+    end_datetime = parse_datetime(args.end, "конечной")
+    check_selection(files, rules, parameters, available_nodes, nodes, start_datetime, end_datetime)
+    if args.append and not os.path.isfile(args.append):
+        raise MergeError(f"Предыдущий результат не найден: {args.append}")
+    try:
+        tolerance = parse_tolerance(args.tolerance)
+    except ValueError as e:
+        raise MergeError(f"Неверный допуск сопоставления по времени: {str(e)}")
+    try:
+        resolve_reader(args.reader)
+    except ValueError as e:
+        raise MergeError(f"Невозможно прочитать файлы: {str(e)}")
+
+    return build_merge_job(files, rules, parameters, nodes, start_datetime, end_datetime,
+                           os.path.abspath(args.output), max(1, args.workers), args.align, tolerance,
+                           COLOR_MODE_STATIC if args.static_colors else COLOR_MODE_CONDITIONAL, args.constant_memory,
+                           os.path.abspath(args.append) if args.append else None, args.reader)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    log_file = setup_logging()
+
+    def progress(percent, text):
+        if not args.quiet:
+            print(f"[{percent:5.1f}%] {text}", file=sys.stderr)
+
+    try:
+        job = prepare_job(args)
+    except MergeError as e:
+        logging.error(str(e))
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return EXIT_USAGE
+
+    disk_cache = None if args.no_cache else DiskCache()
+    logging.info(f"Пакетное объединение: {len(job['files'])} файлов -> {job['output_file']}")
+    profile = MergeProfile(trace_memory=args.trace_memory)
+    try:
+        merged_df = run_merge(job, disk_cache=disk_cache, progress=progress, profile=profile)
+    except (KeyboardInterrupt, MergeCancelled):
+        logging.info("Пакетное объединение прервано")
+        print("Прервано", file=sys.stderr)
+        return EXIT_INTERRUPTED
+    except MergeError as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return EXIT_FAILED
+    except Exception as e:
+        error_message = f"Произошла ошибка при объединении файлов: {str(e)}"
+        logging.error(error_message, exc_info=True)
+        print(f"Ошибка: {error_message}\nПодробности в журнале: {log_file}", file=sys.stderr)
+        return EXIT_FAILED
+
+    if not args.quiet:
+        print(f"Результат сохранён: {job['output_file']} (строк: {len(merged_df)})", file=sys.stderr)
+    if args.profile:
+        print(profile.summary_text(), file=sys.stderr)
+        print(f"Замеры: {profile.path}", file=sys.stderr)
+    return EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
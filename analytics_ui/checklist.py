@@ -0,0 +1,112 @@
+import tkinter as tk
+from tkinter import ttk
+
+# Отметки выбора в строках списка
+CHECKED_MARK = "☑"
+UNCHECKED_MARK = "☐"
+
+
+class CheckList(ttk.Frame):
+    """
+    Список с отметками выбора и строкой поиска.
+
+    Строки - элементы ttk.Treeview, а не отдельные виджеты с переменными: Treeview рисует только
+    видимые строки, поэтому обновление и прокрутка списка из тысяч параметров не замедляются.
+    Выбор хранится в множестве selected (ключи элементов). Строка поиска оставляет в списке
+    только элементы, в тексте которых есть введённая подстрока (без учёта регистра);
+    выбор скрытых фильтром элементов не меняется.
+    """
+
+    def __init__(self, parent, height=10):
+        super().__init__(parent)
+        self.items = {}  # {ключ: текст строки} в порядке показа
+        self.selected = set()
+        self._visible = []  # ключи показанных строк; iid строки - индекс в этом списке
+
+        search_frame = ttk.Frame(self)
+        search_frame.pack(fill=tk.X, padx=5, pady=(5, 2))
+        ttk.Label(search_frame, text="Поиск:").pack(side=tk.LEFT)
+        self.search = tk.StringVar()
+        self.search.trace_add("write", lambda *args: self.refresh())
+        ttk.Entry(search_frame, textvariable=self.search).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        self.count_label = ttk.Label(search_frame, text="", font=("Arial", 8))
+        self.count_label.pack(side=tk.RIGHT)
+
+        self.tree = ttk.Treeview(self, show="tree", selectmode="browse", height=height)
+        scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+
+        # Отметка переключается щелчком по строке или пробелом
+        self.tree.bind("<Button-1>", self._on_click)
+        self.tree.bind("<space>", self._on_space)
+
+    def set_items(self, items):
+        """
+        Заменяет элементы списка; items - пары (ключ, текст).
+        Новые элементы выбраны, у прежних выбор сохраняется.
+        """
+        items = dict(items)
+        self.selected = {key for key in items if key in self.selected or key not in self.items}
+        self.items = items
+        self.refresh()
+
+    def keys(self):
+        """Ключи всех элементов (без учёта поиска)"""
+        return list(self.items)
+
+    def selected_keys(self):
+        """Ключи выбранных элементов в порядке списка (без учёта поиска)"""
+        return [key for key in self.items if key in self.selected]
+
+    def select_all(self):
+        """Выбирает показанные элементы (при пустой строке поиска - все)"""
+        self.selected.update(self._visible)
+        self.refresh()
+
+    def deselect_all(self):
+        """Снимает выбор с показанных элементов (при пустой строке поиска - со всех)"""
+        self.selected.difference_update(self._visible)
+        self.refresh()
+
+    def refresh(self):
+        """Перестраивает показанные строки по строке поиска"""
+        pattern = self.search.get().strip().casefold()
+        self._visible = [key for key, text in self.items.items() if pattern in text.casefold()]
+
+        self.tree.delete(*self.tree.get_children())
+        for index, key in enumerate(self._visible):
+            self.tree.insert("", "end", iid=str(index), text=self._row_text(key))
+        self._update_count()
+
+    def _row_text(self, key):
+        mark = CHECKED_MARK if key in self.selected else UNCHECKED_MARK
+        return f"{mark} {self.items[key]}"
+
+    def _update_count(self):
+        text = f"выбрано {len(self.selected)} из {len(self.items)}"
+        if len(self._visible) != len(self.items):
+            text += f", показано {len(self._visible)}"
+        self.count_label.configure(text=text)
+
+    def toggle(self, iid):
+        """Переключает выбор элемента показанной строки iid"""
+        key = self._visible[int(iid)]
+        if key in self.selected:
+            self.selected.discard(key)
+        else:
+            self.selected.add(key)
+        self.tree.item(iid, text=self._row_text(key))
+        self._update_count()
+
+    def _on_click(self, event):
+        iid = self.tree.identify_row(event.y)
+        if iid:
+            self.toggle(iid)
+
+    def _on_space(self, event):
+        iid = self.tree.focus()
+        if iid:
+            self.toggle(iid)
+        return "break"
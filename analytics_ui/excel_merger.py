@@ -2,322 +2,46 @@ import tkinter as tk
 from tkinter import filedialog, ttk, messagebox
 import pandas as pd
 import os
-import sys
-import numpy as np
 import logging
-import unicodedata
-
-
-def resource_path(relative_path):
-    """Получает абсолютный путь к ресурсу, работает для dev, PyInstaller и pip install"""
-    try:
-        # PyInstaller создает временную папку и хранит путь в _MEIPASS
-        base_path = sys._MEIPASS
-    except Exception:
-        # Normal python script or installed package
-        base_path = os.path.dirname(os.path.abspath(__file__))
-
-    path = os.path.join(base_path, relative_path)
-    return path
-
-
-def get_column_letter(col_idx):
-    """Преобразует числовой индекс столбца в буквенное обозначение Excel"""
-    result = ""
-    while col_idx > 0:
-        col_idx, remainder = divmod(col_idx - 1, 26)
-        result = chr(65 + remainder) + result
-    return result
-
-
-def format_data_workbook(writer, sheet_name, df, rules_df):
-    """
-    Форматирует лист с данными используя xlsxwriter (в один проход).
-    Добавляет заголовки, объединяет ячейки параметров, настраивает ширину и цвета.
-    """
-    try:
-        workbook = writer.book
-        worksheet = writer.sheets[sheet_name]
-
-        # Стили
-        header_format = workbook.add_format({
-            'bold': True,
-            'text_wrap': True,
-            'valign': 'vcenter',
-            'align': 'center',
-            'border': 1,
-            'bg_color': '#D9D9D9'
-        })
-
-        center_format = workbook.add_format({
-            'align': 'center',
-            'valign': 'vcenter'
-        })
-
-        # Убрать сетку
-        worksheet.hide_gridlines(2)
-
-        # 1. Подготовка данных для заголовков
-        # Создаем маппинг
-        column_to_node = {}
-        param_ranges = {}
-
-        for _, row in rules_df.iterrows():
-            if len(row) >= 4:
-                new_name = str(row.iloc[2]).strip()
-                node_name = str(row.iloc[3]).strip()
-                if new_name and node_name:
-                    column_to_node[new_name] = node_name
-
-                # Попытка получить диапазоны
-                if len(row) >= 7 and new_name:
-                    try:
-                        min_val = row.iloc[5]
-                        max_val = row.iloc[6]
-                        units = str(row.iloc[7]).strip() if len(row) >= 8 and pd.notna(row.iloc[7]) else ""
-
-                        if not units:
-                            param_name = str(row.iloc[4]).strip() if len(row) >= 5 else ""
-                            check_name = param_name.lower() if param_name else new_name.lower()
-                            if "перепад давления" in check_name:
-                                units = "кгс/см2"
-                            elif "расход" in check_name:
-                                units = "тыс. м3/ч"
-                            elif "температура" in check_name:
-                                units = "°C"
-
-                        if pd.notna(min_val) and pd.notna(max_val):
-                            range_str = f"({min_val} ... {max_val} {units})".strip()
-                            param_ranges[new_name] = range_str
-                    except (ValueError, TypeError, IndexError) as e:
-                        logging.warning(f"Не удалось получить диапазон для '{new_name}': {e}")
-
-        # 2. Запись заголовков (Строки 1, 2, 3 в Excel -> 0, 1, 2 индексы)
-        headers = df.columns.tolist()
-
-        # Замораживаем панели
-        worksheet.freeze_panes(3, 1)  # 3 строки заголовка, 1 столбец слева
-
-        # Заголовок Время (объединяем 3 строки)
-        worksheet.merge_range(0, 0, 2, 0, "Время", header_format)
-
-        # Группировка для объединения
-        current_node = None
-        current_range = None
-        merge_start_col = 1  # Данные начинаются со 2-го столбца (индекс 1)
-
-        for i in range(1, len(headers)):
-            header = headers[i]
-            base_header = header.split(' ⚠')[0] if ' ⚠' in header else header
-            node = column_to_node.get(base_header, "")
-            param_range_str = param_ranges.get(base_header, "")
-
-            # Запись заголовка столбца (Строка 2)
-            worksheet.write(2, i, header, header_format)
-
-            if i == 1:
-                current_node = node
-                current_range = param_range_str
-                merge_start_col = 1
-            else:
-                # Если узел или диапазон изменились, завершаем предыдущую группу
-                if node != current_node or param_range_str != current_range:
-                    # Объединяем предыдущую группу в Строке 0 (Узел)
-                    if current_node:
-                        if i - 1 > merge_start_col:
-                            worksheet.merge_range(0, merge_start_col, 0, i - 1, current_node, header_format)
-                        else:
-                            worksheet.write(0, merge_start_col, current_node, header_format)
-
-                    # Объединяем предыдущую группу в Строке 1 (Диапазон)
-                    if current_range:
-                        if i - 1 > merge_start_col:
-                            worksheet.merge_range(1, merge_start_col, 1, i - 1, current_range, header_format)
-                        else:
-                            worksheet.write(1, merge_start_col, current_range, header_format)
-
-                    # Начинаем новую группу
-                    current_node = node
-                    current_range = param_range_str
-                    merge_start_col = i
-
-        # Записываем последнюю группу
-        if len(headers) > 1:
-            last_col = len(headers) - 1
-            if current_node:
-                if last_col > merge_start_col:
-                    worksheet.merge_range(0, merge_start_col, 0, last_col, current_node, header_format)
-                else:
-                    worksheet.write(0, merge_start_col, current_node, header_format)
-
-            if current_range:
-                if last_col > merge_start_col:
-                    worksheet.merge_range(1, merge_start_col, 1, last_col, current_range, header_format)
-                else:
-                    worksheet.write(1, merge_start_col, current_range, header_format)
-
-        # 3. Настройка ширины столбцов и границ
-        # Границы групп узлов
-        current_node_border = None
-
-        thick_border_fmt = workbook.add_format({'left': 2})  # Thick left border
-
-        for i, header in enumerate(headers):
-            base_header = header.split(' ⚠')[0] if ' ⚠' in header else header
-            node = column_to_node.get(base_header)
-
-            # Ширина столбца
-            max_len = len(str(header))
-            # Примерная ширина по данным (первые 50 строк)
-            for val in df.iloc[:50, i].astype(str):
-                max_len = max(max_len, len(val))
-            worksheet.set_column(i, i, min(max_len + 2, 50), center_format)
-
-            # Условное форматирование для данных
-            if header != 'Время' and not header.endswith('⚠'):
-                # Ищем min/max для этого столбца для расцветки
-                col_rules = rules_df[rules_df.iloc[:, 2] == base_header]
-                qmin = None
-                qmax = None
-                if not col_rules.empty:
-                    try:
-                        qmin_val = col_rules.iloc[0, 5]
-                        qmax_val = col_rules.iloc[0, 6]
-                        if pd.notna(qmin_val):
-                            qmin = float(qmin_val)
-                        if pd.notna(qmax_val):
-                            qmax = float(qmax_val)
-                    except (ValueError, TypeError, IndexError) as e:
-                        logging.warning(f"Не удалось получить qmin/qmax для '{base_header}': {e}")
-
-                # Если диапазон задан, применяем сложную логику
-                if qmin is not None and qmax is not None:
-                    # 1. Равен 0 -> нет цвета (белый)
-                    worksheet.conditional_format(3, i, len(df) + 2, i, {
-                        'type': 'cell',
-                        'criteria': '==',
-                        'value': 0,
-                        'format': workbook.add_format({'bg_color': '#FFFFFF', 'align': 'center', 'valign': 'vcenter'})
-                    })
-
-                    # 2. Меньше qmin (и не 0) -> Красный
-                    # Используем формулу для исключения 0
-                    col_letter = get_column_letter(i + 1)
-                    worksheet.conditional_format(3, i, len(df) + 2, i, {
-                        'type': 'formula',
-                        'criteria': f'=AND({col_letter}4<{qmin}, {col_letter}4<>0)',
-                        'format': workbook.add_format({'bg_color': '#FFC7CE', 'font_color': '#9C0006', 'align': 'center', 'valign': 'vcenter'})
-                    })
-
-                    # 3. Больше qmax -> Красный
-                    worksheet.conditional_format(3, i, len(df) + 2, i, {
-                        'type': 'cell',
-                        'criteria': '>',
-                        'value': qmax,
-                        'format': workbook.add_format({'bg_color': '#FFC7CE', 'font_color': '#9C0006', 'align': 'center', 'valign': 'vcenter'})
-                    })
-
-                    # 4. В диапазоне [qmin, qmax] -> Градиент Желтый-Зеленый
-                    worksheet.conditional_format(3, i, len(df) + 2, i, {
-                        'type': '2_color_scale',
-                        'min_color': '#FFFF00',  # Yellow
-                        'max_color': '#92D050',  # Green
-                        'min_type': 'num',
-                        'min_value': qmin,
-                        'max_type': 'num',
-                        'max_value': qmax
-                    })
-                else:
-                    # Fallback к обычному градиенту, но исключая нули
-                    worksheet.conditional_format(3, i, len(df) + 2, i, {
-                        'type': 'cell',
-                        'criteria': '==',
-                        'value': 0,
-                        'format': workbook.add_format({'bg_color': '#FFFFFF', 'align': 'center', 'valign': 'vcenter'})
-                    })
-
-                    worksheet.conditional_format(3, i, len(df) + 2, i, {
-                        'type': '3_color_scale',
-                        'min_color': '#FF0000',  # Red
-                        'mid_color': '#FFFF00',  # Yellow
-                        'max_color': '#92D050'   # Green
-                    })
-
-            # Границы узлов (визуально отделяем группы)
-            if node:
-                if node != current_node_border:
-                    if i > 0:  # Не для первого столбца
-                        worksheet.conditional_format(0, i, len(df) + 2, i, {
-                            'type': 'formula',
-                            'criteria': '=TRUE',
-                            'format': thick_border_fmt
-                        })
-                    current_node_border = node
-
-    except Exception as e:
-        logging.error(f"Ошибка при форматировании данных: {e}", exc_info=True)
-
-
-def add_arrow_columns(df, rules_df):
-    """Добавляет столбцы со стрелками для значений вне диапазона min-max"""
-    df = df.copy()
-    try:
-        # Создаем словари для хранения min/max значений параметров и соответствия узлов измерения
-        param_limits = {}
-        param_to_node = {}  # Словарь для хранения соответствия параметр -> узел измерения
-
-        # Заполняем словари из файла правил
-        for _, row in rules_df.iterrows():
-            if len(row) >= 7:  # Проверяем наличие столбцов min и max
-                new_name = str(row.iloc[2]).strip()
-                node_name = str(row.iloc[3]).strip()  # Название узла измерения
-                min_val = row.iloc[5]  # min в 6-м столбце
-                max_val = row.iloc[6]  # max в 7-м столбце
-
-                # Сохраняем соответствие параметра и узла измерения
-                if new_name and node_name:
-                    param_to_node[new_name] = node_name
-
-                # Проверяем, что значения min и max заданы
-                if pd.notna(min_val) and pd.notna(max_val) and new_name:
-                    try:
-                        min_val = float(min_val)
-                        max_val = float(max_val)
-                        param_limits[new_name] = {'min': min_val, 'max': max_val}
-                    except (ValueError, TypeError):
-                        logging.warning(f"Пропущены некорректные значения min/max для {new_name}")
-                        continue
-
-        # Снимок исходных столбцов до добавления стрелочных столбцов
-        original_cols = list(df.columns)
-        arrow_map = {}  # {data_col: arrow_col_name}
-
-        # Создаем все столбцы со стрелками
-        for col in original_cols:
-            if col in param_limits:
-                limits = param_limits[col]
-                arrow_col_name = f"{col} ⚠"
-
-                df[arrow_col_name] = ''
-                numeric_values = pd.to_numeric(df[col], errors='coerce')
-                df.loc[(numeric_values < limits['min']) & (numeric_values != 0), arrow_col_name] = '↓'
-                df.loc[(numeric_values > limits['max']) & (numeric_values != 0), arrow_col_name] = '↑'
-                arrow_map[col] = arrow_col_name
-
-        # Применяем одно переупорядочивание вместо N итераций
-        if arrow_map:
-            new_order = []
-            for col in original_cols:
-                new_order.append(col)
-                if col in arrow_map:
-                    new_order.append(arrow_map[col])
-            df = df[new_order]
-
-        return df, param_to_node
-
-    except Exception as e:
-        logging.error(f"Ошибка при добавлении столбцов со стрелками: {e}", exc_info=True)
-        return df, {}
+import queue
+import threading
+
+from analytics_ui.rules import compile_rules
+from analytics_ui.checklist import CheckList
+from analytics_ui.file_cache import ColumnInventory, DataFrameCache, DiskCache
+from analytics_ui.align import ALIGN_EXACT, ALIGN_NEAREST, ALIGN_FFILL, parse_tolerance
+from analytics_ui.readers import (
+    READER_AUTO, READER_CALAMINE, READER_OPENPYXL, FileProbe, MergeCancelled, available_readers,
+    default_read_workers, load_excel, probe_excel, remove_empty_columns
+)
+from analytics_ui.report import COLOR_MODE_CONDITIONAL, COLOR_MODE_STATIC
+from analytics_ui.export import EXPORT_XLSX, export_filetypes, export_format
+from analytics_ui.profiling import MergeProfile
+# Функции отчёта остаются доступными и из этого модуля
+from analytics_ui.report import (  # noqa: F401
+    get_column_letter, format_data_workbook, add_arrow_columns, create_dashboard_sheet
+)
+from analytics_ui.pipeline import (
+    RULES_FILE_NAME, MergeError, resource_path, setup_logging, load_rules, measurement_nodes,
+    check_selection, build_merge_job, run_merge
+)
+
+# Период опроса очереди прогресса фонового объединения (мс)
+PROGRESS_POLL_MS = 100
+
+# Движки чтения Excel в выпадающем списке (показываются только установленные)
+READER_CHOICES = {
+    "Авто (самый быстрый)": READER_AUTO,
+    "calamine": READER_CALAMINE,
+    "openpyxl / xlrd": READER_OPENPYXL,
+}
+
+# Способы сопоставления строк файлов по времени в выпадающем списке
+ALIGN_CHOICES = {
+    "Точное совпадение": ALIGN_EXACT,
+    "Ближайшее время": ALIGN_NEAREST,
+    "Последнее известное": ALIGN_FFILL,
+}
 
 
 class ExcelMerger:
@@ -328,30 +52,33 @@ class ExcelMerger:
 
         # Список для хранения путей к файлам
         self.files = []
-
-        # Словари для хранения чекбоксов
-        self.parameter_vars = {}
-        self.node_vars = {}  # Новый словарь для чекбоксов узлов измерения
+        # Сведения о файлах без полного чтения (FileProbe): столбцы, число строк, период
+        self.file_probes = {}
 
         # Кэш файла правил
-        self.rules_file = resource_path("Правила названия столбцов.xlsx")
+        self.rules_file = resource_path(RULES_FILE_NAME)
         self.rules_df = pd.DataFrame()
         self._reload_rules()
 
+        # Кэш подготовленных файлов в сессии: повторное объединение с тем же выбором не читает файлы
+        self.file_cache = DataFrameCache()
+        # Постоянный кэш прочитанных файлов на диске (в том числе между сессиями)
+        self.disk_cache = DiskCache()
+        # Сведения о столбцах файлов между сессиями (повторно добавленный файл не открывается)
+        self.column_inventory = ColumnInventory()
+
+        # Фоновое объединение: поток, очередь прогресса и флаг отмены
+        self.merge_thread = None
+        self.progress_queue = queue.Queue()
+        self.cancel_event = threading.Event()
+
         # Создание элементов интерфейса
         self.create_widgets()
 
     def _reload_rules(self):
-        """Загружает (перезагружает) файл правил в кэш self.rules_df"""
-        try:
-            if os.path.exists(self.rules_file):
-                self.rules_df = pd.read_excel(self.rules_file, engine='openpyxl')
-            else:
-                logging.warning(f"Файл правил не найден: {self.rules_file}")
-                self.rules_df = pd.DataFrame()
-        except Exception as e:
-            logging.error(f"Не удалось загрузить файл правил: {e}", exc_info=True)
-            self.rules_df = pd.DataFrame()
+        """Загружает (перезагружает) файл правил в кэш self.rules_df и компилирует индекс self.rules"""
+        self.rules_df = load_rules(self.rules_file)
+        self.rules = compile_rules(self.rules_df)
 
     def create_widgets(self):
         # Создаем фрейм для левой части (файлы)
@@ -377,6 +104,10 @@ class ExcelMerger:
         remove_button = ttk.Button(left_frame, text="Удалить выбранный", command=self.remove_file)
         remove_button.pack(pady=5)
 
+        # Кнопка очистки кэша прочитанных файлов
+        clear_cache_button = ttk.Button(left_frame, text="Очистить кэш", command=self.clear_cache)
+        clear_cache_button.pack(pady=5)
+
         # Фрейм для временного интервала
         time_frame = ttk.LabelFrame(left_frame, text="Временной интервал")
         time_frame.pack(fill=tk.X, padx=5, pady=5)
@@ -410,9 +141,68 @@ class ExcelMerger:
         clear_dates_button = ttk.Button(time_frame, text="Очистить даты", command=self.clear_dates)
         clear_dates_button.pack(pady=5)
 
+        # Сопоставление строк файлов по времени и допуск (для ближайшего/последнего известного)
+        align_frame = ttk.Frame(time_frame)
+        align_frame.pack(fill=tk.X, padx=5, pady=2)
+        ttk.Label(align_frame, text="Сопоставление:").pack(side=tk.LEFT)
+        self.align_mode = tk.StringVar(value=next(iter(ALIGN_CHOICES)))
+        ttk.Combobox(align_frame, textvariable=self.align_mode, values=list(ALIGN_CHOICES),
+                     state="readonly", width=20).pack(side=tk.LEFT, padx=5)
+
+        tolerance_frame = ttk.Frame(time_frame)
+        tolerance_frame.pack(fill=tk.X, padx=5, pady=2)
+        ttk.Label(tolerance_frame, text="Допуск, мин:").pack(side=tk.LEFT)
+        self.align_tolerance = ttk.Entry(tolerance_frame, width=8)
+        self.align_tolerance.pack(side=tk.LEFT, padx=5)
+
+        # Раскраска листа Данные без условного форматирования (для больших отчётов)
+        self.static_colors = tk.BooleanVar(value=False)
+        ttk.Checkbutton(left_frame, text="Статическая раскраска ячеек", variable=self.static_colors).pack(
+            anchor="w", padx=5, pady=2)
+
+        # Дополнение предыдущего результата: читаются только строки новее него
+        self.append_mode = tk.BooleanVar(value=False)
+        ttk.Checkbutton(left_frame, text="Дополнить предыдущий результат", variable=self.append_mode).pack(
+            anchor="w", padx=5, pady=2)
+
+        # Запись отчёта построчно (constant_memory): память не растет с числом строк
+        self.streaming_write = tk.BooleanVar(value=False)
+        ttk.Checkbutton(left_frame, text="Экономить память при записи", variable=self.streaming_write).pack(
+            anchor="w", padx=5, pady=2)
+
+        # Пик памяти Python-объектов по этапам в замерах (tracemalloc замедляет объединение)
+        self.trace_memory = tk.BooleanVar(value=False)
+        ttk.Checkbutton(left_frame, text="Замерять память Python-объектов (медленнее)",
+                        variable=self.trace_memory).pack(anchor="w", padx=5, pady=2)
+
+        # Число процессов для параллельного чтения файлов
+        workers_frame = ttk.Frame(left_frame)
+        workers_frame.pack(fill=tk.X, padx=5, pady=2)
+        ttk.Label(workers_frame, text="Процессов чтения:").pack(side=tk.LEFT)
+        self.read_workers = tk.IntVar(value=default_read_workers())
+        ttk.Spinbox(workers_frame, from_=1, to=32, width=4, textvariable=self.read_workers).pack(side=tk.LEFT, padx=5)
+
+        # Движок чтения Excel (результат от него не зависит, только скорость)
+        reader_frame = ttk.Frame(left_frame)
+        reader_frame.pack(fill=tk.X, padx=5, pady=2)
+        ttk.Label(reader_frame, text="Чтение файлов:").pack(side=tk.LEFT)
+        readers = [label for label, reader in READER_CHOICES.items()
+                   if reader == READER_AUTO or reader in available_readers()]
+        self.reader = tk.StringVar(value=readers[0])
+        ttk.Combobox(reader_frame, textvariable=self.reader, values=readers,
+                     state="readonly", width=20).pack(side=tk.LEFT, padx=5)
+
         # Кнопка объединения
-        merge_button = ttk.Button(left_frame, text="Объединить файлы", command=self.merge_files)
-        merge_button.pack(pady=10)
+        self.merge_button = ttk.Button(left_frame, text="Объединить файлы", command=self.merge_files)
+        self.merge_button.pack(pady=10)
+
+        # Прогресс фонового объединения и кнопка отмены
+        self.progress_bar = ttk.Progressbar(left_frame, orient="horizontal", mode="determinate", maximum=100)
+        self.progress_bar.pack(fill=tk.X, padx=5, pady=2)
+        self.progress_label = ttk.Label(left_frame, text="", font=("Arial", 8))
+        self.progress_label.pack(pady=2)
+        self.cancel_button = ttk.Button(left_frame, text="Отмена", command=self.cancel_merge, state=tk.DISABLED)
+        self.cancel_button.pack(pady=5)
 
         # Создаем центральный фрейм для параметров
         center_frame = ttk.Frame(self.root)
@@ -422,22 +212,9 @@ class ExcelMerger:
         self.parameters_frame = ttk.LabelFrame(center_frame, text="Выбор параметров")
         self.parameters_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
 
-        # Создаем канвас и скроллбар для прокрутки параметров
-        canvas = tk.Canvas(self.parameters_frame)
-        scrollbar = ttk.Scrollbar(self.parameters_frame, orient="vertical", command=canvas.yview)
-        self.scrollable_frame = ttk.Frame(canvas)
-
-        self.scrollable_frame.bind(
-            "<Configure>",
-            lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
-        )
-
-        canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw")
-        canvas.configure(yscrollcommand=scrollbar.set)
-
-        # Размещаем элементы
-        canvas.pack(side="left", fill="both", expand=True)
-        scrollbar.pack(side="right", fill="y")
+        # Список параметров с отметками и поиском (выбранные - parameter_list.selected)
+        self.parameter_list = CheckList(self.parameters_frame)
+        self.parameter_list.pack(fill=tk.BOTH, expand=True)
 
         # Кнопки выбора параметров
         select_frame = ttk.Frame(center_frame)
@@ -454,22 +231,9 @@ class ExcelMerger:
         self.nodes_frame = ttk.LabelFrame(right_frame, text="Загруженные узлы измерения")
         self.nodes_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
 
-        # Создаем канвас и скроллбар для прокрутки узлов
-        nodes_canvas = tk.Canvas(self.nodes_frame)
-        nodes_scrollbar = ttk.Scrollbar(self.nodes_frame, orient="vertical", command=nodes_canvas.yview)
-        self.nodes_scrollable_frame = ttk.Frame(nodes_canvas)
-
-        self.nodes_scrollable_frame.bind(
-            "<Configure>",
-            lambda e: nodes_canvas.configure(scrollregion=nodes_canvas.bbox("all"))
-        )
-
-        nodes_canvas.create_window((0, 0), window=self.nodes_scrollable_frame, anchor="nw")
-        nodes_canvas.configure(yscrollcommand=nodes_scrollbar.set)
-
-        # Размещаем элементы
-        nodes_canvas.pack(side="left", fill="both", expand=True)
-        nodes_scrollbar.pack(side="right", fill="y")
+        # Список узлов измерения с отметками и поиском (выбранные - node_list.selected)
+        self.node_list = CheckList(self.nodes_frame)
+        self.node_list.pack(fill=tk.BOTH, expand=True)
 
         # Кнопки выбора узлов
         nodes_select_frame = ttk.Frame(right_frame)
@@ -488,25 +252,24 @@ class ExcelMerger:
     def load_parameters(self):
         """Загружает параметры из файла правил"""
         try:
-            # Очищаем старые чекбоксы
-            for widget in self.scrollable_frame.winfo_children():
-                if isinstance(widget, ttk.Checkbutton):
-                    widget.destroy()
-            self.parameter_vars.clear()
-
             if self.rules_df.empty:
+                self.parameter_list.set_items([])
                 messagebox.showerror("Ошибка", "Файл с правилами названия столбцов не найден или пуст!")
                 return
 
-            # Получаем уникальные параметры из 5-го столбца
-            parameters = self.rules_df.iloc[:, 4].unique()
-            parameters = [str(p).strip() for p in parameters if pd.notna(p) and str(p).strip()]
-
-            # Создаем чекбоксы для каждого параметра
-            for param in parameters:
-                var = tk.BooleanVar(value=True)
-                self.parameter_vars[param] = var
-                ttk.Checkbutton(self.scrollable_frame, text=param, variable=var).pack(anchor="w", padx=5, pady=2)
+            # Каждый уникальный параметр из 5-го столбца - строка списка.
+            # Если файлы загружены - только параметры, столбцы которых в них есть (с числом столбцов).
+            # Выбор параметров, оставшихся в списке, сохраняется; новые параметры выбраны
+            counts = self.column_counts()
+            items = []
+            for param in self.rules.parameters:
+                text = param
+                if counts is not None:
+                    if not counts[0].get(param):
+                        continue
+                    text = f"{param} ({counts[0][param]})"
+                items.append((param, text))
+            self.parameter_list.set_items(items)
 
         except Exception as e:
             error_message = f"Ошибка при загрузке параметров: {str(e)}"
@@ -515,13 +278,11 @@ class ExcelMerger:
 
     def select_all_parameters(self):
         """Выбирает все параметры"""
-        for var in self.parameter_vars.values():
-            var.set(True)
+        self.parameter_list.select_all()
 
     def deselect_all_parameters(self):
         """Снимает выбор со всех параметров"""
-        for var in self.parameter_vars.values():
-            var.set(False)
+        self.parameter_list.deselect_all()
 
     def add_files(self):
         files = filedialog.askopenfilenames(
@@ -536,19 +297,25 @@ class ExcelMerger:
             self.files.append(file)
             self.files_listbox.insert(tk.END, os.path.basename(file))
 
-        # Обновляем списки и диапазон один раз для всех добавленных файлов
+        # Файлы не разбираются целиком: столбцы и период берутся из заголовка, первой и последней
+        # строки, полное чтение (только нужных столбцов) выполняется при объединении
+        for file in new_files:
+            time_range = self.probe_file(file).time_range()
+            if time_range is not None:
+                self.update_time_range(*time_range)
+
+        # Обновляем списки один раз для всех добавленных файлов
         self.update_measurement_nodes()
         self.load_parameters()
-        for file in new_files:
-            df = self.read_excel_file(file)
-            self.update_time_range(df)
 
     def remove_file(self):
         selection = self.files_listbox.curselection()
         if selection:
             index = selection[0]
-            self.files.pop(index)
+            removed_file = self.files.pop(index)
             self.files_listbox.delete(index)
+            self.file_probes.pop(removed_file, None)
+            self.file_cache.evict(removed_file)
             # Обновляем список узлов измерения при удалении файла
             self.update_measurement_nodes()
             # Обновляем список параметров
@@ -558,59 +325,32 @@ class ExcelMerger:
 
     def select_all_nodes(self):
         """Выбирает все узлы измерения"""
-        for var in self.node_vars.values():
-            var.set(True)
+        self.node_list.select_all()
 
     def deselect_all_nodes(self):
         """Снимает выбор со всех узлов измерения"""
-        for var in self.node_vars.values():
-            var.set(False)
+        self.node_list.deselect_all()
 
     def update_measurement_nodes(self):
         """Обновляет список узлов измерения на основе загруженных файлов"""
         try:
-            # Очищаем старые чекбоксы узлов
-            for widget in self.nodes_scrollable_frame.winfo_children():
-                if isinstance(widget, ttk.Checkbutton):
-                    widget.destroy()
-            self.node_vars.clear()
-
             if self.rules_df.empty:
+                self.node_list.set_items([])
                 messagebox.showerror("Ошибка", "Файл с правилами названия столбцов не найден или пуст!")
                 return
 
-            # Множество для хранения уникальных узлов измерения
-            measurement_nodes = set()
-
-            # Для каждого файла находим соответствующие узлы измерения
-            for file in self.files:
-                filename = unicodedata.normalize('NFC', os.path.basename(file).lower())
-                base_filename = unicodedata.normalize('NFC', os.path.splitext(filename)[0])
-                logging.info(f"Обработка файла: '{filename}'")
-
-                # Ищем соответствующие правила
-                for _, row in self.rules_df.iterrows():
-                    if len(row) >= 4:  # Проверяем наличие столбца с названием узла
-                        file_pattern = str(row.iloc[0]).strip().lower()
-                        file_pattern = unicodedata.normalize('NFC', file_pattern)
-                        node_name = str(row.iloc[3]).strip()  # Название узла в 4-м столбце
-
-                        # Проверяем, что значения не являются NaN и не пустые
-                        if (pd.notna(file_pattern) and pd.notna(node_name)
-                                and file_pattern and node_name
-                                and node_name.lower() != 'nan'):
-
-                            match = (file_pattern in filename or base_filename in file_pattern)
-                            if match:
-                                logging.info(f"Совпадение: '{base_filename}' -> узел '{node_name}'")
-                                measurement_nodes.add(node_name)
-
-            # Добавляем найденные узлы и создаем чекбоксы
-            for node in sorted(measurement_nodes):
-                if node and node.lower() != 'nan':
-                    var = tk.BooleanVar(value=True)  # По умолчанию все выбраны
-                    self.node_vars[node] = var
-                    ttk.Checkbutton(self.nodes_scrollable_frame, text=node, variable=var).pack(anchor="w", padx=5, pady=2)
+            # Узлы, найденные для загруженных файлов (новые узлы выбраны, у прежних выбор сохраняется).
+            # Узлы без столбцов параметров в файлах не показываются; рядом - число столбцов узла
+            counts = self.column_counts()
+            items = []
+            for node in measurement_nodes(self.rules, self.files):
+                text = node
+                if counts is not None:
+                    if not counts[1].get(node):
+                        continue
+                    text = f"{node} ({counts[1][node]})"
+                items.append((node, text))
+            self.node_list.set_items(items)
 
         except Exception as e:
             error_message = f"Ошибка при обновлении списка узлов измерения: {str(e)}"
@@ -619,57 +359,75 @@ class ExcelMerger:
 
     def remove_empty_columns(self, df):
         """Удаляет пустые столбцы из DataFrame"""
-        # Удаляем столбцы, где все значения NaN
-        empty_cols = df.columns[df.isna().all()].tolist()
-        if empty_cols:
-            df = df.drop(columns=empty_cols)
-        return df
+        return remove_empty_columns(df)
 
     def read_excel_file(self, file_path):
-        """Читает Excel файл с поддержкой обоих форматов .xls и .xlsx"""
-        if file_path.endswith('.xlsx'):
-            return pd.read_excel(file_path, engine='openpyxl')
-        else:  # для .xls файлов
-            return pd.read_excel(file_path, engine='xlrd')
-
-    def get_rename_rules(self, filename):
-        """Получает правила переименования для конкретного файла"""
+        """
+        Читает Excel файл с поддержкой обоих форматов .xls и .xlsx.
+        Полная копия файла сохраняется в дисковом кэше - из неё же читает и объединение.
+        """
+        return load_excel(file_path, self.disk_cache, reader=self.get_reader())
+
+    def probe_file(self, file_path):
+        """
+        Сведения о файле (FileProbe: заголовки, число строк, первое и последнее время) без полного
+        чтения: из сохранённых сведений о столбцах или probe_excel. Если быстрое чтение не удалось,
+        файл читается целиком, как раньше.
+        """
+        info = self.column_inventory.get(file_path)
+        if info is not None:
+            probe = FileProbe.from_dict(file_path, info)
+        else:
+            try:
+                probe = probe_excel(file_path, self.get_reader())
+            except Exception as e:
+                logging.warning(f"Не удалось быстро прочитать сведения о файле {file_path}, "
+                                f"файл читается целиком: {e}")
+                df = self.read_excel_file(file_path)
+                times = (None, None)
+                if 'Время' in df.columns and pd.api.types.is_datetime64_any_dtype(df['Время']):
+                    times = (df['Время'].min(), df['Время'].max())
+                probe = FileProbe(file_path, list(df.columns), len(df), *times)
+            self.column_inventory.put(file_path, probe.to_dict())
+
+        self.file_probes[file_path] = probe
+        logging.info(f"Файл {os.path.basename(file_path)}: столбцов {len(probe.columns)}, строк {probe.rows}, "
+                     f"период {probe.time_range()}")
+        return probe
+
+    def column_counts(self):
+        """
+        ({параметр: число столбцов}, {узел: число столбцов}) в загруженных файлах
+        или None, если файлы не загружены
+        """
+        if not self.files:
+            return None
+        return self.rules.column_counts({file: self.file_probes[file].columns for file in self.files
+                                         if file in self.file_probes})
+
+    def get_read_workers(self):
+        """Число процессов для чтения файлов (из поля ввода, при ошибке - значение по умолчанию)"""
         try:
-            if self.rules_df.empty:
-                messagebox.showerror("Ошибка", "Файл с правилами названия столбцов не найден или пуст!")
-                return {}
-
-            # Ищем правила для данного файла
-            rename_dict = {}
-            filename = unicodedata.normalize('NFC', os.path.basename(filename).lower())
-
-            # Получаем список выбранных параметров
-            selected_parameters = [param for param, var in self.parameter_vars.items() if var.get()]
-
-            # Перебираем все строки в файле правил
-            for _, row in self.rules_df.iterrows():
-                if len(row) >= 5:  # Проверяем наличие нужных столбцов
-                    file_pattern = str(row.iloc[0]).strip().lower()
-                    file_pattern = unicodedata.normalize('NFC', file_pattern)
-                    old_name = str(row.iloc[1]).strip()
-                    new_name = str(row.iloc[2]).strip()
-                    parameter = str(row.iloc[4]).strip()
-
-                    # Проверяем, что значения не являются NaN и не пустые
-                    if (pd.notna(file_pattern) and pd.notna(old_name) and pd.notna(new_name) and pd.notna(parameter)
-                            and file_pattern and old_name and new_name and parameter
-                            and (file_pattern in filename or os.path.splitext(filename)[0] in file_pattern)
-                            and parameter in selected_parameters):
-                        rename_dict[old_name] = new_name
-                        logging.info(f"Найдено правило для '{filename}': '{old_name}' -> '{new_name}' (Параметр: {parameter})")
-
-            return rename_dict
+            return max(1, int(self.read_workers.get()))
+        except (tk.TclError, ValueError):
+            return default_read_workers()
 
+    def get_reader(self):
+        """Движок чтения Excel, выбранный в списке"""
+        return READER_CHOICES.get(self.reader.get(), READER_AUTO)
+
+    def clear_cache(self):
+        """Очищает кэш прочитанных файлов (в памяти и на диске) и сведения о столбцах файлов"""
+        try:
+            self.file_cache.clear()
+            self.column_inventory.clear()
+            freed = self.disk_cache.clear()
+            logging.info(f"Кэш очищен, освобождено {freed} байт")
+            messagebox.showinfo("Кэш", f"Кэш очищен, освобождено {freed / (1024 * 1024):.1f} МБ")
         except Exception as e:
-            error_message = f"Ошибка при чтении правил переименования: {str(e)}"
+            error_message = f"Ошибка при очистке кэша: {str(e)}"
             logging.error(error_message, exc_info=True)
             messagebox.showerror("Ошибка", error_message)
-            return {}
 
     def open_range_editor(self):
         """Открывает окно для редактирования диапазонов значений"""
@@ -786,31 +544,25 @@ class ExcelMerger:
         except Exception as e:
             messagebox.showerror("Ошибка", f"Не удалось инициализировать редактор: {e}")
 
-    def update_time_range(self, df):
-        """Обновляет диапазон времени на основе данных"""
+    def update_time_range(self, start_time, end_time):
+        """Расширяет диапазон времени периодом файла и показывает его в полях дат"""
         try:
-            if 'Время' in df.columns:
-                time_col = df['Время']
-                if pd.api.types.is_datetime64_any_dtype(time_col):
-                    start_time = time_col.min()
-                    end_time = time_col.max()
-
-                    # Если временной диапазон уже существует, обновляем его
-                    if hasattr(self, 'time_range'):
-                        current_start, current_end = self.time_range
-                        start_time = min(start_time, current_start)
-                        end_time = max(end_time, current_end)
-
-                    self.time_range = (start_time, end_time)
-                    self.start_date.delete(0, tk.END)
-                    self.start_date.insert(0, start_time.strftime('%Y-%m-%d'))
-                    self.start_time.delete(0, tk.END)
-                    self.start_time.insert(0, start_time.strftime('%H:%M:%S'))
-
-                    self.end_date.delete(0, tk.END)
-                    self.end_date.insert(0, end_time.strftime('%Y-%m-%d'))
-                    self.end_time.delete(0, tk.END)
-                    self.end_time.insert(0, end_time.strftime('%H:%M:%S'))
+            # Если временной диапазон уже существует, обновляем его
+            if hasattr(self, 'time_range'):
+                current_start, current_end = self.time_range
+                start_time = min(start_time, current_start)
+                end_time = max(end_time, current_end)
+
+            self.time_range = (start_time, end_time)
+            self.start_date.delete(0, tk.END)
+            self.start_date.insert(0, start_time.strftime('%Y-%m-%d'))
+            self.start_time.delete(0, tk.END)
+            self.start_time.insert(0, start_time.strftime('%H:%M:%S'))
+
+            self.end_date.delete(0, tk.END)
+            self.end_date.insert(0, end_time.strftime('%Y-%m-%d'))
+            self.end_time.delete(0, tk.END)
+            self.end_time.insert(0, end_time.strftime('%H:%M:%S'))
 
         except Exception as e:
             logging.warning(f"Ошибка при обновлении диапазона времени: {e}")
@@ -837,21 +589,8 @@ class ExcelMerger:
         self.end_time.delete(0, tk.END)
 
     def merge_files(self):
-        if not self.files:
-            messagebox.showerror("Ошибка", "Пожалуйста, добавьте файлы для объединения")
-            return
-
-        # Проверяем, выбран ли хотя бы один параметр
-        if not any(var.get() for var in self.parameter_vars.values()):
-            messagebox.showerror("Ошибка", "Пожалуйста, выберите хотя бы один параметр для объединения")
-            return
-
-        # Проверяем, выбран ли хотя бы один узел измерения
-        if not self.node_vars:
-            messagebox.showerror("Ошибка", "Не найдены узлы измерения. Проверьте соответствие имён файлов правилам.")
-            return
-        if not any(var.get() for var in self.node_vars.values()):
-            messagebox.showerror("Ошибка", "Пожалуйста, выберите хотя бы один узел измерения")
+        if self.merge_thread is not None and self.merge_thread.is_alive():
+            messagebox.showwarning("Внимание", "Объединение уже выполняется")
             return
 
         try:
@@ -875,515 +614,176 @@ class ExcelMerger:
                     messagebox.showerror("Ошибка", f"Неверный формат конечной даты/времени: {str(e)}")
                     return
 
-            if start_datetime and end_datetime and start_datetime > end_datetime:
-                messagebox.showerror("Ошибка", "Начальная дата/время не может быть позже конечной")
+            try:
+                tolerance = parse_tolerance(self.align_tolerance.get())
+            except ValueError as e:
+                messagebox.showerror("Ошибка", f"Неверный допуск сопоставления по времени: {str(e)}")
                 return
 
-            if self.rules_df.empty:
-                messagebox.showerror("Ошибка", "Файл с правилами названия столбцов не найден или пуст!")
+            # Получаем списки выбранных параметров и узлов
+            selected_parameters = self.parameter_list.selected_keys()
+            selected_nodes = self.node_list.selected_keys()
+
+            try:
+                check_selection(self.files, self.rules, selected_parameters, self.node_list.keys(), selected_nodes,
+                                start_datetime, end_datetime)
+            except MergeError as e:
+                messagebox.showerror("Ошибка", str(e))
                 return
 
-            # Создаем словарь соответствия параметров и новых названий столбцов
-            param_to_columns = {}
-            # Создаем словарь соответствия узлов измерения и их столбцов
-            node_to_columns = {}
-
-            for _, row in self.rules_df.iterrows():
-                if len(row) >= 5:
-                    new_name = str(row.iloc[2]).strip()
-                    parameter = str(row.iloc[4]).strip()
-                    node_name = str(row.iloc[3]).strip()
-
-                    if pd.notna(new_name) and pd.notna(parameter) and pd.notna(node_name) and new_name and parameter and node_name:
-                        # Добавляем в словарь параметров
-                        if parameter not in param_to_columns:
-                            param_to_columns[parameter] = set()
-                        param_to_columns[parameter].add(new_name)
-
-                        # Добавляем в словарь узлов
-                        if node_name not in node_to_columns:
-                            node_to_columns[node_name] = set()
-                        node_to_columns[node_name].add(new_name)
-
-            # Получаем списки выбранных параметров и узлов
-            selected_parameters = [param for param, var in self.parameter_vars.items() if var.get()]
-            selected_nodes = [node for node, var in self.node_vars.items() if var.get()]
-
-            # Создаем множество допустимых названий столбцов
-            allowed_columns = set()
-            for param in selected_parameters:
-                if param in param_to_columns:
-                    allowed_columns.update(param_to_columns[param])
-
-            # Фильтруем столбцы по выбранным узлам
-            node_allowed_columns = set()
-            for node in selected_nodes:
-                if node in node_to_columns:
-                    node_allowed_columns.update(node_to_columns[node])
-
-            # Пересечение множеств для получения только тех столбцов, которые соответствуют и параметрам, и узлам
-            allowed_columns = allowed_columns.intersection(node_allowed_columns)
-
-            # Чтение всех файлов
-            dfs = []
-            time_column = None
-
-            for i, file in enumerate(self.files):
-                logging.info(f"Обработка файла: {file}")
-                df = self.read_excel_file(file)
-                logging.info(f"Столбцы в файле: {list(df.columns)}")
-
-                # Удаляем пустые столбцы из каждого файла
-                df = self.remove_empty_columns(df)
-
-                if i == 0:
-                    # В первом файле сохраняем временной столбец
-                    time_column = df.iloc[:, 0]  # Предполагаем, что первый столбец - время
-                    df = df.iloc[:, 1:]  # Берем все столбцы кроме временного
-                else:
-                    # В остальных файлах удаляем временной столбец, если он есть
-                    if 'Время' in df.columns:
-                        df = df.drop(columns=['Время'])
-                    elif pd.api.types.is_datetime64_any_dtype(df.iloc[:, 0]):
-                        # Если первый столбец похож на время (содержит даты или время), удаляем его
-                        df = df.iloc[:, 1:]
-                    else:
-                        logging.warning(
-                            f"Файл '{os.path.basename(file)}': не найден явный столбец времени для удаления"
-                        )
-
-                # Получаем правила переименования для текущего файла
-                rename_rules = self.get_rename_rules(file)
-                if rename_rules:
-                    logging.info(f"Применяем правила переименования для файла {os.path.basename(file)}:")
-                    for old_name, new_name in rename_rules.items():
-                        logging.info(f"  {old_name} -> {new_name}")
-                    # Переименовываем столбцы согласно правилам
-                    df = df.rename(columns=rename_rules)
-
-                # Оставляем только столбцы, соответствующие выбранным параметрам и узлам
-                columns_to_keep = [col for col in df.columns if col in allowed_columns]
-                df = df[columns_to_keep]
-
-                dfs.append(df)
-
-            # Объединение всех датафреймов по столбцам
-            merged_df = pd.concat(dfs, axis=1)
-
-            # Удаляем дублирующиеся столбцы (например, если один и тот же файл был добавлен дважды)
-            # Это критично для избежания ошибок get_loc во время обработки Excel
-            merged_df = merged_df.loc[:, ~merged_df.columns.duplicated()].copy()
-
-            logging.info(f"Столбцы после объединения: {list(merged_df.columns)}")
-
-            # Добавляем временной столбец в начало
-            merged_df.insert(0, 'Время', time_column)
-
-            # Фильтруем по временному интервалу, если он указан
-            if start_datetime is not None or end_datetime is not None:
-                if start_datetime is not None:
-                    merged_df = merged_df[merged_df['Время'] >= start_datetime]
-                if end_datetime is not None:
-                    merged_df = merged_df[merged_df['Время'] <= end_datetime]
-                logging.info(
-                    f"Применен фильтр по времени: "
-                    f"{start_datetime if start_datetime else 'начало'} - "
-                    f"{end_datetime if end_datetime else 'конец'}"
+            # Файл результата выбирается до запуска, чтобы вся обработка шла в фоне
+            # Предыдущий результат, к которому добавляются новые строки
+            append_to = None
+            if self.append_mode.get():
+                append_to = filedialog.askopenfilename(
+                    filetypes=[("Отчёт или данные", "*.xlsx *.parquet *.feather *.csv")],
+                    title="Выберите предыдущий результат для дополнения"
                 )
+                if not append_to:
+                    return
 
-            # Удаляем пустые столбцы из объединенного датафрейма
-            merged_df = self.remove_empty_columns(merged_df)
-
-            # Добавляем столбцы со стрелками перед сохранением
-            merged_df, param_to_node = add_arrow_columns(merged_df, self.rules_df)
-
-            # Сортируем по времени перед сохранением, чтобы спарклайны были корректными
-            if 'Время' in merged_df.columns:
-                merged_df.sort_values(by='Время', inplace=True)
-
-            # Сохранение результата
+            # Кроме отчёта .xlsx можно сохранить только данные (Parquet/Feather/CSV) - без оформления
             output_file = filedialog.asksaveasfilename(
                 defaultextension=".xlsx",
-                filetypes=[("Excel files", "*.xlsx")],
+                filetypes=export_filetypes(),
+                initialfile=os.path.basename(append_to) if append_to else "",
                 title="Сохранить объединенный файл"
             )
+            if not output_file:
+                return
 
-            if output_file:
-                try:
-                    logging.info(f"Начинаем сохранение результата в файл: {output_file}")
-
-                    # Сбрасываем индекс, чтобы он соответствовал номерам строк в Excel (начиная с 0 -> Row 2)
-                    # Это критично для правильной адресации спарклайнов
-                    merged_df.reset_index(drop=True, inplace=True)
-
-                    # Преобразуем числовые данные (заменяем запятые на точки и конвертируем в float)
-                    # Это необходимо для правильной работы спарклайнов и графиков
-                    logging.info("Преобразование данных в числа...")
-                    for col in merged_df.columns:
-                        if col != 'Время' and not col.endswith('⚠'):
-                            try:
-                                # Если столбец типа object (строки), пробуем конвертировать
-                                if merged_df[col].dtype == 'object':
-                                    merged_df[col] = merged_df[col].astype(str).str.replace(',', '.', regex=False)
-                                    merged_df[col] = pd.to_numeric(merged_df[col], errors='coerce')
-                            except Exception as conv_err:
-                                logging.warning(f"Не удалось конвертировать столбец {col}: {conv_err}")
-
-                    # Используем xlsxwriter для поддержки спарклайнов
-                    with pd.ExcelWriter(output_file, engine='xlsxwriter', datetime_format='yyyy-mm-dd hh:mm:ss') as writer:
-                        # Сохраняем основные данные, начиная с 4 строки (индекс 3), чтобы оставить место для заголовков
-                        merged_df.to_excel(writer, sheet_name='Данные', index=False, startrow=3, header=False)
-
-                        # Форматируем лист Данные
-                        logging.info("Форматируем лист Данные...")
-                        format_data_workbook(writer, 'Данные', merged_df, self.rules_df)
-
-                        # Создаем лист Dashboard
-                        logging.info("Создаем лист Dashboard...")
-                        create_dashboard_sheet(writer, merged_df, self.rules_df, node_allowed_columns)
-
-                    logging.info("Данные и Dashboard успешно сохранены")
-                    messagebox.showinfo("Успех", "Файлы успешно объединены, создан Dashboard!")
-
-                except Exception as save_error:
-                    error_message = f"Ошибка при сохранении файла: {str(save_error)}"
-                    logging.error(error_message, exc_info=True)
-                    messagebox.showerror("Ошибка", error_message)
+            job = build_merge_job(self.files, self.rules, selected_parameters, selected_nodes,
+                                  start_datetime, end_datetime, output_file, self.get_read_workers(),
+                                  ALIGN_CHOICES.get(self.align_mode.get(), ALIGN_EXACT), tolerance,
+                                  COLOR_MODE_STATIC if self.static_colors.get() else COLOR_MODE_CONDITIONAL,
+                                  self.streaming_write.get(), append_to, self.get_reader())
 
         except Exception as e:
             error_message = f"Произошла ошибка при объединении файлов: {str(e)}"
             logging.error(error_message, exc_info=True)
             messagebox.showerror("Ошибка", error_message)
-
-
-def create_dashboard_sheet(writer, df, rules_df, allowed_columns):
-    """
-    Создает лист Dashboard с Timeline Heatmap и Sparklines.
-    """
-    try:
-        workbook = writer.book
-        worksheet = workbook.add_worksheet('Dashboard')
-
-        # Базовые шрифты
-        font_name = 'Arial'
-
-        # Стили
-        header_format = workbook.add_format({
-            'bold': True,
-            'text_wrap': True,
-            'valign': 'vcenter',
-            'align': 'center',
-            'border': 1,
-            'bg_color': '#D9D9D9',
-            'font_name': font_name,
-            'font_size': 10
-        })
-
-        node_format = workbook.add_format({
-            'bold': True,
-            'valign': 'vcenter',
-            'align': 'center',
-            'border': 1,
-            'font_name': font_name,
-            'font_size': 10
-        })
-
-        # Для пустой ячейки (A2)
-        empty_corner_format = workbook.add_format({
-            'border': 1,
-            'bg_color': '#FFFFFF'
-        })
-
-        # Для "Итого:" (правое выравнивание)
-        itogo_label_format = workbook.add_format({
-            'bold': True,
-            'valign': 'vcenter',
-            'align': 'right',
-            'border': 1,
-            'bg_color': '#FFFFFF',
-            'font_name': font_name,
-            'font_size': 14
-        })
-
-        # Цвета для статусов (с форматом чисел)
-        num_format = '# ##0.00'
-
-        green_format = workbook.add_format({'bg_color': '#C6EFCE', 'border': 1, 'num_format': num_format, 'valign': 'vcenter', 'align': 'center', 'bold': True, 'font_size': 10, 'font_name': font_name, 'font_color': '#000000'})
-        red_format = workbook.add_format({'bg_color': '#FFC7CE', 'border': 1, 'num_format': num_format, 'valign': 'vcenter', 'align': 'center', 'bold': True, 'font_size': 10, 'font_name': font_name, 'font_color': '#000000'})
-        grey_format = workbook.add_format({'bg_color': '#F2F2F2', 'border': 1, 'num_format': num_format, 'valign': 'vcenter', 'align': 'center', 'bold': True, 'font_size': 10, 'font_name': font_name, 'font_color': '#000000'})
-        yellow_format = workbook.add_format({'bg_color': '#FFF2CC', 'border': 1, 'num_format': num_format, 'valign': 'vcenter', 'align': 'center', 'bold': True, 'font_size': 10, 'font_name': font_name, 'font_color': '#000000'})
-
-        # 1. Подготовка данных
-        # Структура: {NodeName: {FlowCol: col_name, Qmin: val, Qmax: val, Units: str}}
-        node_config = {}
-
-        # Находим столбцы расхода
-        for col in df.columns:
-            if col not in allowed_columns:
-                continue
-
-            # Ищем правило для этого столбца (по NewName)
-            rule_row = rules_df[rules_df.iloc[:, 2] == col]
-            if not rule_row.empty:
-                param_name = str(rule_row.iloc[0, 4]).strip()
-                node_name = str(rule_row.iloc[0, 3]).strip()
-
-                # Простейшая эвристика для определения "расхода"
-                if "расход" in param_name.lower():
-                    qmin = rule_row.iloc[0, 5] if len(rule_row.columns) > 5 else None
-                    qmax = rule_row.iloc[0, 6] if len(rule_row.columns) > 6 else None
-                    units = str(rule_row.iloc[0, 7]).strip() if len(rule_row.columns) > 7 and pd.notna(rule_row.iloc[0, 7]) else ""
-
-                    if not units:
-                        units = "тыс. м3/ч"
-
-                    try:
-                        qmin = float(qmin) if pd.notna(qmin) else 0
-                        qmax = float(qmax) if pd.notna(qmax) else float('inf')
-                    except (ValueError, TypeError) as e:
-                        logging.warning(f"Некорректные qmin/qmax для '{col}': {e}")
-                        qmin, qmax = 0, float('inf')
-
-                    node_config[node_name] = {
-                        'col': col,
-                        'qmin': qmin,
-                        'qmax': qmax,
-                        'units': units,
-                        'col_idx': df.columns.get_loc(col)  # Индекс в dataframe (0-based)
-                    }
-
-        if not node_config:
-            worksheet.write(0, 0, "Не найдены параметры расхода для построения Dashboard")
-            return
-
-        # Группировка по датам (дни)
-        if 'Время' not in df.columns:
-            worksheet.write(0, 0, "Ошибка: нет столбца Время")
             return
 
-        df['Date'] = pd.to_datetime(df['Время']).dt.date
-        unique_dates = sorted(df['Date'].dropna().unique())
-        unique_nodes = sorted(node_config.keys())
-
-        num_days = len(unique_dates)
-
-        # 2. Заголовки
-        worksheet.write(0, 0, "Узел (позиция)", header_format)
-        worksheet.set_column(0, 0, 18)  # Ширина первого столбца
-
-        worksheet.write(0, 1, "Допустимый диапазон", header_format)
-        worksheet.set_column(1, 1, 35)  # Ширина второго столбца
-
-        # Новый столбец статистики с динамическим заголовком
-        worksheet.write(0, 2, f"Выход за диапазон\nза период {num_days} суток", header_format)
-        worksheet.set_column(2, 2, 22)
-
-        worksheet.freeze_panes(2, 3)  # Закрепить заголовки (2 строки) и первые три столбца
-
-        for j, date in enumerate(unique_dates):
-            worksheet.write(0, j + 3, date.strftime('%d.%m.%Y'), header_format)
-            worksheet.set_column(j + 3, j + 3, 22)  # Ширина столбцов с датами
-
-        # 3. Заполнение матрицы
-        # Словарь {date: [start_row, end_row]} (0-based indices in DF)
-        date_ranges = {}
-        # Предполагаем, что df отсортирован по времени
-        for date in unique_dates:
-            # Находим индексы строк для этой даты
-            mask = df['Date'] == date
-            indices = df.index[mask].tolist()
-            if indices:
-                start = indices[0]
-                end = indices[-1]
-                date_ranges[date] = (start, end)
-
-        # Словари для подсчета итогов
-        total_days_sum = 0
-        total_hours_sum = 0
-        daily_sums = {date: 0.0 for date in unique_dates}
-
-        # Оформление строки Итого (строка 1)
-        worksheet.write(1, 0, "", empty_corner_format)
-        worksheet.write(1, 1, "Итого:", itogo_label_format)
-
-        # Формат для итогов с единицами измерения (белый фон)
-        total_data_format = workbook.add_format({
-            'bold': True,
-            'align': 'center',
-            'valign': 'vcenter',
-            'bg_color': '#FFFFFF',  # Белый фон
-            'border': 1,
-            'font_name': font_name,
-            'font_size': 12,
-            'num_format': '# ##0" (тыс. м3)"'
-        })
-
-        for i, node in enumerate(unique_nodes):
-            row_idx = i + 2  # Смещаем на 2 (Заголовок + Итого)
-            worksheet.set_row(row_idx, 40)  # Увеличиваем высоту строки для наглядности графика
-
-            config = node_config[node]
-            qmin = config['qmin']
-            qmax = config['qmax']
-            units = config['units']
-
-            # Формируем раздельные подписи
-            qmin_str = f"{qmin:g}"
-            if qmax == float('inf'):
-                qmax_str = "∞"
-            else:
-                qmax_str = f"{qmax:g}"
-
-            range_label = f"({qmin_str} ... {qmax_str} {units})"
-
-            worksheet.write(row_idx, 0, node, node_format)
-            worksheet.write(row_idx, 1, range_label, node_format)
-
-            idx = config['col_idx']  # 0-based column index in Data sheet
-            col_letter = get_column_letter(idx + 1)  # Excel 1-based letter
-
-            # Переменные для статистики по узлу
-            total_violation_days = 0
-            total_violation_hours = 0
-
-            for j, date in enumerate(unique_dates):
-                col_idx = j + 3  # Смещаем на 3 столбца (Узел, Диапазон, Статистика)
-
-                if date in date_ranges:
-                    start_row, end_row = date_ranges[date]
-                    # Convert to Excel row numbers (1-based)
-                    # Sheet 'Данные': Row 1 is header. Data starts Row 2.
-                    # DF index 0 -> Excel Row 2.
-                    excel_start = start_row + 2
-                    excel_end = end_row + 2
-
-                    col_letter = get_column_letter(idx + 1)
-                    data_range = f"'Данные'!{col_letter}{excel_start}:{col_letter}{excel_end}"
-
-                    # Анализ данных для определения цвета фона (статус) и суммы
-                    values = df.iloc[start_row:end_row + 1, idx]
-                    vals = pd.to_numeric(values, errors='coerce').fillna(0)
-
-                    day_sum = vals.sum()
-                    daily_sums[date] += day_sum  # Суммируем для итога
-
-                    status_format = grey_format  # Default
-                    is_zero = False
-
-                    # Статистика нарушений за день
-                    day_violation_hours = 0
-
-                    if vals.max() == 0 and vals.min() == 0:
-                        status_format = grey_format
-                        is_zero = True
-                    else:
-                        has_violation = False
-
-                        # Check min (exclude 0)
-                        min_violations = (vals < qmin) & (vals != 0)
-
-                        # Check max
-                        max_violations = vals > qmax
-
-                        # Общее количество часов с нарушениями
-                        violations_mask = min_violations | max_violations
-                        day_violation_hours = violations_mask.sum()
-
-                        if day_violation_hours > 0:
-                            has_violation = True
-
-                        # Присвоение цвета
-                        if day_sum <= 12:
-                            status_format = yellow_format
-                            if has_violation:
-                                total_violation_days += 1
-                        elif has_violation:
-                            status_format = red_format
-                            total_violation_days += 1
-                        else:
-                            status_format = green_format
-
-                    total_violation_hours += day_violation_hours
-
-                    # Пишем сумму в ячейку с форматом фона
-                    worksheet.write_number(row_idx, col_idx, day_sum, status_format)
-
-                    # Рисуем график только если не ноль
-                    if not is_zero:
-                        spark_color = '#595959'
-                        if status_format == red_format:
-                            spark_color = '#A54040'  # Темно-красный
-                        elif status_format == green_format:
-                            spark_color = '#407040'  # Темно-зеленый
-                        elif status_format == yellow_format:
-                            spark_color = '#B38600'  # Темно-желтый
-
-                        options = {
-                            'range': data_range,
-                            'type': 'line',
-                            'markers': False,
-                            'weight': 1.0,  # Тоньше линия
-                            'series_color': spark_color,
-                            'high_point': False,
-                            'low_point': False,
-                        }
-                        worksheet.add_sparkline(row_idx, col_idx, options)
+        self.start_merge_job(job)
+
+    def start_merge_job(self, job):
+        """Запускает объединение в фоновом потоке и начинает опрос очереди прогресса"""
+        self.cancel_event.clear()
+        self.progress_queue = queue.Queue()
+        self.merge_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.NORMAL)
+        self.progress_bar['value'] = 0
+        self.progress_label.config(text="Запуск...")
+
+        self.merge_thread = threading.Thread(target=self._merge_worker, args=(job, self.trace_memory.get()),
+                                             daemon=True)
+        self.merge_thread.start()
+        self.root.after(PROGRESS_POLL_MS, self._poll_progress)
+
+    def cancel_merge(self):
+        """Просит фоновое объединение остановиться на границе ближайшего этапа"""
+        if self.merge_thread is not None and self.merge_thread.is_alive():
+            self.cancel_event.set()
+            self.cancel_button.config(state=tk.DISABLED)
+            self.progress_label.config(text="Отмена...")
+
+    def _report_progress(self, percent, text):
+        """Передает прогресс из фонового потока в очередь (виджеты меняет только поток интерфейса)"""
+        self.progress_queue.put(('progress', percent, text))
+
+    def _poll_progress(self):
+        """Обрабатывает сообщения фонового потока; вызывается через root.after"""
+        finished = False
+        try:
+            while True:
+                message = self.progress_queue.get_nowait()
+                kind = message[0]
+                if kind == 'progress':
+                    _, percent, text = message
+                    self.progress_bar['value'] = percent
+                    self.progress_label.config(text=text)
+                    continue
 
+                finished = True
+                if kind == 'done':
+                    self.progress_bar['value'] = 100
+                    self.progress_label.config(text="Готово")
+                    messagebox.showinfo("Успех", message[1])
+                    self.show_profile(message[2])
+                elif kind == 'cancelled':
+                    self.progress_bar['value'] = 0
+                    self.progress_label.config(text="Отменено")
+                    messagebox.showinfo("Отмена", "Объединение отменено")
                 else:
-                    worksheet.write(row_idx, col_idx, "Н/Д", grey_format)
-
-            # Накапливаем итоговую статистику
-            total_days_sum += total_violation_days
-            total_hours_sum += total_violation_hours
-
-            # Записываем статистику в столбец 2 (индекс 2)
-            stats_text = f"{total_violation_days} сут.; {int(total_violation_hours)} ч."
-            stats_fmt = green_format
-            if total_violation_hours > 0:
-                stats_fmt = red_format
-
-            worksheet.write(row_idx, 2, stats_text, stats_fmt)
-
-        # Записываем итоги в строку 1
-        # Итог по статистике
-        total_stats_text = f"{total_days_sum} сут.; {int(total_hours_sum)} ч."
-        total_stats_fmt = workbook.add_format({
-            'bold': True,
-            'valign': 'vcenter',
-            'align': 'center',
-            'border': 1,
-            'bg_color': '#FFFFFF',
-            'font_name': font_name,
-            'font_size': 14,
-            'font_color': '#FF0000'
-        })
-        worksheet.write(1, 2, total_stats_text, total_stats_fmt)
-
-        # Итоги по датам
-        for j, date in enumerate(unique_dates):
-            col_idx = j + 3
-            val = daily_sums.get(date, 0)
-            worksheet.write_number(1, col_idx, val, total_data_format)
-
-        # Делаем лист активным при открытии
-        worksheet.activate()
-
-    except Exception as e:
-        logging.error(f"Ошибка при создании Dashboard: {e}", exc_info=True)
-
-
-def setup_logging():
-    """Configures logging to a file in the user's home directory."""
-    log_dir = os.path.join(os.path.expanduser("~"), ".analytics_ui")
-    os.makedirs(log_dir, exist_ok=True)
-    log_file = os.path.join(log_dir, "app.log")
+                    self.progress_label.config(text="Ошибка")
+                    messagebox.showerror("Ошибка", message[1])
+        except queue.Empty:
+            pass
+
+        if finished:
+            self.merge_button.config(state=tk.NORMAL)
+            self.cancel_button.config(state=tk.DISABLED)
+        else:
+            self.root.after(PROGRESS_POLL_MS, self._poll_progress)
+
+    def show_profile(self, profile):
+        """Окно со сводкой замеров объединения: время и память по этапам и файлам"""
+        window = tk.Toplevel(self.root)
+        window.title("Замеры объединения")
+        window.geometry("800x400")
+
+        columns = ('wall', 'cpu', 'memory', 'delta') + (('traced',) if profile.trace_memory else ())
+        tree = ttk.Treeview(window, columns=columns)
+        tree.heading('#0', text="Этап")
+        tree.heading('wall', text="Время, с")
+        tree.heading('cpu', text="ЦП, с")
+        tree.heading('memory', text="Пик памяти, МБ")
+        tree.heading('delta', text="Прирост, МБ")
+        if profile.trace_memory:
+            tree.heading('traced', text="Пик Python, МБ")
+        tree.column('#0', width=320)
+        for column in columns:
+            tree.column(column, width=90, anchor='e')
+
+        def number(value, digits=2):
+            return "" if value is None else f"{value:.{digits}f}"
+
+        for title, wall, cpu, memory, delta, traced in profile.summary():
+            values = (number(wall), number(cpu), number(memory, 1), number(delta, 1), number(traced, 1))
+            tree.insert('', tk.END, text=title, values=values[:len(columns)])
+
+        scrollbar = ttk.Scrollbar(window, orient="vertical", command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        ttk.Label(window, text=f"Замеры сохранены в {profile.path}").pack(side="bottom", anchor="w", padx=5, pady=5)
+        peak = profile.process_peak_mb()
+        if peak is not None:
+            ttk.Label(window, text=f"Пик памяти программы с момента запуска: {peak:.1f} МБ").pack(
+                side="bottom", anchor="w", padx=5)
+        tree.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
 
-    logging.basicConfig(
-        filename=log_file,
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    )
-    return log_file
+    def _merge_worker(self, job, trace_memory=False):
+        """
+        Фоновый поток: чтение, объединение, расчёт стрелок, запись и форматирование отчёта.
+        trace_memory - замерять пик памяти Python-объектов по этапам (см. MergeProfile).
+        """
+        profile = MergeProfile(trace_memory=trace_memory)
+        try:
+            run_merge(job, self.file_cache, self.disk_cache, self._report_progress, self.cancel_event.is_set, profile)
+            if export_format(job['output_file']) == EXPORT_XLSX:
+                message = "Файлы успешно объединены, создан Dashboard!"
+            else:
+                message = f"Файлы успешно объединены, данные сохранены: {job['output_file']}"
+            self.progress_queue.put(('done', message, profile))
+        except MergeCancelled:
+            logging.info("Объединение отменено пользователем")
+            self.progress_queue.put(('cancelled',))
+        except MergeError as e:
+            self.progress_queue.put(('error', str(e)))
+        except Exception as e:
+            error_message = f"Произошла ошибка при объединении файлов: {str(e)}"
+            logging.error(error_message, exc_info=True)
+            self.progress_queue.put(('error', error_message))
 
 
 def main():
@@ -0,0 +1,190 @@
+"""
+Сохранение объединенных данных в табличные форматы без оформления: Parquet, Feather и CSV.
+
+Формат выбирается по расширению файла результата; отчёт .xlsx (с оформлением и Dashboard)
+по-прежнему записывает run_merge. Столбцы стрелок сохраняются как направления -1/0/1 (int8).
+Рядом с отчётом .xlsx сохраняется файл его данных (report.data.feather), из которого
+предыдущий результат быстро читается при дополнении новыми файлами (load_result).
+"""
+import os
+import logging
+
+import numpy as np
+import pandas as pd
+
+from analytics_ui.report import DATA_SHEET_NAME, DATA_FIRST_ROW, is_arrow_column
+
+try:
+    import pyarrow  # noqa: F401 - нужен pandas для форматов Parquet и Feather
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+EXPORT_XLSX = 'xlsx'
+EXPORT_PARQUET = 'parquet'
+EXPORT_FEATHER = 'feather'
+EXPORT_CSV = 'csv'
+
+# Расширение файла -> формат
+EXPORT_EXTENSIONS = {
+    '.xlsx': EXPORT_XLSX,
+    '.parquet': EXPORT_PARQUET,
+    '.feather': EXPORT_FEATHER,
+    '.arrow': EXPORT_FEATHER,
+    '.csv': EXPORT_CSV,
+}
+
+# Форматы, которым нужен pyarrow
+PYARROW_FORMATS = (EXPORT_PARQUET, EXPORT_FEATHER)
+
+# Формат даты/времени в CSV
+CSV_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Суффиксы файла данных отчёта: Feather (если установлен pyarrow), иначе pickle
+SIDECAR_SUFFIXES = ('.data.feather', '.data.pkl')
+
+# Символы столбцов стрелок в отчёте -> направления
+ARROW_DIRECTIONS = {'↓': -1, '↑': 1}
+
+
+def export_format(file_path):
+    """Формат по расширению файла (неизвестное расширение - отчёт xlsx)"""
+    return EXPORT_EXTENSIONS.get(os.path.splitext(file_path)[1].lower(), EXPORT_XLSX)
+
+
+def export_filetypes():
+    """Типы файлов для диалога сохранения: отчёт xlsx и доступные табличные форматы"""
+    filetypes = [("Excel files", "*.xlsx")]
+    if HAS_PYARROW:
+        filetypes.append(("Parquet (данные без оформления)", "*.parquet"))
+        filetypes.append(("Feather (данные без оформления)", "*.feather"))
+    filetypes.append(("CSV (данные без оформления)", "*.csv"))
+    return filetypes
+
+
+def check_export_format(file_path):
+    """Проверяет, что формат файла результата можно записать (ValueError - нельзя)"""
+    fmt = export_format(file_path)
+    if fmt in PYARROW_FORMATS and not HAS_PYARROW:
+        raise ValueError(f"для сохранения в формате {fmt} нужен пакет pyarrow")
+    return fmt
+
+
+def unique_columns(columns):
+    """Имена столбцов без повторов (повтор получает суффикс ' (2)', ' (3)', ...)"""
+    seen = {}
+    result = []
+    for name in map(str, columns):
+        count = seen.get(name, 0) + 1
+        seen[name] = count
+        result.append(name if count == 1 else f"{name} ({count})")
+    return result
+
+
+def export_frame(df, file_path, fmt=None):
+    """
+    Сохраняет DataFrame в file_path в формате fmt (по умолчанию - по расширению).
+    Индекс не сохраняется; повторяющиеся имена столбцов получают суффиксы (Parquet и Feather
+    требуют уникальных имен).
+    """
+    fmt = fmt or export_format(file_path)
+    columns = unique_columns(df.columns)
+    if columns != list(df.columns):
+        logging.warning("Повторяющиеся имена столбцов при сохранении получили суффиксы")
+    df = df.set_axis(columns, axis=1).reset_index(drop=True)
+
+    if fmt == EXPORT_PARQUET:
+        df.to_parquet(file_path, index=False)
+    elif fmt == EXPORT_FEATHER:
+        df.to_feather(file_path)
+    elif fmt == EXPORT_CSV:
+        # BOM - чтобы Excel открыл кириллицу в CSV без выбора кодировки
+        df.to_csv(file_path, index=False, encoding='utf-8-sig', date_format=CSV_DATETIME_FORMAT)
+    else:
+        raise ValueError(f"Неизвестный формат сохранения: {fmt}")
+    logging.info(f"Данные сохранены в формате {fmt}: {file_path} ({len(df)} строк, {len(df.columns)} столбцов)")
+
+
+def sidecar_paths(report_path):
+    """Возможные пути файла данных отчёта (в порядке предпочтения)"""
+    base = os.path.splitext(report_path)[0]
+    return [base + suffix for suffix in SIDECAR_SUFFIXES]
+
+
+def save_sidecar(df, report_path):
+    """
+    Сохраняет данные отчёта рядом с ним. Ошибка записи не прерывает объединение:
+    без файла данных дополнение прочитает лист Данные самого отчёта.
+    """
+    feather_path, pickle_path = sidecar_paths(report_path)
+    df = df.reset_index(drop=True)
+    use_feather = HAS_PYARROW and df.columns.is_unique
+    path = feather_path if use_feather else pickle_path
+    try:
+        if use_feather:
+            df.to_feather(path)
+        else:
+            df.to_pickle(path)
+    except Exception as e:
+        logging.warning(f"Не удалось сохранить файл данных отчёта {path}: {e}")
+        return None
+    # Файл данных в другом формате от прошлых запусков больше не соответствует отчёту
+    for other_path in (feather_path, pickle_path):
+        if other_path != path and os.path.exists(other_path):
+            os.remove(other_path)
+    return path
+
+
+def read_report_sheet(report_path):
+    """Данные отчёта .xlsx из листа Данные (три строки заголовка, стрелки - символами)"""
+    try:
+        raw = pd.read_excel(report_path, sheet_name=DATA_SHEET_NAME, header=None)
+    except ValueError as e:
+        raise ValueError(f"в отчёте нет листа {DATA_SHEET_NAME} (отчёт, разделенный на несколько листов, "
+                         f"дополняется только по файлу данных): {e}")
+    names = [str(name) for name in raw.iloc[DATA_FIRST_ROW - 1]]
+    names[0] = 'Время'
+    df = raw.iloc[DATA_FIRST_ROW:].set_axis(names, axis=1).reset_index(drop=True)
+    for col in df.columns[1:]:
+        if not is_arrow_column(col):
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df
+
+
+def load_result(file_path):
+    """
+    Читает ранее сохраненный результат объединения: файл данных рядом с отчётом .xlsx
+    (если он не старше отчёта), лист Данные отчёта или файл Parquet/Feather/CSV.
+    Возвращает DataFrame со столбцом Время и стрелками -1/0/1 (int8).
+    """
+    fmt = export_format(file_path)
+    if fmt == EXPORT_XLSX:
+        df = None
+        report_mtime = os.path.getmtime(file_path)
+        for path in sidecar_paths(file_path):
+            if not os.path.exists(path) or (path.endswith('.feather') and not HAS_PYARROW):
+                continue
+            if os.path.getmtime(path) < report_mtime:
+                logging.warning(f"Файл данных {path} старше отчёта и не используется")
+                continue
+            logging.info(f"Предыдущий результат читается из файла данных {path}")
+            df = pd.read_feather(path) if path.endswith('.feather') else pd.read_pickle(path)
+            break
+        if df is None:
+            logging.info(f"Предыдущий результат читается из листа {DATA_SHEET_NAME} отчёта {file_path}")
+            df = read_report_sheet(file_path)
+    elif fmt == EXPORT_PARQUET:
+        df = pd.read_parquet(file_path)
+    elif fmt == EXPORT_FEATHER:
+        df = pd.read_feather(file_path)
+    else:
+        df = pd.read_csv(file_path, encoding='utf-8-sig')
+
+    if 'Время' not in df.columns:
+        raise ValueError("в предыдущем результате нет столбца Время")
+    df['Время'] = pd.to_datetime(df['Время'])
+    for col in df.columns:
+        if is_arrow_column(col) and df[col].dtype != np.int8:
+            values = df[col].map(lambda value: ARROW_DIRECTIONS.get(value, value))
+            df[col] = pd.to_numeric(values, errors='coerce').fillna(0).astype(np.int8)
+    return df
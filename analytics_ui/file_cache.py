@@ -0,0 +1,346 @@
+import os
+import glob
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401 - нужен pandas для формата Feather
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+
+# Ограничение памяти кэша сессии по умолчанию (байт)
+DEFAULT_MEMORY_LIMIT = 1024 * 1024 * 1024
+
+# Ограничение размера дискового кэша по умолчанию (байт)
+DEFAULT_DISK_LIMIT = 2 * 1024 * 1024 * 1024
+
+# Версия формата дискового кэша: меняется, если меняется результат чтения файлов
+DISK_CACHE_VERSION = 1
+
+# Файл сведений о столбцах входных файлов (в папке дискового кэша) и наибольшее число записей в нём
+INVENTORY_FILE_NAME = "columns.json"
+DEFAULT_INVENTORY_ENTRIES = 5000
+
+
+def default_cache_dir():
+    """Папка дискового кэша рядом с логом программы (~/.analytics_ui/cache)"""
+    return os.path.join(os.path.expanduser("~"), ".analytics_ui", "cache")
+
+
+def file_signature(file_path):
+    """Возвращает (mtime, size) файла - по ним определяется, изменился ли файл"""
+    stat = os.stat(file_path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def frame_nbytes(df):
+    """Оценка объёма памяти, занимаемого DataFrame или Series (с учётом строк)"""
+    if df is None:
+        return 0
+    try:
+        usage = df.memory_usage(index=True, deep=True)
+        return int(usage.sum()) if hasattr(usage, 'sum') else int(usage)
+    except Exception:
+        return 0
+
+
+class DataFrameCache:
+    """
+    Кэш подготовленных к объединению файлов в пределах сессии.
+
+    Ключ - путь к файлу и вариант (набор столбцов, временное окно - то, от чего зависит подготовка);
+    запись действительна, пока у файла не изменились mtime и размер. Значение - то, что вернуло
+    чтение файла для объединения: (столбец времени, DataFrame). Суммарный объём ограничен max_bytes,
+    при превышении вытесняются давно не использованные записи (LRU). Значения общие для всех
+    потребителей - их нельзя изменять на месте.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MEMORY_LIMIT):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()  # {(path, variant): (signature, value, nbytes)}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, file_path, variant=None):
+        """Возвращает значение из кэша или None, если записи нет или файл изменился"""
+        key = (os.path.abspath(file_path), variant)
+        try:
+            signature = file_signature(file_path)
+        except OSError:
+            self.evict(file_path)
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != signature:
+                logging.info(f"Файл изменился, запись кэша устарела: {file_path}")
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, file_path, value, variant=None):
+        """Помещает значение (столбец времени, DataFrame) в кэш"""
+        key = (os.path.abspath(file_path), variant)
+        try:
+            signature = file_signature(file_path)
+        except OSError:
+            return
+
+        nbytes = sum(frame_nbytes(part) for part in value)
+        with self._lock:
+            self._remove(key)
+            if nbytes > self.max_bytes:
+                logging.info(f"Файл не помещён в кэш (слишком большой: {nbytes} байт): {file_path}")
+                return
+            self._entries[key] = (signature, value, nbytes)
+            self.total_bytes += nbytes
+            while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+                old_key = next(iter(self._entries))
+                logging.info(f"Вытеснен из кэша: {old_key[0]}")
+                self._remove(old_key)
+
+    def evict(self, file_path):
+        """Удаляет все записи о файле из кэша"""
+        path = os.path.abspath(file_path)
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == path]:
+                self._remove(key)
+
+    def clear(self):
+        """Очищает кэш"""
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[2]
+
+
+def content_hash(file_path, chunk_size=1024 * 1024):
+    """SHA-256 содержимого файла"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """
+    Постоянный кэш прочитанных файлов на диске.
+
+    Ключ - хэш содержимого файла, поэтому переименование или копирование файла не мешает
+    попаданию в кэш. Таблицы хранятся в формате Feather (если установлен pyarrow), иначе в pickle.
+    Суммарный размер ограничен max_bytes, при превышении удаляются давно не использованные записи.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_DISK_LIMIT):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_bytes = max_bytes
+        # Хэши уже посчитанных файлов: {path: (signature, hash)}
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def key(self, file_path):
+        """Ключ записи для файла (хэш содержимого + версия формата)"""
+        signature = file_signature(file_path)
+        cached = self._hashes.get(file_path)
+        if cached is None or cached[0] != signature:
+            cached = (signature, content_hash(file_path))
+            self._hashes[file_path] = cached
+        return f"{cached[1]}_v{DISK_CACHE_VERSION}"
+
+    def _entry_paths(self, key):
+        base = os.path.join(self.cache_dir, key)
+        return base + '.feather', base + '.pkl'
+
+    def get(self, file_path):
+        """Возвращает DataFrame из дискового кэша или None"""
+        try:
+            key = self.key(file_path)
+        except OSError:
+            return None
+
+        for entry_path in self._entry_paths(key):
+            if not os.path.exists(entry_path):
+                continue
+            try:
+                if entry_path.endswith('.feather'):
+                    if not HAS_PYARROW:
+                        continue
+                    df = pd.read_feather(entry_path)
+                else:
+                    df = pd.read_pickle(entry_path)
+                # Обновляем время доступа для вытеснения давно не использованных записей
+                os.utime(entry_path)
+                return df
+            except Exception as e:
+                logging.warning(f"Не удалось прочитать запись дискового кэша {entry_path}: {e}")
+                self._remove_file(entry_path)
+        return None
+
+    def put(self, file_path, df):
+        """Сохраняет прочитанный DataFrame в дисковый кэш"""
+        try:
+            key = self.key(file_path)
+            os.makedirs(self.cache_dir, exist_ok=True)
+        except OSError as e:
+            logging.warning(f"Дисковый кэш недоступен: {e}")
+            return
+
+        feather_path, pickle_path = self._entry_paths(key)
+        saved = False
+        if HAS_PYARROW:
+            saved = self._write_atomic(feather_path, lambda path: df.to_feather(path))
+        if not saved:
+            saved = self._write_atomic(pickle_path, lambda path: df.to_pickle(path))
+        if saved:
+            self.enforce_limit()
+
+    def _write_atomic(self, entry_path, write):
+        tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, entry_path)
+            return True
+        except Exception as e:
+            logging.info(f"Не удалось записать {os.path.basename(entry_path)} в дисковый кэш: {e}")
+            self._remove_file(tmp_path)
+            return False
+
+    def _entries(self):
+        """Записи кэша: [(время последнего использования, размер, путь)], самые старые первыми"""
+        entries = []
+        for entry_path in glob.glob(os.path.join(self.cache_dir, '*.feather')) + \
+                glob.glob(os.path.join(self.cache_dir, '*.pkl')):
+            try:
+                stat = os.stat(entry_path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry_path))
+        entries.sort()
+        return entries
+
+    def size(self):
+        """Текущий размер кэша на диске (байт)"""
+        return sum(size for _, size, _ in self._entries())
+
+    def enforce_limit(self):
+        """Удаляет давно не использованные записи, пока кэш не уложится в max_bytes"""
+        with self._lock:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry_path in entries:
+                if total <= self.max_bytes:
+                    break
+                logging.info(f"Вытеснена запись дискового кэша: {entry_path}")
+                self._remove_file(entry_path)
+                total -= size
+
+    def clear(self):
+        """Удаляет все записи дискового кэша. Возвращает освобождённый объём (байт)"""
+        with self._lock:
+            freed = 0
+            for _, size, entry_path in self._entries():
+                if self._remove_file(entry_path):
+                    freed += size
+            self._hashes.clear()
+            return freed
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+
+class ColumnInventory:
+    """
+    Сведения о столбцах входных файлов (заголовки, число строк, период), сохраняемые между сессиями.
+
+    Ключ - путь к файлу; запись действительна, пока у файла не изменились mtime и размер.
+    Значения - словари, которые сохраняет и восстанавливает readers.FileProbe (to_dict/from_dict).
+    Хранятся в JSON в папке дискового кэша; сверх max_entries удаляются давно добавленные записи.
+    """
+
+    def __init__(self, path=None, max_entries=DEFAULT_INVENTORY_ENTRIES):
+        self.path = path or os.path.join(default_cache_dir(), INVENTORY_FILE_NAME)
+        self.max_entries = max_entries
+        self._entries = None  # {path: [mtime_ns, size, info]}, загружается при первом обращении
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        self._entries = {}
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding='utf-8') as inventory_file:
+                entries = json.load(inventory_file)
+            if isinstance(entries, dict):
+                self._entries = entries
+        except (OSError, ValueError) as e:
+            logging.warning(f"Не удалось прочитать сведения о столбцах файлов {self.path}: {e}")
+
+    def get(self, file_path):
+        """Сведения о файле или None, если их нет или файл изменился"""
+        key = os.path.abspath(file_path)
+        try:
+            signature = list(file_signature(file_path))
+        except OSError:
+            return None
+        with self._lock:
+            self._load()
+            entry = self._entries.get(key)
+            if entry is None or entry[:2] != signature:
+                return None
+            return entry[2]
+
+    def put(self, file_path, info):
+        """Сохраняет сведения о файле (словарь, который можно записать в JSON)"""
+        key = os.path.abspath(file_path)
+        try:
+            signature = list(file_signature(file_path))
+        except OSError:
+            return
+        with self._lock:
+            self._load()
+            self._entries.pop(key, None)
+            self._entries[key] = signature + [info]
+            while len(self._entries) > self.max_entries:
+                del self._entries[next(iter(self._entries))]
+            self._save()
+
+    def _save(self):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as inventory_file:
+                json.dump(self._entries, inventory_file, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.info(f"Не удалось сохранить сведения о столбцах файлов {self.path}: {e}")
+
+    def clear(self):
+        """Удаляет все сведения"""
+        with self._lock:
+            self._entries = {}
+            DiskCache._remove_file(self.path)
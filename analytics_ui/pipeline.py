@@ -0,0 +1,499 @@
+import os
+import sys
+import logging
+
+import numpy as np
+import pandas as pd
+
+from analytics_ui.rules import compile_rules
+from analytics_ui.align import DEFAULT_ALIGN, align_frames, source_window
+from analytics_ui.readers import (
+    DEFAULT_READER, MergeCancelled, read_files_parallel, remove_empty_columns, resolve_reader, selection_key
+)
+from analytics_ui.export import EXPORT_XLSX, check_export_format, export_frame, load_result, save_sidecar
+from analytics_ui.profiling import MergeProfile, measure_start, measure_stop
+from analytics_ui.report import (
+    DEFAULT_COLOR_MODE, FormatRegistry, format_data_workbook, add_arrow_columns, arrow_labels, create_dashboard_sheet,
+    is_arrow_column, write_data_rows, data_sheet_layout, DATA_FIRST_ROW
+)
+
+# Имя файла правил, поставляемого вместе с программой
+RULES_FILE_NAME = "Правила названия столбцов.xlsx"
+
+# Доля шкалы прогресса, отведенная на чтение файлов (%)
+READ_STAGE_PERCENT = 60
+
+# Формат даты/времени в отчёте
+DATETIME_FORMAT = 'yyyy-mm-dd hh:mm:ss'
+
+
+class MergeError(Exception):
+    """Ошибка объединения; текст исключения предназначен для пользователя"""
+
+
+def resource_path(relative_path):
+    """Получает абсолютный путь к ресурсу, работает для dev, PyInstaller и pip install"""
+    try:
+        # PyInstaller создает временную папку и хранит путь в _MEIPASS
+        base_path = sys._MEIPASS
+    except Exception:
+        # Normal python script or installed package
+        base_path = os.path.dirname(os.path.abspath(__file__))
+
+    path = os.path.join(base_path, relative_path)
+    return path
+
+
+def setup_logging():
+    """Configures logging to a file in the user's home directory."""
+    log_dir = os.path.join(os.path.expanduser("~"), ".analytics_ui")
+    os.makedirs(log_dir, exist_ok=True)
+    log_file = os.path.join(log_dir, "app.log")
+
+    logging.basicConfig(
+        filename=log_file,
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    return log_file
+
+
+def load_rules(rules_file):
+    """Читает файл правил. При отсутствии или ошибке чтения возвращает пустой DataFrame"""
+    try:
+        if os.path.exists(rules_file):
+            return pd.read_excel(rules_file, engine='openpyxl')
+        logging.warning(f"Файл правил не найден: {rules_file}")
+    except Exception as e:
+        logging.error(f"Не удалось загрузить файл правил: {e}", exc_info=True)
+    return pd.DataFrame()
+
+
+def measurement_nodes(rules, files):
+    """Узлы измерения, которые правила связывают с файлами (отсортированный список)"""
+    nodes = set()
+    for file in files:
+        filename = os.path.basename(file).lower()
+        logging.info(f"Обработка файла: '{filename}'")
+        for node_name in sorted(rules.nodes_for_file(file)):
+            logging.info(f"Совпадение: '{os.path.splitext(filename)[0]}' -> узел '{node_name}'")
+            nodes.add(node_name)
+    return [node for node in sorted(nodes) if node and node.lower() != 'nan']
+
+
+def file_rename_rules(rules, file_path, selected_parameters):
+    """Правила переименования столбцов файла {старое имя: новое имя} для выбранных параметров"""
+    rename_dict = {}
+    filename = os.path.basename(file_path).lower()
+    for old_name, new_name, parameter in rules.rename_rules(file_path, selected_parameters):
+        rename_dict[old_name] = new_name
+        logging.info(f"Найдено правило для '{filename}': '{old_name}' -> '{new_name}' (Параметр: {parameter})")
+    return rename_dict
+
+
+def check_selection(files, rules, selected_parameters, available_nodes, selected_nodes,
+                    start_datetime=None, end_datetime=None):
+    """Проверяет входные данные объединения; при ошибке выбрасывает MergeError с текстом для пользователя"""
+    # Без правил нет ни параметров, ни узлов - остальные проверки ввели бы в заблуждение
+    if rules.empty:
+        raise MergeError("Файл с правилами названия столбцов не найден или пуст!")
+    if not files:
+        raise MergeError("Пожалуйста, добавьте файлы для объединения")
+    if not selected_parameters:
+        raise MergeError("Пожалуйста, выберите хотя бы один параметр для объединения")
+    if not available_nodes:
+        raise MergeError("Не найдены узлы измерения. Проверьте соответствие имён файлов правилам.")
+    if not selected_nodes:
+        raise MergeError("Пожалуйста, выберите хотя бы один узел измерения")
+    if start_datetime and end_datetime and start_datetime > end_datetime:
+        raise MergeError("Начальная дата/время не может быть позже конечной")
+
+
+def build_merge_job(files, rules, selected_parameters, selected_nodes, start_datetime, end_datetime,
+                    output_file, workers, align=DEFAULT_ALIGN, tolerance=None, color_mode=DEFAULT_COLOR_MODE,
+                    streaming=False, append_to=None, reader=DEFAULT_READER):
+    """
+    Составляет задание объединения для run_merge.
+    align и tolerance задают сопоставление строк файлов по времени (см. align_frames),
+    color_mode - способ раскраски листа Данные (см. format_data_workbook),
+    streaming - запись отчёта в режиме xlsxwriter constant_memory (память не растет с числом строк).
+    append_to - предыдущий результат (отчёт .xlsx или файл данных), который дополняется
+    строками files новее его последнего времени.
+    reader - движок чтения Excel (READERS; результат от него не зависит).
+    """
+    rules = compile_rules(rules)
+
+    # Столбцы, которые соответствуют и выбранным параметрам, и выбранным узлам
+    allowed_columns, node_allowed_columns = rules.allowed_columns(selected_parameters, selected_nodes)
+
+    # Правила переименования для каждого файла
+    files = list(files)
+    rename_rules = []
+    for file in files:
+        file_rules = file_rename_rules(rules, file, selected_parameters)
+        if file_rules:
+            logging.info(f"Применяем правила переименования для файла {os.path.basename(file)}:")
+            for old_name, new_name in file_rules.items():
+                logging.info(f"  {old_name} -> {new_name}")
+        rename_rules.append(file_rules)
+
+    return {
+        'files': files,
+        'rename_rules': rename_rules,
+        'allowed_columns': allowed_columns,
+        'node_allowed_columns': node_allowed_columns,
+        'start_datetime': start_datetime,
+        'end_datetime': end_datetime,
+        'output_file': output_file,
+        'workers': workers,
+        'rules': rules,
+        'align': align,
+        'tolerance': tolerance,
+        'color_mode': color_mode,
+        'streaming': streaming,
+        'append_to': append_to,
+        'reader': reader,
+    }
+
+
+def temporary_path(output_file):
+    """
+    Временный файл рядом с output_file. Результат пишется в него и заменяет output_file
+    только после успешной записи: при отмене или ошибке прежний файл (например, дополняемый
+    отчёт, который перезаписывается на месте) остаётся целым.
+    """
+    # Расширение сохраняется: по нему pandas проверяет движок записи
+    base, ext = os.path.splitext(output_file)
+    return f"{base}.{os.getpid()}.tmp{ext}"
+
+
+def remove_temporary(tmp_path):
+    try:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    except OSError as e:
+        logging.warning(f"Не удалось удалить временный файл {tmp_path}: {e}")
+
+
+def append_rows(previous_df, new_df):
+    """
+    Добавляет новые строки к предыдущему результату. Столбцы предыдущего результата
+    сохраняют порядок, новые столбцы добавляются в конце; у строк без значения стрелки - 0.
+    """
+    columns = list(previous_df.columns) + [col for col in new_df.columns if col not in previous_df.columns]
+    added = len(columns) - len(previous_df.columns)
+    if added:
+        logging.info(f"Новых столбцов: {added}")
+    merged_df = pd.concat([previous_df, new_df], ignore_index=True, sort=False).reindex(columns=columns)
+    for col in merged_df.columns:
+        if is_arrow_column(col):
+            merged_df[col] = merged_df[col].fillna(0).astype(np.int8)
+    return merged_df
+
+
+def write_data_sheet(writer, sheet, df, labels_df, rules, formats, color_mode, streaming=False, profile=None):
+    """
+    Записывает и форматирует один лист данных (DataSheet).
+    labels_df - df с символами стрелок для записи; данные начинаются с 4 строки (индекс 3),
+    чтобы оставить место для заголовков. profile (MergeProfile) получает замеры записи и форматирования.
+    """
+    profile = profile if profile is not None else MergeProfile()
+    data_df = sheet.frame(df)
+    size = {'sheet': sheet.name, 'rows': len(data_df), 'columns': len(data_df.columns)}
+    if streaming:
+        # Строки пишутся по порядку: сначала заголовки и настройки столбцов, затем данные
+        worksheet = writer.book.add_worksheet(sheet.name)
+        with profile.stage('format_data', **size):
+            plan = format_data_workbook(writer, sheet.name, data_df, rules, formats, color_mode, streaming=True)
+        with profile.stage('write_data', **size):
+            write_data_rows(worksheet, sheet.frame(labels_df), DATA_FIRST_ROW, plan,
+                            formats.get({'num_format': DATETIME_FORMAT}))
+    else:
+        with profile.stage('write_data', **size):
+            sheet.frame(labels_df).to_excel(writer, sheet_name=sheet.name, index=False, startrow=DATA_FIRST_ROW,
+                                            header=False)
+        with profile.stage('format_data', **size):
+            format_data_workbook(writer, sheet.name, data_df, rules, formats, color_mode)
+
+
+def run_merge(job, file_cache=None, disk_cache=None, progress=None, should_stop=None, profile=None):
+    """
+    Выполняет объединение по заданию job: чтение, объединение, расчёт стрелок,
+    запись и форматирование отчёта. Возвращает объединенный DataFrame.
+    Если файл результата - .parquet, .feather или .csv, данные сохраняются без оформления и Dashboard.
+    Если задан job['append_to'], из файлов берутся только строки новее предыдущего результата
+    и добавляются к нему (читаются и объединяются только новые данные).
+
+    file_cache - кэш сессии (DataFrameCache), disk_cache - дисковый кэш (DiskCache), оба необязательны.
+    progress(percent, text) сообщает о ходе работы; если should_stop() возвращает True,
+    объединение прерывается на границе этапа с MergeCancelled. Ошибка сохранения - MergeError.
+
+    profile (MergeProfile) получает замеры времени и памяти по этапам и файлам; по окончании
+    (в том числе при ошибке или отмене) замеры дописываются в profile.jsonl рядом с журналом.
+    """
+    profile = profile if profile is not None else MergeProfile()
+    profile.begin()
+    status = 'error'
+    try:
+        merged_df = _merge(job, file_cache, disk_cache, progress, should_stop, profile)
+        status = 'ok'
+        return merged_df
+    except MergeCancelled:
+        status = 'cancelled'
+        raise
+    finally:
+        profile.finish(status)
+
+
+def _merge(job, file_cache, disk_cache, progress, should_stop, profile):
+    """Этапы объединения для run_merge"""
+    def report_progress(percent, text):
+        if progress is not None:
+            progress(percent, text)
+
+    def check_cancel():
+        if should_stop is not None and should_stop():
+            raise MergeCancelled()
+
+    files = job['files']
+    allowed_columns = job['allowed_columns']
+    start_datetime = job['start_datetime']
+    end_datetime = job['end_datetime']
+    rules = job['rules']
+    output_file = job['output_file']
+
+    # Формат результата проверяется до чтения файлов
+    try:
+        output_format = check_export_format(output_file)
+    except ValueError as e:
+        raise MergeError(f"Невозможно сохранить результат: {str(e)}")
+    try:
+        reader = resolve_reader(job.get('reader', DEFAULT_READER))
+    except ValueError as e:
+        raise MergeError(f"Невозможно прочитать файлы: {str(e)}")
+
+    # Предыдущий результат для дополнения: читаются только строки новее его последнего времени
+    previous_df = None
+    last_time = None
+    if job.get('append_to'):
+        try:
+            with profile.stage('load_previous', file=job['append_to']) as record:
+                previous_df = load_result(job['append_to'])
+                record['rows'] = len(previous_df)
+        except Exception as e:
+            logging.error(f"Не удалось прочитать предыдущий результат {job['append_to']}: {e}", exc_info=True)
+            raise MergeError(f"Не удалось прочитать предыдущий результат {job['append_to']}: {str(e)}")
+        last_time = previous_df['Время'].max()
+        if pd.isna(last_time):
+            last_time = None
+        logging.info(f"Дополнение результата {job['append_to']}: {len(previous_df)} строк, последнее время {last_time}")
+        if last_time is not None and (start_datetime is None or start_datetime < last_time):
+            start_datetime = last_time
+
+    # Временное окно передается в чтение: строки вне него отбрасываются уже при разборе файлов.
+    # Из второго и следующих файлов при сопоставлении с ближайшей строкой читается и запас по краям окна
+    time_window = (start_datetime, end_datetime) if start_datetime is not None or end_datetime is not None else None
+    align = job.get('align', DEFAULT_ALIGN)
+    tolerance = job.get('tolerance')
+    other_window = source_window(time_window, align, tolerance)
+
+    # Чтение всех файлов: подготовленные с тем же отбором в этой сессии берутся из кэша сессии,
+    # остальные читаются в пуле процессов, который возвращает только отобранные столбцы
+    # (неизменённый файл при этом берётся из дискового кэша, а не разбирается заново)
+    report_progress(0, "Чтение файлов...")
+    prepared = [None] * len(files)
+    variants = [None] * len(files)
+    read_tasks = []
+    task_indices = []
+    cache_dir = disk_cache.cache_dir if disk_cache is not None else None
+
+    for i, file in enumerate(files):
+        logging.info(f"Обработка файла: {file}")
+        file_window = time_window if i == 0 else other_window
+        if file_cache is not None:
+            # Подготовка зависит и от того, задаёт ли файл шкалу времени (первый файл)
+            variants[i] = f"{int(i == 0)}-{selection_key(job['rename_rules'][i], allowed_columns, file_window)}"
+            cached = file_cache.get(file, variants[i])
+            if cached is not None:
+                logging.info(f"Файл взят из кэша сессии: {file}")
+                profile.add({'stage': 'read_file', 'file': file, 'source': 'session cache',
+                             'rows': len(cached[1]), 'columns': len(cached[1].columns)})
+                prepared[i] = cached
+                continue
+        read_tasks.append((file, i == 0, job['rename_rules'][i], allowed_columns, file_window, cache_dir, reader))
+        task_indices.append(i)
+
+    cached_count = len(files) - len(read_tasks)
+
+    def read_progress(done, total):
+        done += cached_count
+        report_progress(READ_STAGE_PERCENT * done / len(files), f"Чтение файлов: {done} из {len(files)}")
+
+    check_cancel()
+    if read_tasks:
+        logging.info(f"Чтение {len(read_tasks)} файлов, процессов: {job['workers']}, движок: {reader}")
+        with profile.stage('read', files=len(read_tasks), workers=job['workers'], reader=reader):
+            results = read_files_parallel(read_tasks, job['workers'], read_progress, should_stop)
+        for i, (file_time_column, df, source_columns, stats) in zip(task_indices, results):
+            logging.info(f"Столбцы в файле {os.path.basename(files[i])}: {source_columns}")
+            profile.add(stats)
+            prepared[i] = (file_time_column, df)
+            if file_cache is not None:
+                file_cache.put(files[i], prepared[i], variants[i])
+
+    check_cancel()
+    if time_window is not None and not any(len(df) for _, df in prepared):
+        if previous_df is not None:
+            raise MergeError(f"В файлах нет новых данных после {last_time}")
+        raise MergeError("В файлах нет данных в выбранном периоде")
+    report_progress(READ_STAGE_PERCENT, "Объединение данных...")
+
+    # Объединение всех датафреймов по столбцам с сопоставлением строк по времени
+    logging.info(f"Сопоставление по времени: {align}" + (f", допуск {tolerance}" if tolerance is not None else ""))
+    with profile.stage('align', files=len(files)) as record:
+        time_column, merged_df = align_frames(prepared, align, tolerance)
+
+        # Удаляем дублирующиеся столбцы (например, если один и тот же файл был добавлен дважды)
+        # Это критично для избежания ошибок get_loc во время обработки Excel
+        merged_df = merged_df.loc[:, ~merged_df.columns.duplicated()].copy()
+        record['rows'], record['columns'] = merged_df.shape
+
+    logging.info(f"Столбцы после объединения: {list(merged_df.columns)}")
+
+    # Добавляем временной столбец в начало
+    merged_df.insert(0, 'Время', time_column)
+
+    with profile.stage('filter') as record:
+        # Фильтруем по временному интервалу, если он указан
+        if start_datetime is not None or end_datetime is not None:
+            if start_datetime is not None:
+                merged_df = merged_df[merged_df['Время'] >= start_datetime]
+            if end_datetime is not None:
+                merged_df = merged_df[merged_df['Время'] <= end_datetime]
+            logging.info(
+                f"Применен фильтр по времени: "
+                f"{start_datetime if start_datetime else 'начало'} - "
+                f"{end_datetime if end_datetime else 'конец'}"
+            )
+
+        # Строка с последним временем предыдущего результата в нём уже есть
+        if last_time is not None:
+            merged_df = merged_df[merged_df['Время'] > last_time]
+
+        # Удаляем пустые столбцы из объединенного датафрейма
+        merged_df = remove_empty_columns(merged_df)
+        record['rows'], record['columns'] = merged_df.shape
+
+    check_cancel()
+    report_progress(65, "Расчет выходов за диапазон...")
+
+    # Добавляем столбцы со стрелками перед сохранением
+    with profile.stage('arrows') as record:
+        merged_df, param_to_node = add_arrow_columns(merged_df, rules)
+
+        # Сортируем по времени перед сохранением, чтобы спарклайны были корректными
+        if 'Время' in merged_df.columns:
+            merged_df.sort_values(by='Время', inplace=True)
+
+        if previous_df is not None:
+            logging.info(f"Новых строк: {len(merged_df)}")
+            merged_df = append_rows(previous_df, merged_df)
+        record['rows'], record['columns'] = merged_df.shape
+
+    check_cancel()
+
+    # Сохранение результата
+    logging.info(f"Начинаем сохранение результата в файл: {output_file}")
+
+    # Сбрасываем индекс, чтобы он соответствовал номерам строк в Excel (начиная с 0 -> Row 2)
+    # Это критично для правильной адресации спарклайнов
+    merged_df.reset_index(drop=True, inplace=True)
+
+    # Преобразуем числовые данные (заменяем запятые на точки и конвертируем в float)
+    # Это необходимо для правильной работы спарклайнов и графиков
+    logging.info("Преобразование данных в числа...")
+    with profile.stage('convert', columns=len(merged_df.columns)):
+        for col in merged_df.columns:
+            if col != 'Время' and not is_arrow_column(col):
+                try:
+                    # Если столбец типа object (строки), пробуем конвертировать
+                    if merged_df[col].dtype == 'object':
+                        merged_df[col] = merged_df[col].astype(str).str.replace(',', '.', regex=False)
+                        merged_df[col] = pd.to_numeric(merged_df[col], errors='coerce')
+                except Exception as conv_err:
+                    logging.warning(f"Не удалось конвертировать столбец {col}: {conv_err}")
+
+    if output_format != EXPORT_XLSX:
+        # Табличный формат для дальнейшего анализа: без оформления листа Данные и Dashboard
+        report_progress(80, f"Сохранение данных ({output_format})...")
+        tmp_path = temporary_path(output_file)
+        try:
+            with profile.stage('export', file=output_file, rows=len(merged_df), columns=len(merged_df.columns)):
+                export_frame(merged_df, tmp_path, output_format)
+                os.replace(tmp_path, output_file)
+        except Exception as save_error:
+            error_message = f"Ошибка при сохранении файла: {str(save_error)}"
+            logging.error(error_message, exc_info=True)
+            raise MergeError(error_message) from save_error
+        finally:
+            remove_temporary(tmp_path)
+        return merged_df
+
+    # Отчёт пишется во временный файл: output_file может быть дополняемым отчётом,
+    # и при отмене или ошибке записи он не должен пострадать
+    tmp_path = temporary_path(output_file)
+    saving = None
+    try:
+        # Используем xlsxwriter для поддержки спарклайнов
+        # В режиме constant_memory xlsxwriter держит в памяти только текущую строку листа
+        streaming = job.get('streaming', False)
+        engine_kwargs = {'options': {'constant_memory': True}} if streaming else None
+        with pd.ExcelWriter(tmp_path, engine='xlsxwriter', datetime_format=DATETIME_FORMAT,
+                            engine_kwargs=engine_kwargs) as writer:
+            # Форматы без повторов, общие для листов Данные и Dashboard
+            formats = FormatRegistry(writer.book)
+            color_mode = job.get('color_mode', DEFAULT_COLOR_MODE)
+
+            # Раскладка по листам: данные больше листа Excel делятся на Данные_1, Данные_2, ...
+            layout = data_sheet_layout(merged_df, rules)
+            if len(layout) > 1:
+                logging.info(f"Данные не помещаются на один лист Excel ({len(merged_df)} строк, "
+                             f"{len(merged_df.columns)} столбцов): листов данных - {len(layout)}")
+
+            # Направления в столбцах стрелок превращаются в символы ↓/↑ только при записи
+            labels_df = arrow_labels(merged_df)
+            for number, sheet in enumerate(layout):
+                percent = 70 + 20 * number / len(layout)
+                report_progress(percent, f"Запись листа {sheet.name}...")
+                logging.info(f"Записываем и форматируем лист {sheet.name}...")
+                write_data_sheet(writer, sheet, merged_df, labels_df, rules, formats, color_mode, streaming, profile)
+                check_cancel()
+
+            # Создаем лист Dashboard
+            report_progress(90, "Создание листа Dashboard...")
+            logging.info("Создаем лист Dashboard...")
+            with profile.stage('dashboard'):
+                create_dashboard_sheet(writer, merged_df, rules, job['node_allowed_columns'], formats, layout)
+            report_progress(95, "Сохранение файла...")
+            # Книга записывается в файл при выходе из with
+            saving = measure_start()
+        os.replace(tmp_path, output_file)
+    except MergeCancelled:
+        raise
+    except Exception as save_error:
+        error_message = f"Ошибка при сохранении файла: {str(save_error)}"
+        logging.error(error_message, exc_info=True)
+        raise MergeError(error_message) from save_error
+    finally:
+        # Замер сохранения закрывается и при ошибке, как замеры этапов
+        if saving is not None:
+            profile.add(measure_stop(saving, {'stage': 'save', 'file': output_file}))
+        # Недописанный отчёт не оставляем; прежний output_file не тронут
+        remove_temporary(tmp_path)
+
+    logging.info("Данные и Dashboard успешно сохранены")
+
+    # Данные отчёта рядом с ним - для быстрого дополнения новыми файлами
+    with profile.stage('sidecar'):
+        save_sidecar(merged_df, output_file)
+    return merged_df
@@ -0,0 +1,312 @@
+"""
+Замеры этапов объединения: время (настенное и процессорное) и память по этапам и входным файлам.
+
+Память этапа - наибольший объём памяти процесса (RSS, на Windows - рабочий набор) за этап: пока
+этап идёт, фоновый поток раз в RSS_SAMPLE_INTERVAL секунд замеряет память процесса. Кроме того,
+записываются объём в конце этапа и его изменение за этап, а с tracemalloc - пик памяти
+Python-объектов за этап. Наибольший объём памяти процесса с момента запуска - величина за всё
+время работы, она записывается только в итог объединения.
+
+Каждое объединение дописывает свои замеры в profile.jsonl рядом с журналом (~/.analytics_ui):
+одна строка JSON на этап или файл, строки одного запуска имеют общий run.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import datetime
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+    HAS_RESOURCE = True
+except ImportError:  # Windows
+    HAS_RESOURCE = False
+
+if sys.platform == 'win32':
+    import ctypes
+    from ctypes import wintypes
+
+    class _ProcessMemoryCounters(ctypes.Structure):
+        """PROCESS_MEMORY_COUNTERS из psapi.h"""
+        _fields_ = [
+            ('cb', wintypes.DWORD),
+            ('PageFaultCount', wintypes.DWORD),
+            ('PeakWorkingSetSize', ctypes.c_size_t),
+            ('WorkingSetSize', ctypes.c_size_t),
+            ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+            ('PagefileUsage', ctypes.c_size_t),
+            ('PeakPagefileUsage', ctypes.c_size_t),
+        ]
+
+PROFILE_FILE_NAME = "profile.jsonl"
+
+# Период замера памяти процесса во время этапа, с
+RSS_SAMPLE_INTERVAL = 0.05
+
+# Названия этапов для сводки
+STAGE_TITLES = {
+    'load_previous': "Чтение предыдущего результата",
+    'read': "Чтение файлов",
+    'read_file': "Файл",
+    'align': "Сопоставление и объединение",
+    'filter': "Фильтр по времени, пустые столбцы",
+    'arrows': "Стрелки выхода за диапазон",
+    'convert': "Преобразование в числа",
+    'export': "Сохранение данных",
+    'write_data': "Запись листа",
+    'format_data': "Форматирование листа",
+    'dashboard': "Dashboard",
+    'save': "Сохранение книги",
+    'sidecar': "Файл данных отчёта",
+    'total': "Всего",
+}
+
+
+def default_profile_path():
+    """Файл замеров рядом с журналом программы"""
+    return os.path.join(os.path.expanduser("~"), ".analytics_ui", PROFILE_FILE_NAME)
+
+
+def _windows_memory_counters():
+    """Счётчики памяти текущего процесса Windows (_ProcessMemoryCounters) или None"""
+    try:
+        kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+        kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+        get_info = kernel32.K32GetProcessMemoryInfo
+        get_info.argtypes = [wintypes.HANDLE, ctypes.POINTER(_ProcessMemoryCounters), wintypes.DWORD]
+        get_info.restype = wintypes.BOOL
+        counters = _ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        if not get_info(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+            return None
+        return counters
+    except (OSError, AttributeError):
+        return None
+
+
+def lifetime_peak_rss_mb():
+    """
+    Наибольший объём памяти процесса с момента его запуска (МБ) или None, если недоступен.
+    Это величина за всё время работы процесса, а не за этап.
+    """
+    if sys.platform == 'win32':
+        counters = _windows_memory_counters()
+        return counters.PeakWorkingSetSize / (1024 * 1024) if counters is not None else None
+    if not HAS_RESOURCE:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux сообщает килобайты, macOS - байты
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def current_rss_mb():
+    """Текущий объём памяти процесса (МБ) или None, если недоступен (Linux и Windows)"""
+    if sys.platform == 'win32':
+        counters = _windows_memory_counters()
+        return counters.WorkingSetSize / (1024 * 1024) if counters is not None else None
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class _RssSampler:
+    """Фоновый поток, который замеряет объём памяти процесса и запоминает наибольший"""
+
+    def __init__(self, first_sample, interval=RSS_SAMPLE_INTERVAL):
+        self.peak = first_sample
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+        self._thread.start()
+
+    def _sample(self):
+        rss = current_rss_mb()
+        if rss is not None and rss > self.peak:
+            self.peak = rss
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def stop(self):
+        """Останавливает замеры; возвращает наибольший объём памяти (МБ) с учётом последнего замера"""
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        return self.peak
+
+
+class _Measurement:
+    """Открытый замер (между measure_start и measure_stop)"""
+
+    def __init__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        self.rss = current_rss_mb()
+        self.sampler = _RssSampler(self.rss) if self.rss is not None else None
+        # Пик tracemalloc до сбросов вложенными замерами (байты)
+        self.traced_peak = 0
+
+
+# Открытые замеры: tracemalloc.reset_peak() во вложенном замере (например, файла внутри этапа
+# чтения) сбрасывает общий пик, поэтому перед сбросом он переносится во все открытые замеры
+_open_measurements = []
+_open_lock = threading.Lock()
+
+
+def measure_start():
+    """Начало замера (для measure_stop); замеры можно вкладывать друг в друга"""
+    measurement = _Measurement()
+    with _open_lock:
+        if tracemalloc.is_tracing():
+            peak = tracemalloc.get_traced_memory()[1]
+            for outer in _open_measurements:
+                outer.traced_peak = max(outer.traced_peak, peak)
+            tracemalloc.reset_peak()
+        _open_measurements.append(measurement)
+    return measurement
+
+
+def measure_stop(start, record):
+    """
+    Дописывает в record время, прошедшее с measure_start, наибольший объём памяти процесса
+    за замер (peak_rss_mb), объём в конце замера (rss_mb) и его изменение за замер (rss_delta_mb),
+    а при включенном tracemalloc - пик памяти Python-объектов за замер (tracemalloc_peak_mb)
+    """
+    record['wall_s'] = round(time.perf_counter() - start.wall, 4)
+    record['cpu_s'] = round(time.process_time() - start.cpu, 4)
+    with _open_lock:
+        if start in _open_measurements:
+            _open_measurements.remove(start)
+        if tracemalloc.is_tracing():
+            peak = max(start.traced_peak, tracemalloc.get_traced_memory()[1])
+            record['tracemalloc_peak_mb'] = round(peak / (1024 * 1024), 1)
+    if start.sampler is not None:
+        record['peak_rss_mb'] = round(start.sampler.stop(), 1)
+    rss = current_rss_mb()
+    if rss is not None:
+        record['rss_mb'] = round(rss, 1)
+        if start.rss is not None:
+            record['rss_delta_mb'] = round(rss - start.rss, 1)
+    return record
+
+
+class MergeProfile:
+    """
+    Замеры одного объединения.
+
+    Этап замеряется контекстным менеджером stage(name, ...): в запись попадают дополнительные поля
+    (файл, лист, число строк), время и память. Замеры файлов из процессов чтения добавляются add().
+    Пик памяти процесса за этап замеряется всегда; trace_memory дополнительно включает tracemalloc:
+    пик памяти Python-объектов на каждом этапе (замедляет работу).
+    Наибольший объём памяти процесса с момента запуска записывается только в итог (stage 'total',
+    поле process_peak_rss_mb): в долго работающей программе он не относится к этому объединению.
+    """
+
+    def __init__(self, path=None, trace_memory=False):
+        self.path = path or default_profile_path()
+        self.trace_memory = trace_memory
+        self.run = uuid.uuid4().hex[:12]
+        self.records = []
+        self._started_tracing = False
+        self._total = None
+
+    def begin(self):
+        """Начало объединения"""
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._total = measure_start()
+
+    def add(self, record):
+        record = dict(record, run=self.run)
+        self.records.append(record)
+        return record
+
+    @contextmanager
+    def stage(self, name, **fields):
+        """Замер этапа; выдает запись, в которую этап может дописать поля (например, rows)"""
+        record = dict(stage=name, **fields)
+        start = measure_start()
+        try:
+            yield record
+        finally:
+            self.add(measure_stop(start, record))
+
+    def finish(self, status='ok'):
+        """Завершает замеры и дописывает их в файл; возвращает путь файла (None при ошибке записи)"""
+        if self._total is not None:
+            record = measure_stop(self._total, {'stage': 'total', 'status': status})
+            peak = lifetime_peak_rss_mb()
+            if peak is not None:
+                record['process_peak_rss_mb'] = round(peak, 1)
+            self.add(record)
+            self._total = None
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+        written = datetime.datetime.now().isoformat(timespec='seconds')
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as profile_file:
+                for record in self.records:
+                    profile_file.write(json.dumps(dict(record, written=written), ensure_ascii=False) + "\n")
+        except OSError as e:
+            logging.warning(f"Не удалось записать замеры объединения в {self.path}: {e}")
+            return None
+        logging.info(f"Замеры объединения ({len(self.records)} записей) записаны в {self.path}")
+        return self.path
+
+    def summary(self):
+        """
+        Строки сводки (этап, время с, ЦП с, пик памяти МБ, изменение памяти МБ, пик Python МБ)
+        в порядке завершения этапов. Пик памяти - наибольший объём памяти процесса за этап (если его
+        не удалось замерить - объём в конце этапа), изменение - прирост объёма за этап, пик Python -
+        пик tracemalloc за этап (None без trace_memory). Все значения относятся к этапу.
+        """
+        rows = []
+        for record in self.records:
+            title = STAGE_TITLES.get(record['stage'], record['stage'])
+            detail = record.get('file') or record.get('sheet')
+            if detail:
+                title = f"{title}: {os.path.basename(str(detail))}"
+            memory = record.get('peak_rss_mb', record.get('rss_mb'))
+            rows.append((title, record.get('wall_s'), record.get('cpu_s'), memory, record.get('rss_delta_mb'),
+                         record.get('tracemalloc_peak_mb')))
+        return rows
+
+    def process_peak_mb(self):
+        """Наибольший объём памяти процесса с момента запуска (из итога) или None"""
+        for record in reversed(self.records):
+            if record['stage'] == 'total':
+                return record.get('process_peak_rss_mb')
+        return None
+
+    def summary_text(self):
+        """Сводка текстовой таблицей (для пакетного режима)"""
+        header = f"{'Этап':<48}{'время, с':>10}{'ЦП, с':>10}{'пик, МБ':>10}{'прирост, МБ':>13}"
+        lines = [header + (f"{'Python, МБ':>12}" if self.trace_memory else "")]
+        for title, wall, cpu, memory, delta, traced in self.summary():
+            line = (f"{title[:47]:<48}{_number(wall):>10}{_number(cpu):>10}{_number(memory, 1):>10}"
+                    f"{_number(delta, 1):>13}")
+            lines.append(line + (f"{_number(traced, 1):>12}" if self.trace_memory else ""))
+        peak = self.process_peak_mb()
+        if peak is not None:
+            lines.append(f"Пик памяти процесса с момента запуска: {peak:.1f} МБ")
+        return "\n".join(lines)
+
+
+def _number(value, digits=2):
+    return "" if value is None else f"{value:.{digits}f}"
@@ -0,0 +1,733 @@
+import os
+import re
+import sys
+import json
+import hashlib
+import logging
+import zipfile
+import posixpath
+import xml.etree.ElementTree as ET
+from datetime import date, datetime, time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+from pandas.io.parsers import TextParser
+
+from analytics_ui.file_cache import DiskCache
+from analytics_ui.profiling import measure_start, measure_stop
+
+try:
+    from python_calamine import CalamineWorkbook
+    HAS_CALAMINE = True
+except ImportError:
+    HAS_CALAMINE = False
+
+
+# Значения ошибок Excel, которые pandas читает как NaN
+XLSX_ERROR_CODES = frozenset(('#NULL!', '#DIV/0!', '#VALUE!', '#REF!', '#NAME?', '#NUM!', '#N/A'))
+
+# Наибольший размер буфера столбца, выделяемого заранее по размеру листа (строк)
+XLSX_MAX_PREALLOCATED_ROWS = 1 << 20
+
+# Сколько последних байт XML листа .xlsx просматривает probe_excel в поиске последней строки
+XLSX_PROBE_TAIL_BYTES = 1 << 18
+
+# Ячейка XML листа .xlsx (атрибуты и содержимое), её атрибуты r/t и значение
+XLSX_CELL_PATTERN = re.compile(rb'<(?:\w+:)?c\b([^>]*?)(?:/>|>(.*?)</(?:\w+:)?c>)', re.S)
+XLSX_CELL_ATTRIBUTE_PATTERN = re.compile(rb'\b(r|t)="([^"]*)"')
+XLSX_CELL_VALUE_PATTERN = re.compile(rb'<(?:\w+:)?v>([^<]*)</(?:\w+:)?v>')
+
+# Типы связей пакета .xlsx (окончания URI типа: в Strict OOXML пространство имён другое)
+XLSX_OFFICE_DOCUMENT = '/officeDocument'
+XLSX_WORKSHEET = '/worksheet'
+XLSX_SHARED_STRINGS = '/sharedStrings'
+
+# Ошибки разбора пакета .xlsx, при которых probe_excel ищет последнюю строку просмотром столбца
+XLSX_PACKAGE_ERRORS = (KeyError, IndexError, ValueError, StopIteration, zipfile.BadZipFile, ET.ParseError)
+
+
+# Движки чтения Excel: auto - самый быстрый из установленных, calamine - python-calamine (Rust)
+# для .xlsx и .xls, openpyxl - openpyxl для .xlsx и xlrd для .xls
+READER_AUTO = 'auto'
+READER_CALAMINE = 'calamine'
+READER_OPENPYXL = 'openpyxl'
+READERS = (READER_AUTO, READER_CALAMINE, READER_OPENPYXL)
+DEFAULT_READER = READER_AUTO
+
+
+class MergeCancelled(Exception):
+    """Объединение отменено пользователем"""
+
+
+def default_read_workers():
+    """Число процессов чтения по умолчанию (не больше 8)"""
+    return max(1, min(os.cpu_count() or 1, 8))
+
+
+def excel_engine(file_path):
+    """Движок pandas для чтения файла: openpyxl для .xlsx, xlrd для .xls"""
+    return 'openpyxl' if file_path.endswith('.xlsx') else 'xlrd'
+
+
+def available_readers():
+    """Установленные движки чтения, от быстрого к медленному"""
+    return [READER_CALAMINE, READER_OPENPYXL] if HAS_CALAMINE else [READER_OPENPYXL]
+
+
+def resolve_reader(reader=None):
+    """
+    Движок чтения для reader: auto (или None) - самый быстрый из установленных.
+    Неизвестный или не установленный движок - ValueError.
+    """
+    if reader is None or reader == READER_AUTO:
+        return available_readers()[0]
+    if reader not in READERS:
+        raise ValueError(f"неизвестный движок чтения {reader} (допустимы: {', '.join(READERS)})")
+    if reader not in available_readers():
+        raise ValueError(f"движок чтения {reader} не установлен (pip install python-calamine)")
+    return reader
+
+
+def column_selector(rename_rules, allowed_columns):
+    """
+    Возвращает функцию отбора исходных столбцов: столбец нужен, если его имя
+    после переименования входит в allowed_columns.
+    """
+    def select(column):
+        return rename_rules.get(column, column) in allowed_columns
+    return select
+
+
+def selection_key(rename_rules, allowed_columns, time_window=None):
+    """Короткий ключ набора отбираемых столбцов и временного окна (для записи кэша сессии)"""
+    spec = json.dumps(
+        [sorted(allowed_columns), sorted(rename_rules.items()), time_window or []],
+        ensure_ascii=False, default=str
+    )
+    return hashlib.sha1(spec.encode('utf-8')).hexdigest()[:16]
+
+
+def apply_time_window(df, time_window):
+    """
+    Оставляет строки, у которых время в первом столбце попадает в окно (start, end).
+    Номера строк (индекс) сохраняются: если не во всех файлах есть столбец времени,
+    align_frames объединяет строки по этим номерам, и строки окна остаются на своих местах.
+    Если первый столбец не является временем, строки не фильтруются.
+    """
+    if not time_window or df.empty:
+        return df
+    start, end = time_window
+    if start is None and end is None:
+        return df
+
+    time_col = df.iloc[:, 0]
+    if not pd.api.types.is_datetime64_any_dtype(time_col):
+        return df
+
+    mask = time_col.notna()
+    if start is not None:
+        mask &= time_col >= start
+    if end is not None:
+        mask &= time_col <= end
+    if mask.all():
+        return df
+    return df[mask]
+
+
+def _convert_xlsx_value(value):
+    """Приводит значение ячейки openpyxl к виду, который даёт pandas.read_excel"""
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        if value.is_integer():
+            return int(value)
+    elif isinstance(value, str) and value in XLSX_ERROR_CODES:
+        return np.nan
+    return value
+
+
+def _parse_object_column(name, values):
+    """Определяет тип нечислового столбца тем же разборщиком pandas, что и read_excel"""
+    return TextParser([[name]] + [[value] for value in values], header=0, skip_blank_lines=False).read().iloc[:, 0]
+
+
+class _ColumnBuffer:
+    """
+    Буфер значений одного столбца при потоковом чтении.
+
+    Пока в столбце встречаются только числа и пустые ячейки, значения копятся в заранее
+    выделенном массиве float64 (пустые - NaN), который растёт удвоением. При первом
+    нечисловом значении (время, текст, логическое) буфер переходит в список объектов.
+    """
+
+    __slots__ = ('numbers', 'objects', 'size', 'missing')
+
+    def __init__(self, capacity):
+        self.numbers = np.empty(capacity, dtype=np.float64)
+        self.objects = None
+        self.size = 0
+        self.missing = False
+
+    def append(self, value):
+        kind = type(value)
+        if self.objects is None:
+            if kind is float or kind is int:
+                if self.size == len(self.numbers):
+                    self.numbers = np.resize(self.numbers, max(16, 2 * len(self.numbers)))
+                self.numbers[self.size] = value
+                self.size += 1
+                return
+            if value is None or value == "" or (kind is str and value in XLSX_ERROR_CODES):
+                if self.size == len(self.numbers):
+                    self.numbers = np.resize(self.numbers, max(16, 2 * len(self.numbers)))
+                self.numbers[self.size] = np.nan
+                self.size += 1
+                self.missing = True
+                return
+            self._to_objects()
+        self.objects.append(_convert_xlsx_value(value))
+        self.size += 1
+
+    def _to_objects(self):
+        """Переводит накопленные числа в список объектов (целые значения - в int, как pandas)"""
+        objects = []
+        for number in self.numbers[:self.size].tolist():
+            if number != number:  # NaN
+                objects.append("")
+            elif number.is_integer():
+                objects.append(int(number))
+            else:
+                objects.append(number)
+        self.objects = objects
+        self.numbers = None
+
+    def truncate(self, size):
+        self.size = min(self.size, size)
+        if self.objects is not None:
+            del self.objects[size:]
+
+    def to_series(self, name):
+        if self.objects is not None:
+            return _parse_object_column(name, self.objects)
+        values = self.numbers[:self.size].copy()
+        # Как pandas: без пропусков и только с целыми значениями столбец получает тип int64
+        if not self.missing and np.all(np.isfinite(values)) and np.all(values == np.floor(values)) \
+                and np.all(np.abs(values) < 2 ** 53):
+            return pd.Series(values.astype(np.int64))
+        return pd.Series(values)
+
+
+def _header_names(row):
+    """Имена столбцов по строке заголовка - те же, что даёт pandas.read_excel (Unnamed: N, повторы .1)"""
+    header_row = [_convert_xlsx_value(value) for value in row]
+    while header_row and header_row[-1] == "":
+        header_row.pop()
+    if not header_row:
+        return []
+    return list(TextParser([header_row], header=0).read().columns)
+
+
+def read_rows(rows, capacity=16, select=None, time_window=None):
+    """
+    Собирает DataFrame из строк листа (кортежей значений ячеек, первая строка - заголовок)
+    с отбором столбцов и строк.
+
+    Строки раскладываются по буферам столбцов (_ColumnBuffer): числовые столбцы хранятся
+    в массивах NumPy. Строки, время которых (первый столбец) вне окна, пропускаются. Если время
+    в файле возрастает (видно уже по двум разным отметкам) и до сих пор не убывало, чтение
+    прекращается на первой строке позже конца окна; в выгрузках от новых записей к старым
+    строки позже конца окна просто пропускаются.
+    Значения и типы столбцов совпадают с pandas.read_excel. Индекс результата - номера строк
+    данных в файле. capacity - ожидаемое число строк (только подсказка для буферов).
+    """
+    start, end = time_window or (None, None)
+    start = start.to_pydatetime() if start is not None else None
+    end = end.to_pydatetime() if end is not None else None
+
+    names = _header_names(next(rows, ()))
+    if not names:
+        return pd.DataFrame()
+
+    positions = [
+        i for i, name in enumerate(names)
+        if i == 0 or name == 'Время' or select is None or select(name)
+    ]
+    buffers = [_ColumnBuffer(capacity) for _ in positions]
+    columns = list(zip(positions, buffers))
+
+    index = []
+    last_row_with_data = -1
+    previous_time = None
+    # Порядок времени в файле: None - пока не известен (меньше двух разных отметок),
+    # True - по возрастанию, False - встретилось убывание (например, выгрузка от новых к старым)
+    ascending = None
+
+    for row_number, row in enumerate(rows):
+        timestamp = row[0] if row else None
+        if isinstance(timestamp, datetime):
+            if previous_time is not None:
+                if timestamp < previous_time:
+                    ascending = False
+                elif timestamp > previous_time and ascending is None:
+                    ascending = True
+            previous_time = timestamp
+            if end is not None and timestamp > end:
+                if ascending:
+                    break
+                continue
+            if start is not None and timestamp < start:
+                continue
+
+        if any(value is not None and value != "" for value in row):
+            last_row_with_data = row_number
+        width = len(row)
+        for position, buffer in columns:
+            buffer.append(row[position] if position < width else None)
+        index.append(row_number)
+
+    # Как pandas, отбрасываем пустые строки в конце листа
+    keep = sum(1 for row_number in index if row_number <= last_row_with_data)
+    del index[keep:]
+
+    data = {}
+    for position, buffer in columns:
+        buffer.truncate(keep)
+        data[position] = buffer.to_series(names[position])
+    df = pd.DataFrame(data)
+    df.columns = [names[position] for position in positions]
+    df.index = pd.Index(index, dtype=np.int64)
+    return apply_time_window(df, time_window)
+
+
+def read_xlsx(file_path, select=None, time_window=None):
+    """
+    Потоковое чтение .xlsx (openpyxl, режим read_only) с отбором столбцов и строк (см. read_rows).
+    Строки читаются по одной, модель ячеек всей книги не строится.
+    """
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet = workbook.worksheets[0]
+        # Размер листа из файла (может отсутствовать или быть неверным) - только подсказка для буферов
+        capacity = min(max((sheet.max_row or 0) - 1, 16), XLSX_MAX_PREALLOCATED_ROWS)
+        sheet.reset_dimensions()
+        return read_rows(sheet.iter_rows(values_only=True), capacity, select, time_window)
+    finally:
+        workbook.close()
+
+
+def _calamine_rows(sheet):
+    """
+    Строки листа python-calamine в виде, который даёт openpyxl: даты без времени - datetime
+    (openpyxl возвращает datetime для любой ячейки с форматом даты)
+    """
+    for row in sheet.iter_rows():
+        yield [datetime.combine(value, time()) if type(value) is date else value for value in row]
+
+
+def read_calamine(file_path, select=None, time_window=None):
+    """
+    Чтение .xlsx и .xls через python-calamine (разбор на Rust) с отбором столбцов и строк
+    (см. read_rows). Результат совпадает с read_xlsx и чтением .xls через xlrd.
+    """
+    workbook = CalamineWorkbook.from_path(file_path)
+    sheet = workbook.get_sheet_by_index(0)
+    capacity = min(max(sheet.total_height - 1, 16), XLSX_MAX_PREALLOCATED_ROWS)
+    return read_rows(_calamine_rows(sheet), capacity, select, time_window)
+
+
+def read_excel(file_path, select=None, time_window=None, reader=None):
+    """
+    Читает Excel файл с поддержкой обоих форматов .xls и .xlsx.
+    Если задана функция отбора select(имя столбца), разбираются только нужные столбцы,
+    первый столбец (время) и столбец 'Время'. Если задано временное окно (start, end),
+    строки вне окна отбрасываются (для .xlsx - уже при чтении).
+    reader - движок чтения (READERS, по умолчанию самый быстрый из установленных):
+    calamine читает оба формата потоково (read_calamine), openpyxl - .xlsx потоково (read_xlsx),
+    а .xls - через pandas и xlrd.
+    """
+    if resolve_reader(reader) == READER_CALAMINE:
+        return read_calamine(file_path, select, time_window)
+
+    engine = excel_engine(file_path)
+    if engine == 'openpyxl':
+        return read_xlsx(file_path, select, time_window)
+
+    if select is None:
+        df = pd.read_excel(file_path, engine=engine)
+    else:
+        with pd.ExcelFile(file_path, engine=engine) as excel_file:
+            header = excel_file.parse(nrows=0).columns
+            positions = [i for i, name in enumerate(header) if i == 0 or name == 'Время' or select(name)]
+            df = excel_file.parse(usecols=positions)
+    return apply_time_window(df, time_window)
+
+
+class FileProbe:
+    """
+    Сведения о входном файле без полного чтения (probe_excel): имена столбцов (как у read_excel),
+    число строк данных и время первой и последней строки (первый столбец; None, если там не даты).
+    """
+
+    def __init__(self, file_path, columns, rows, first_time=None, last_time=None):
+        self.file_path = file_path
+        self.columns = columns
+        self.rows = rows
+        self.first_time = pd.Timestamp(first_time) if isinstance(first_time, datetime) else None
+        self.last_time = pd.Timestamp(last_time) if isinstance(last_time, datetime) else None
+
+    def time_range(self):
+        """(начало, конец) по первой и последней строке или None, если времени в файле нет"""
+        times = [value for value in (self.first_time, self.last_time) if value is not None]
+        return (min(times), max(times)) if times else None
+
+    def to_dict(self):
+        """Сведения для сохранения в JSON (ColumnInventory)"""
+        return {
+            'columns': [str(name) for name in self.columns],
+            'rows': self.rows,
+            'first_time': self.first_time.isoformat() if self.first_time is not None else None,
+            'last_time': self.last_time.isoformat() if self.last_time is not None else None,
+        }
+
+    @classmethod
+    def from_dict(cls, file_path, info):
+        times = [pd.Timestamp(info[key]).to_pydatetime() if info.get(key) else None
+                 for key in ('first_time', 'last_time')]
+        return cls(file_path, info['columns'], info['rows'], *times)
+
+
+def _local_name(tag):
+    """Имя элемента XML без пространства имён"""
+    return tag.rsplit('}', 1)[-1]
+
+
+def _xlsx_relationships(archive, part):
+    """
+    Связи части part пакета .xlsx (part='' - сам пакет): {Id: (тип, путь части в архиве)}.
+    Внешние связи (ссылки на другие файлы) пропускаются.
+    """
+    folder, name = posixpath.split(part)
+    root = ET.fromstring(archive.read(posixpath.join(folder, '_rels', name + '.rels')))
+    relationships = {}
+    for rel in root:
+        if rel.get('TargetMode') == 'External':
+            continue
+        target = rel.get('Target', '')
+        path = target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join(folder, target))
+        relationships[rel.get('Id')] = (rel.get('Type', ''), path)
+    return relationships
+
+
+def _xlsx_first_sheet(archive):
+    """
+    (путь XML первого листа, путь таблицы общих строк или None) по связям пакета .xlsx:
+    _rels/.rels -> книга -> её связи. Листы диаграмм пропускаются, как в pandas/openpyxl.
+    """
+    package = _xlsx_relationships(archive, '')
+    workbook_path = next(path for kind, path in package.values() if kind.endswith(XLSX_OFFICE_DOCUMENT))
+    relationships = _xlsx_relationships(archive, workbook_path)
+    shared_strings = next((path for kind, path in relationships.values() if kind.endswith(XLSX_SHARED_STRINGS)),
+                          None)
+
+    workbook = ET.fromstring(archive.read(workbook_path))
+    for element in workbook.iter():
+        if _local_name(element.tag) != 'sheet':
+            continue
+        rel_id = next(value for key, value in element.attrib.items() if _local_name(key) == 'id')
+        kind, path = relationships[rel_id]
+        if kind.endswith(XLSX_WORKSHEET):
+            return path, shared_strings
+    raise ValueError("в книге нет листов")
+
+
+def _xlsx_shared_string(archive, path, index):
+    """Строка index таблицы общих строк (текст всех фрагментов, без фонетических подсказок)"""
+    with archive.open(path) as xml:
+        number = 0
+        for _, element in ET.iterparse(xml):
+            if _local_name(element.tag) != 'si':
+                continue
+            if number == index:
+                parts = []
+                for child in element:
+                    if _local_name(child.tag) == 't':
+                        parts.append(child.text or '')
+                    elif _local_name(child.tag) == 'r':
+                        parts.extend(t.text or '' for t in child if _local_name(t.tag) == 't')
+                return ''.join(parts)
+            number += 1
+            element.clear()
+    raise IndexError(f"нет общей строки {index}")
+
+
+def _xlsx_last_cell(file_path):
+    """
+    Последняя ячейка первого столбца первого листа со значением: (номер строки, значение) по концу
+    XML листа без разбора всего листа. Лист находится по связям пакета (zipfile), без внутренних
+    структур openpyxl. Числа - float, общие строки - str; (None, None), если в конце листа
+    такой ячейки нет. Ошибки разбора пакета - XLSX_PACKAGE_ERRORS.
+    """
+    with zipfile.ZipFile(file_path) as archive:
+        sheet_path, shared_strings = _xlsx_first_sheet(archive)
+        tail = b''
+        with archive.open(sheet_path) as xml:
+            while True:
+                chunk = xml.read(1 << 20)
+                if not chunk:
+                    break
+                tail = (tail + chunk)[-XLSX_PROBE_TAIL_BYTES:]
+
+        found = None
+        for match in XLSX_CELL_PATTERN.finditer(tail):
+            attributes = dict(XLSX_CELL_ATTRIBUTE_PATTERN.findall(match.group(1)))
+            reference = attributes.get(b'r', b'')
+            if not reference.startswith(b'A') or not reference[1:].isdigit():
+                continue
+            value = XLSX_CELL_VALUE_PATTERN.search(match.group(2) or b'')
+            if value is not None:
+                found = int(reference[1:]), attributes.get(b't', b'n'), value.group(1)
+        if found is None:
+            return None, None
+
+        row_number, kind, text = found
+        if kind == b's':
+            if shared_strings is None:
+                raise KeyError("нет таблицы общих строк")
+            return row_number, _xlsx_shared_string(archive, shared_strings, int(text))
+    if kind == b'n':
+        return row_number, float(text)
+    return row_number, text.decode('utf-8')
+
+
+def _probe_xlsx(file_path):
+    """probe_excel для .xlsx: две первые строки через openpyxl и последняя строка из конца XML листа"""
+    import openpyxl
+    from openpyxl.utils.datetime import from_excel
+
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet = workbook.worksheets[0]
+        rows = sheet.iter_rows(max_row=2, values_only=True)
+        columns = _header_names(next(rows, ()))
+        first_row = next(rows, None)
+        first_time = first_row[0] if first_row else None
+
+        try:
+            row_number, last_time = _xlsx_last_cell(file_path)
+        except XLSX_PACKAGE_ERRORS as e:
+            logging.info(f"Не удалось разобрать конец листа {file_path}: {e!r}")
+            row_number, last_time = None, None
+        if row_number is None:
+            # Ячейки с номерами строк нет в конце листа - просматриваем первый столбец целиком
+            logging.info(f"Последняя строка не найдена в конце листа, просмотр первого столбца: {file_path}")
+            for number, (value,) in enumerate(sheet.iter_rows(max_col=1, values_only=True), start=1):
+                if value is not None and value != "":
+                    row_number, last_time = number, value
+        elif isinstance(first_time, datetime) and isinstance(last_time, float):
+            # Тип ячейки (дата) определяется её форматом; первый столбец форматирован одинаково
+            last_time = from_excel(last_time, workbook.epoch)
+    finally:
+        workbook.close()
+    return FileProbe(file_path, columns, max((row_number or 1) - 1, 0), first_time, last_time)
+
+
+def _probe_rows(file_path, rows):
+    """probe_excel по строкам листа: заголовок, первое и последнее значение первого столбца"""
+    columns = _header_names(next(rows, ()))
+    first_time = last_time = None
+    count = 0
+    for number, row in enumerate(rows, start=1):
+        value = row[0] if row else None
+        if value is None or value == "":
+            continue
+        if first_time is None:
+            first_time = value
+        last_time = value
+        count = number
+    return FileProbe(file_path, columns, count, first_time, last_time)
+
+
+def probe_excel(file_path, reader=None):
+    """
+    Быстрые сведения о файле (FileProbe) без разбора всех ячеек: для .xlsx читаются две первые
+    строки и конец XML листа, .xls просматривается движком reader (calamine или xlrd)
+    только по первому столбцу.
+    """
+    if excel_engine(file_path) == 'openpyxl':
+        return _probe_xlsx(file_path)
+
+    if resolve_reader(reader) == READER_CALAMINE:
+        sheet = CalamineWorkbook.from_path(file_path).get_sheet_by_index(0)
+        return _probe_rows(file_path, _calamine_rows(sheet))
+
+    import xlrd
+
+    book = xlrd.open_workbook(file_path, on_demand=True)
+    try:
+        sheet = book.sheet_by_index(0)
+
+        def rows():
+            # Заголовок целиком, из остальных строк - только первый столбец
+            if sheet.nrows:
+                yield sheet.row_values(0)
+            for row in range(1, sheet.nrows):
+                cell = sheet.cell(row, 0)
+                if cell.ctype == xlrd.XL_CELL_DATE:
+                    yield [xlrd.xldate.xldate_as_datetime(cell.value, book.datemode)]
+                else:
+                    yield [cell.value]
+
+        return _probe_rows(file_path, rows())
+    finally:
+        book.release_resources()
+
+
+def load_excel(file_path, disk_cache=None, rename_rules=None, allowed_columns=None, time_window=None, reader=None):
+    """
+    Читает Excel файл, используя дисковый кэш (если он передан).
+    В кэше хранится одна полная копия файла на хэш содержимого: смена набора столбцов или периода
+    не требует повторного разбора книги, отбор выполняет prepare_frame после чтения из кэша.
+    Без кэша при заданных правилах переименования и допустимых столбцах читаются только нужные
+    столбцы, а при заданном временном окне - только строки внутри него.
+    reader - движок чтения (см. read_excel); результат от него не зависит, поэтому записи кэша
+    общие для всех движков.
+    """
+    if disk_cache is not None:
+        df = disk_cache.get(file_path)
+        if df is not None:
+            logging.info(f"Файл взят из дискового кэша: {file_path}")
+            return df
+        df = read_excel(file_path, reader=reader)
+        disk_cache.put(file_path, df)
+        return df
+
+    select = None
+    if allowed_columns is not None:
+        select = column_selector(rename_rules or {}, allowed_columns)
+    return read_excel(file_path, select, time_window, reader)
+
+
+def remove_empty_columns(df):
+    """Удаляет пустые столбцы из DataFrame"""
+    # Удаляем столбцы, где все значения NaN
+    empty_cols = df.columns[df.isna().all()].tolist()
+    if empty_cols:
+        df = df.drop(columns=empty_cols)
+    return df
+
+
+def prepare_frame(df, file_path, is_first, rename_rules, allowed_columns, time_window=None):
+    """
+    Подготавливает прочитанный файл к объединению: оставляет строки временного окна,
+    удаляет пустые столбцы, отделяет столбец времени, переименовывает столбцы и оставляет
+    только допустимые. Возвращает (столбец времени или None, подготовленный DataFrame);
+    по столбцам времени файлы затем сопоставляются друг с другом (align_frames).
+    """
+    df = apply_time_window(df, time_window)
+
+    # Удаляем пустые столбцы из каждого файла. Если в окне нет ни одной строки, пусты все столбцы -
+    # они сохраняются, чтобы остался столбец времени (отсутствие данных сообщает run_merge)
+    if not df.empty:
+        df = remove_empty_columns(df)
+
+    time_column = None
+    if is_first:
+        # В первом файле временной столбец задает шкалу времени отчёта
+        time_column = df.iloc[:, 0]  # Предполагаем, что первый столбец - время
+        df = df.iloc[:, 1:]  # Берем все столбцы кроме временного
+    else:
+        # В остальных файлах отделяем временной столбец, если он есть
+        if 'Время' in df.columns:
+            time_column = df['Время']
+            df = df.drop(columns=['Время'])
+        elif pd.api.types.is_datetime64_any_dtype(df.iloc[:, 0]):
+            # Если первый столбец похож на время (содержит даты или время), отделяем его
+            time_column = df.iloc[:, 0]
+            df = df.iloc[:, 1:]
+        else:
+            logging.warning(
+                f"Файл '{os.path.basename(file_path)}': не найден явный столбец времени для удаления"
+            )
+
+    if rename_rules:
+        # Переименовываем столбцы согласно правилам
+        df = df.rename(columns=rename_rules)
+
+    # Оставляем только столбцы, соответствующие выбранным параметрам и узлам
+    columns_to_keep = [col for col in df.columns if col in allowed_columns]
+    df = df[columns_to_keep]
+
+    return time_column, df
+
+
+def _read_task(task):
+    """
+    Задача процесса чтения: читает из файла только нужные столбцы и сразу подготавливает их,
+    чтобы в основной процесс передавались только отобранные столбцы.
+    Вместе с данными возвращает замер чтения файла (время и память процесса чтения).
+    """
+    file_path, is_first, rename_rules, allowed_columns, time_window, cache_dir, reader = task
+    record = {'stage': 'read_file', 'file': file_path}
+    start = measure_start()
+    try:
+        disk_cache = DiskCache(cache_dir) if cache_dir else None
+        df = load_excel(file_path, disk_cache, rename_rules, allowed_columns, time_window, reader)
+        source_columns = list(df.columns)
+        time_column, df = prepare_frame(df, file_path, is_first, rename_rules, allowed_columns, time_window)
+        record.update(rows=len(df), columns=len(df.columns))
+    finally:
+        # Замер закрывается и при ошибке чтения: иначе остался бы поток замера памяти
+        stats = measure_stop(start, dict(record, pid=os.getpid()))
+    return time_column, df, source_columns, stats
+
+
+def can_use_process_pool():
+    """В собранном PyInstaller exe процессы не используются - чтение идёт последовательно"""
+    return not getattr(sys, 'frozen', False)
+
+
+def read_files_parallel(tasks, workers, progress=None, should_stop=None):
+    """
+    Выполняет задачи чтения (_read_task) в пуле процессов.
+    Результаты возвращаются в порядке задач. При workers <= 1, одной задаче,
+    запуске из exe или сбое пула чтение выполняется последовательно.
+
+    progress(done, total) вызывается после каждого прочитанного файла;
+    если should_stop() возвращает True, оставшиеся задачи отменяются и выбрасывается MergeCancelled.
+    """
+    def report(done):
+        if progress is not None:
+            progress(done, len(tasks))
+        if should_stop is not None and should_stop():
+            raise MergeCancelled()
+
+    if workers > 1 and len(tasks) > 1 and can_use_process_pool():
+        try:
+            executor = ProcessPoolExecutor(max_workers=min(workers, len(tasks)))
+        except (OSError, ValueError, NotImplementedError) as e:
+            logging.warning(f"Пул процессов недоступен, файлы читаются последовательно: {e}")
+        else:
+            with executor:
+                futures = [executor.submit(_read_task, task) for task in tasks]
+                results = []
+                try:
+                    for future in futures:
+                        results.append(future.result())
+                        report(len(results))
+                    return results
+                except BrokenProcessPool as e:
+                    logging.warning(f"Пул процессов завершился аварийно, файлы читаются последовательно: {e}")
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+
+    results = []
+    for task in tasks:
+        results.append(_read_task(task))
+        report(len(results))
+    return results
@@ -0,0 +1,1007 @@
+import logging
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from analytics_ui.rules import compile_rules
+
+# Символы столбцов стрелок по направлению выхода за диапазон: -1 -> ↓, 0 -> пусто, 1 -> ↑
+ARROW_SYMBOLS = np.array(['↓', '', '↑'], dtype=object)
+
+# Раскраска ячеек листа Данные: условным форматированием Excel или готовыми форматами ячеек
+COLOR_MODE_CONDITIONAL = 'conditional'  # правила пересчитывает Excel при открытии и прокрутке
+COLOR_MODE_STATIC = 'static'            # цвет каждой ячейки вычисляется при записи отчёта
+COLOR_MODES = (COLOR_MODE_CONDITIONAL, COLOR_MODE_STATIC)
+DEFAULT_COLOR_MODE = COLOR_MODE_CONDITIONAL
+
+# Цвета раскраски данных (общие для обоих способов)
+ZERO_COLOR = '#FFFFFF'         # значение 0 - без цвета
+LIMIT_COLOR = '#FFC7CE'        # вне пределов qmin/qmax
+LIMIT_FONT_COLOR = '#9C0006'
+SCALE_LOW_COLOR = '#FFFF00'    # шкала в пределах: от желтого
+SCALE_HIGH_COLOR = '#92D050'   # до зеленого
+SCALE_MIN_COLOR = '#FF0000'    # шкала столбца без пределов: красный - желтый - зеленый
+
+# Число оттенков в каждой части цветовой шкалы при статической раскраске
+STATIC_SCALE_STEPS = 16
+
+# Строк данных, которые построчная запись (write_data_rows) берет из DataFrame за один раз
+DATA_CHUNK_ROWS = 1024
+
+# Лист данных: имя, первая строка данных (под тремя строками заголовка) и пределы листа Excel
+DATA_SHEET_NAME = 'Данные'
+DATA_FIRST_ROW = 3
+EXCEL_MAX_ROWS = 1048576
+EXCEL_MAX_COLUMNS = 16384
+
+
+def get_column_letter(col_idx):
+    """Преобразует числовой индекс столбца в буквенное обозначение Excel"""
+    result = ""
+    while col_idx > 0:
+        col_idx, remainder = divmod(col_idx - 1, 26)
+        result = chr(65 + remainder) + result
+    return result
+
+
+class FormatRegistry:
+    """
+    Набор форматов xlsxwriter одной книги без повторов.
+
+    Формат с одинаковыми свойствами создается один раз и затем переиспользуется всеми
+    листами отчёта, поэтому styles.xml не разрастается от одинаковых форматов каждого столбца.
+    """
+
+    def __init__(self, workbook):
+        self.workbook = workbook
+        self._formats = {}
+
+    def __len__(self):
+        return len(self._formats)
+
+    def get(self, properties):
+        """Возвращает формат с заданными свойствами (создает при первом обращении)"""
+        key = tuple(sorted(properties.items()))
+        fmt = self._formats.get(key)
+        if fmt is None:
+            fmt = self.workbook.add_format(properties)
+            self._formats[key] = fmt
+        return fmt
+
+
+def format_registry(writer, formats=None):
+    """Общий набор форматов книги writer: переданный formats или новый"""
+    if formats is not None and formats.workbook is writer.book:
+        return formats
+    return FormatRegistry(writer.book)
+
+
+def column_ranges(columns, first_row, last_row):
+    """Диапазоны ячеек столбцов через пробел ('B4:D100 F4:F100'); соседние столбцы объединяются"""
+    ranges = []
+    columns = sorted(columns)
+    start = prev = columns[0]
+    for col in columns[1:] + [None]:
+        if col is not None and col == prev + 1:
+            prev = col
+            continue
+        ranges.append(
+            f"{get_column_letter(start + 1)}{first_row + 1}:{get_column_letter(prev + 1)}{last_row + 1}"
+        )
+        if col is not None:
+            start = prev = col
+    return ' '.join(ranges)
+
+
+def add_multi_range_format(worksheet, columns, first_row, last_row, options):
+    """Одно правило условного форматирования на строки first_row..last_row нескольких столбцов"""
+    columns = sorted(columns)
+    options = dict(options, multi_range=column_ranges(columns, first_row, last_row))
+    worksheet.conditional_format(first_row, columns[0], last_row, columns[0], options)
+
+
+class DataSheet:
+    """Часть данных на одном листе: строки row_start..row_stop-1 и столбцы columns (позиции в df)"""
+
+    def __init__(self, name, row_start, row_stop, columns):
+        self.name = name
+        self.row_start = row_start
+        self.row_stop = row_stop
+        self.columns = columns
+        self._column_index = {position: i for i, position in enumerate(columns)}
+
+    def frame(self, df):
+        """Данные этого листа"""
+        if self.row_start == 0 and self.row_stop == len(df) and len(self.columns) == len(df.columns):
+            return df
+        return df.iloc[self.row_start:self.row_stop, self.columns]
+
+    def contains(self, row, position):
+        return self.row_start <= row < self.row_stop and position in self._column_index
+
+    def cell_range(self, position, first_row, last_row):
+        """Ссылка на ячейки столбца position строк first_row..last_row df ('Данные_2'!C4:C27)"""
+        col_letter = get_column_letter(self._column_index[position] + 1)
+        start = first_row - self.row_start + DATA_FIRST_ROW + 1
+        end = min(last_row, self.row_stop - 1) - self.row_start + DATA_FIRST_ROW + 1
+        return f"'{self.name}'!{col_letter}{start}:{col_letter}{end}"
+
+
+def _row_splits(df, max_rows):
+    """Границы частей строк не длиннее max_rows; по возможности - на границе суток"""
+    nrows = len(df)
+    if nrows <= max_rows:
+        return [(0, nrows)]
+    day_starts = np.zeros(0, dtype=np.intp)
+    if 'Время' in df.columns and pd.api.types.is_datetime64_any_dtype(df['Время']):
+        days = df['Время'].dt.normalize().to_numpy()
+        day_starts = np.flatnonzero(days[1:] != days[:-1]) + 1
+
+    splits = []
+    start = 0
+    while nrows - start > max_rows:
+        stop = start + max_rows
+        # Последняя граница суток не дальше stop; если сутки длиннее листа - режем по stop
+        k = np.searchsorted(day_starts, stop, side='right') - 1
+        if k >= 0 and day_starts[k] > start:
+            stop = int(day_starts[k])
+        splits.append((start, stop))
+        start = stop
+    splits.append((start, nrows))
+    return splits
+
+
+def _column_splits(df, rules, max_columns):
+    """
+    Группы столбцов данных для листов не шире max_columns (вместе со столбцом Время):
+    столбцы одного узла по возможности остаются на одном листе.
+    """
+    if len(df.columns) <= max_columns:
+        return [list(range(len(df.columns)))]
+    capacity = max_columns - 1
+
+    # Подряд идущие столбцы одного узла
+    runs = []
+    previous_node = None
+    for position in range(1, len(df.columns)):
+        header = str(df.columns[position])
+        base_header = header.split(' ⚠')[0] if ' ⚠' in header else header
+        node = rules.column_to_node.get(base_header, "")
+        if runs and node == previous_node:
+            runs[-1].append(position)
+        else:
+            runs.append([position])
+        previous_node = node
+
+    groups = [[]]
+    for run in runs:
+        while run:
+            if len(groups[-1]) + len(run) > capacity and groups[-1]:
+                groups.append([])
+            free = capacity - len(groups[-1])
+            groups[-1].extend(run[:free])
+            run = run[free:]
+    return [[0] + group for group in groups]
+
+
+def data_sheet_layout(df, rules, max_rows=None, max_columns=None):
+    """
+    Раскладка данных по листам с учетом пределов Excel.
+
+    Если данные помещаются, - один лист 'Данные'. Иначе строки делятся по времени (на границах суток),
+    а столбцы - по группам узлов; каждый лист получает столбец Время, листы называются
+    Данные_1, Данные_2, ... Возвращает список DataSheet.
+    """
+    rules = compile_rules(rules)
+    max_rows = (EXCEL_MAX_ROWS if max_rows is None else max_rows) - DATA_FIRST_ROW
+    max_columns = EXCEL_MAX_COLUMNS if max_columns is None else max_columns
+    row_splits = _row_splits(df, max_rows)
+    column_splits = _column_splits(df, rules, max_columns)
+    if len(row_splits) == 1 and len(column_splits) == 1:
+        return [DataSheet(DATA_SHEET_NAME, 0, len(df), column_splits[0])]
+
+    sheets = []
+    for row_start, row_stop in row_splits:
+        for columns in column_splits:
+            name = f"{DATA_SHEET_NAME}_{len(sheets) + 1}"
+            sheets.append(DataSheet(name, row_start, row_stop, columns))
+    return sheets
+
+
+def locate_data_range(layout, position, first_row, last_row):
+    """Ссылка на ячейки столбца position строк first_row..last_row на листе, где они записаны"""
+    for sheet in layout:
+        if sheet.contains(first_row, position):
+            return sheet.cell_range(position, first_row, last_row)
+    return None
+
+
+def blend_colors(start, end, steps):
+    """steps цветов '#RRGGBB' от start до end с равным шагом (линейно по каналам RGB, как шкала Excel)"""
+    start = np.array([int(start[k:k + 2], 16) for k in (1, 3, 5)], dtype=float)
+    end = np.array([int(end[k:k + 2], 16) for k in (1, 3, 5)], dtype=float)
+    colors = np.rint(start + np.linspace(0, 1, steps)[:, None] * (end - start)).astype(int)
+    return ['#%02X%02X%02X' % tuple(color) for color in colors]
+
+
+def static_color_codes(values, qmin=None, qmax=None, steps=STATIC_SCALE_STEPS):
+    """
+    Код цвета каждого значения столбца для статической раскраски (те же условия, что у правил
+    условного форматирования): -1 - не раскрашивается (пусто), 0 - ноль, 1 - вне пределов,
+    2 + k - k-й оттенок шкалы.
+    С пределами: шкала желтый-зеленый от qmin до qmax из steps оттенков.
+    Без пределов: шкала красный-желтый-зеленый от минимума через медиану к максимуму
+    значений столбца из 2 * steps - 1 оттенков.
+    """
+    values = np.asarray(values, dtype=float)
+    codes = np.full(len(values), -1, dtype=np.int16)
+    numeric = np.isfinite(values)
+    if not numeric.any():
+        return codes
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if qmin is not None and qmax is not None:
+            position = (values - qmin) / (qmax - qmin) if qmax > qmin else np.ones_like(values)
+            levels = steps - 1
+        else:
+            low, mid, high = np.percentile(values[numeric], [0, 50, 100])
+            position = np.where(values <= mid,
+                                0.5 * (values - low) / (mid - low),
+                                0.5 + 0.5 * (values - mid) / (high - mid))
+            levels = 2 * (steps - 1)
+        position = np.nan_to_num(position, nan=0.5)
+
+    codes[numeric] = 2 + np.rint(np.clip(position[numeric], 0, 1) * levels).astype(np.int16)
+    if qmin is not None and qmax is not None:
+        codes[numeric & ((values < qmin) | (values > qmax))] = 1
+    codes[values == 0] = 0
+    return codes
+
+
+def static_color_formats(formats, with_limits, border=False, steps=STATIC_SCALE_STEPS):
+    """Форматы ячеек по кодам static_color_codes: [ноль, вне пределов, оттенки шкалы...]"""
+    if with_limits:
+        palette = blend_colors(SCALE_LOW_COLOR, SCALE_HIGH_COLOR, steps)
+    else:
+        palette = blend_colors(SCALE_MIN_COLOR, SCALE_LOW_COLOR, steps) + \
+            blend_colors(SCALE_LOW_COLOR, SCALE_HIGH_COLOR, steps)[1:]
+    base = {'align': 'center', 'valign': 'vcenter'}
+    if border:
+        base['left'] = 2
+    cell_formats = [
+        formats.get(dict(base, bg_color=ZERO_COLOR)),
+        formats.get(dict(base, bg_color=LIMIT_COLOR, font_color=LIMIT_FONT_COLOR)),
+    ]
+    cell_formats.extend(formats.get(dict(base, bg_color=color)) for color in palette)
+    return cell_formats
+
+
+def numeric_values(values):
+    """Числа столбца как float (нечисловые значения - NaN); None для логического столбца"""
+    if pd.api.types.is_bool_dtype(values):
+        return None
+    return pd.to_numeric(values, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+
+
+def add_conditional_colors(worksheet, formats, zero_columns, limit_groups, scale_columns, last_row):
+    """
+    Раскраска данных условным форматированием. Столбцы с одинаковыми пределами (qmin, qmax)
+    получают общие правила на несколько диапазонов.
+    """
+    # 1. Равен 0 -> нет цвета (белый) - одно правило на все столбцы данных
+    if zero_columns:
+        add_multi_range_format(worksheet, zero_columns, 3, last_row, {
+            'type': 'cell',
+            'criteria': '==',
+            'value': 0,
+            'format': formats.get({'bg_color': ZERO_COLOR, 'align': 'center', 'valign': 'vcenter'})
+        })
+
+    red_format = formats.get({'bg_color': LIMIT_COLOR, 'font_color': LIMIT_FONT_COLOR, 'align': 'center', 'valign': 'vcenter'})
+    for (qmin, qmax), columns in limit_groups.items():
+        # 2. Меньше qmin (и не 0) -> Красный
+        # Формула относительно первой ячейки первого диапазона группы
+        col_letter = get_column_letter(columns[0] + 1)
+        add_multi_range_format(worksheet, columns, 3, last_row, {
+            'type': 'formula',
+            'criteria': f'=AND({col_letter}4<{qmin}, {col_letter}4<>0)',
+            'format': red_format
+        })
+
+        # 3. Больше qmax -> Красный
+        add_multi_range_format(worksheet, columns, 3, last_row, {
+            'type': 'cell',
+            'criteria': '>',
+            'value': qmax,
+            'format': red_format
+        })
+
+        # 4. В диапазоне [qmin, qmax] -> Градиент Желтый-Зеленый (пределы заданы числами)
+        add_multi_range_format(worksheet, columns, 3, last_row, {
+            'type': '2_color_scale',
+            'min_color': SCALE_LOW_COLOR,
+            'max_color': SCALE_HIGH_COLOR,
+            'min_type': 'num',
+            'min_value': qmin,
+            'max_type': 'num',
+            'max_value': qmax
+        })
+
+    # Fallback к обычному градиенту: шкала строится по значениям своего столбца
+    for i in scale_columns:
+        worksheet.conditional_format(3, i, last_row, i, {
+            'type': '3_color_scale',
+            'min_color': SCALE_MIN_COLOR,
+            'mid_color': SCALE_LOW_COLOR,
+            'max_color': SCALE_HIGH_COLOR
+        })
+
+
+def static_color_plan(formats, df, limit_groups, scale_columns, border_columns):
+    """
+    Статическая раскраска по тем же условиям, что и add_conditional_colors:
+    {номер столбца: (коды static_color_codes, форматы по кодам)}
+    """
+    plan = {}
+    for limits, columns in list(limit_groups.items()) + [((None, None), scale_columns)]:
+        qmin, qmax = limits
+        for i in columns:
+            values = numeric_values(df.iloc[:, i])
+            if values is None:
+                continue
+            cell_formats = static_color_formats(formats, qmin is not None, i in border_columns)
+            plan[i] = (static_color_codes(values, qmin, qmax), cell_formats)
+    return plan
+
+
+def add_static_colors(worksheet, first_row, df, plan):
+    """
+    Перезаписывает числа столбцов, уже выведенные to_excel, с вычисленным цветом ячейки.
+    Пустые и нечисловые ячейки остаются как есть.
+    """
+    write_number = worksheet.write_number
+    for col, (codes, cell_formats) in plan.items():
+        values = numeric_values(df.iloc[:, col])
+        for row, value, code in zip(range(first_row, first_row + len(values)), values.tolist(), codes.tolist()):
+            if code >= 0:
+                write_number(row, col, value, cell_formats[code])
+
+
+def write_cell(worksheet, row, col, value, cell_format=None, datetime_format=None):
+    """Записывает значение так же, как DataFrame.to_excel: пустые значения пропускаются, inf - текстом"""
+    if value is None or value is pd.NaT or value is pd.NA:
+        return
+    if isinstance(value, (bool, np.bool_)):
+        worksheet.write_boolean(row, col, bool(value), cell_format)
+    elif isinstance(value, (int, float, np.number)):
+        if value != value:  # NaN
+            return
+        if np.isinf(value):
+            worksheet.write_string(row, col, 'inf' if value > 0 else '-inf', cell_format)
+        else:
+            worksheet.write_number(row, col, value, cell_format)
+    elif isinstance(value, datetime.datetime):
+        worksheet.write_datetime(row, col, value, cell_format or datetime_format)
+    elif isinstance(value, str):
+        if value:
+            worksheet.write_string(row, col, value, cell_format)
+    else:
+        worksheet.write(row, col, value, cell_format)
+
+
+def write_data_rows(worksheet, df, first_row, plan=None, datetime_format=None, chunk_rows=DATA_CHUNK_ROWS):
+    """
+    Записывает значения df построчно, начиная со строки first_row, - порядок, который требует
+    режим xlsxwriter constant_memory (to_excel пишет по столбцам).
+    plan - статическая раскраска (static_color_plan), datetime_format - формат ячеек даты/времени.
+    Значения берутся частями по chunk_rows строк, чтобы не копировать весь DataFrame в объекты Python.
+    """
+    plan = plan or {}
+    column_count = len(df.columns)
+    for start in range(0, len(df), chunk_rows):
+        part = df.iloc[start:start + chunk_rows]
+        columns = [part.iloc[:, col].tolist() for col in range(column_count)]
+        codes = [plan[col][0][start:start + len(part)].tolist() if col in plan else None
+                 for col in range(column_count)]
+        for offset in range(len(part)):
+            row = first_row + start + offset
+            for col in range(column_count):
+                cell_format = None
+                if codes[col] is not None and codes[col][offset] >= 0:
+                    cell_format = plan[col][1][codes[col][offset]]
+                write_cell(worksheet, row, col, columns[col][offset], cell_format, datetime_format)
+
+
+def format_data_workbook(writer, sheet_name, df, rules, formats=None, color_mode=DEFAULT_COLOR_MODE, streaming=False):
+    """
+    Форматирует лист с данными используя xlsxwriter (в один проход).
+    Добавляет заголовки, объединяет ячейки параметров, настраивает ширину и цвета.
+    rules - CompiledRules (или DataFrame правил, который будет скомпилирован).
+    formats - общий FormatRegistry книги (если не передан, создается свой).
+    color_mode - COLOR_MODE_CONDITIONAL (условное форматирование) или COLOR_MODE_STATIC
+    (цвет ячеек вычисляется сразу, без условных форматов: большой отчёт быстрее открывается и прокручивается).
+    streaming - книга в режиме constant_memory и данные ещё не записаны: строки заголовка пишутся
+    по порядку, а статическая раскраска не записывается, а возвращается для write_data_rows.
+    """
+    try:
+        rules = compile_rules(rules)
+        formats = format_registry(writer, formats)
+        worksheet = writer.sheets[sheet_name]
+
+        # Стили
+        header_properties = {
+            'bold': True,
+            'text_wrap': True,
+            'valign': 'vcenter',
+            'align': 'center',
+            'border': 1,
+            'bg_color': '#D9D9D9'
+        }
+        header_format = formats.get(header_properties)
+
+        center_format = formats.get({
+            'align': 'center',
+            'valign': 'vcenter'
+        })
+
+        # Убрать сетку
+        worksheet.hide_gridlines(2)
+
+        # 1. Подготовка данных для заголовков (из скомпилированных правил)
+        column_to_node = rules.column_to_node
+        param_ranges = rules.param_ranges
+
+        # 2. Запись заголовков (Строки 1, 2, 3 в Excel -> 0, 1, 2 индексы)
+        headers = df.columns.tolist()
+
+        # Замораживаем панели
+        worksheet.freeze_panes(3, 1)  # 3 строки заголовка, 1 столбец слева
+
+        # Столбцы, с которых начинается новый узел: у них толстая граница слева
+        border_columns = set()
+        current_node_border = None
+        for i, header in enumerate(headers):
+            base_header = header.split(' ⚠')[0] if ' ⚠' in header else header
+            node = column_to_node.get(base_header)
+            if node and node != current_node_border:
+                if i > 0:  # Не для первого столбца
+                    border_columns.add(i)
+                current_node_border = node
+
+        header_border_format = formats.get(dict(header_properties, left=2))
+
+        border_format = formats.get({'align': 'center', 'valign': 'vcenter', 'left': 2})
+
+        def column_header_format(col):
+            return header_border_format if col in border_columns else header_format
+
+        # Группы соседних столбцов с одинаковыми узлом и диапазоном: [первый, последний, узел, диапазон]
+        groups = []
+        for i in range(1, len(headers)):  # Данные начинаются со 2-го столбца (индекс 1)
+            header = headers[i]
+            base_header = header.split(' ⚠')[0] if ' ⚠' in header else header
+            node = column_to_node.get(base_header, "")
+            param_range_str = param_ranges.get(base_header, "")
+            if groups and groups[-1][2] == node and groups[-1][3] == param_range_str:
+                groups[-1][1] = i
+            else:
+                groups.append([i, i, node, param_range_str])
+
+        # Заголовок Время (объединяем 3 строки)
+        if streaming:
+            # Строки пишутся только по порядку, поэтому вместо объединения - три ячейки без границ между ними
+            time_header_cells = [
+                ("", formats.get(dict(header_properties, bottom=0))),
+                ("Время", formats.get(dict(header_properties, top=0, bottom=0))),
+                ("", formats.get(dict(header_properties, top=0))),
+            ]
+        else:
+            worksheet.merge_range(0, 0, 2, 0, "Время", header_format)
+            time_header_cells = None
+
+        # Строки 0 (Узел) и 1 (Диапазон): одна объединенная ячейка на группу
+        for row, key in ((0, 2), (1, 3)):
+            if time_header_cells:
+                worksheet.write(row, 0, *time_header_cells[row])
+            for group in groups:
+                first_col, last_col, text = group[0], group[1], group[key]
+                if not text:
+                    continue
+                if last_col > first_col:
+                    worksheet.merge_range(row, first_col, row, last_col, text, column_header_format(first_col))
+                else:
+                    worksheet.write(row, first_col, text, column_header_format(first_col))
+
+        # Строка 2: названия столбцов
+        if time_header_cells:
+            worksheet.write(2, 0, *time_header_cells[2])
+        for i in range(1, len(headers)):
+            worksheet.write(2, i, headers[i], column_header_format(i))
+
+        # 3. Настройка ширины столбцов и условное форматирование
+        # Столбцы данных группируются по пределам (qmin, qmax) для раскраски
+        last_row = max(len(df), 1) + 2
+        zero_columns = []      # все столбцы данных: 0 -> без цвета
+        limit_groups = {}      # (qmin, qmax) -> столбцы
+        scale_columns = []     # столбцы без пределов: свой градиент у каждого
+
+        for i, header in enumerate(headers):
+            base_header = header.split(' ⚠')[0] if ' ⚠' in header else header
+
+            # Ширина столбца
+            max_len = len(str(header))
+            # Примерная ширина по данным (первые 50 строк)
+            # (str() для каждого значения: в pandas 3 astype(str) оставляет пропуски NaN)
+            for val in df.iloc[:50, i]:
+                max_len = max(max_len, len(str(val)))
+            # Границы узлов (визуально отделяем группы) - формат столбца, а не условное правило:
+            # он достаётся ячейкам данных, которые to_excel записал без формата
+            worksheet.set_column(i, i, min(max_len + 2, 50), border_format if i in border_columns else center_format)
+
+            # Условное форматирование для данных
+            if header != 'Время' and not is_arrow_column(header):
+                # Ищем min/max для этого столбца для расцветки
+                col_rule = rules.first_rows.get(base_header)
+                qmin = None
+                qmax = None
+                if col_rule is not None:
+                    try:
+                        qmin_val = col_rule['min']
+                        qmax_val = col_rule['max']
+                        if pd.notna(qmin_val):
+                            qmin = float(qmin_val)
+                        if pd.notna(qmax_val):
+                            qmax = float(qmax_val)
+                    except (ValueError, TypeError, IndexError) as e:
+                        logging.warning(f"Не удалось получить qmin/qmax для '{base_header}': {e}")
+
+                zero_columns.append(i)
+                if qmin is not None and qmax is not None:
+                    limit_groups.setdefault((qmin, qmax), []).append(i)
+                else:
+                    scale_columns.append(i)
+
+        if color_mode == COLOR_MODE_STATIC:
+            plan = static_color_plan(formats, df, limit_groups, scale_columns, border_columns)
+            if streaming:
+                return plan
+            add_static_colors(worksheet, 3, df, plan)
+        else:
+            add_conditional_colors(worksheet, formats, zero_columns, limit_groups, scale_columns, last_row)
+
+    except Exception as e:
+        logging.error(f"Ошибка при форматировании данных: {e}", exc_info=True)
+
+
+def is_arrow_column(name):
+    """Столбец направлений выхода за диапазон (стрелок)"""
+    return str(name).endswith('⚠')
+
+
+def arrow_directions(df, rules):
+    """
+    Направления выхода за диапазон min-max сразу для всех столбцов, у которых в правилах заданы пределы.
+
+    Значения столбцов собираются в одну матрицу float64 и сравниваются с векторами min и max.
+    Возвращает (список столбцов, матрица int8 строки x столбцы): -1 - ниже min, 1 - выше max,
+    0 - в диапазоне, пусто или не число. Нулевые значения выходом за диапазон не считаются.
+    """
+    rules = compile_rules(rules)
+    param_limits = rules.param_limits
+    columns = [col for col in df.columns if col in param_limits]
+    if not columns:
+        return columns, np.zeros((len(df), 0), dtype=np.int8)
+
+    values = df[columns]
+    # Нечисловые столбцы приводим к числам (не числа -> NaN), как и раньше
+    non_numeric = [col for col in columns if not pd.api.types.is_numeric_dtype(values[col])]
+    if non_numeric:
+        values = values.assign(**{col: pd.to_numeric(values[col], errors='coerce') for col in non_numeric})
+    values = values.to_numpy(dtype=np.float64, na_value=np.nan)
+
+    mins = np.array([param_limits[col]['min'] for col in columns])
+    maxs = np.array([param_limits[col]['max'] for col in columns])
+
+    nonzero = values != 0
+    directions = np.zeros(values.shape, dtype=np.int8)
+    directions[(values < mins) & nonzero] = -1
+    directions[(values > maxs) & nonzero] = 1
+    return columns, directions
+
+
+def add_arrow_columns(df, rules):
+    """
+    Добавляет после каждого столбца с пределами min-max столбец направлений "<имя> ⚠" (int8: -1, 0, 1).
+    Стрелки ↓/↑ появляются только при записи листа (arrow_labels).
+    """
+    try:
+        rules = compile_rules(rules)
+        param_to_node = rules.column_to_node
+
+        columns, directions = arrow_directions(df, rules)
+        if not columns:
+            return df, param_to_node
+
+        arrow_names = [f"{col} ⚠" for col in columns]
+        arrows = pd.DataFrame(directions, index=df.index, columns=arrow_names)
+
+        # Одно переупорядочивание: столбец стрелок сразу после своего столбца данных
+        arrow_positions = {col: len(df.columns) + j for j, col in enumerate(columns)}
+        order = []
+        for i, col in enumerate(df.columns):
+            order.append(i)
+            if col in arrow_positions:
+                order.append(arrow_positions.pop(col))
+        df = pd.concat([df, arrows], axis=1).iloc[:, order]
+
+        return df, param_to_node
+
+    except Exception as e:
+        logging.error(f"Ошибка при добавлении столбцов со стрелками: {e}", exc_info=True)
+        return df, {}
+
+
+def arrow_labels(df):
+    """Заменяет направления в столбцах стрелок на символы ↓/↑ (для записи листа Данные)"""
+    labels = {
+        col: ARROW_SYMBOLS[df[col].to_numpy(dtype=np.int8) + 1]
+        for col in df.columns if is_arrow_column(col)
+    }
+    return df.assign(**labels) if labels else df
+
+
+def daily_node_stats(df, col_positions, qmins, qmaxs):
+    """
+    Суточная статистика столбцов узлов для Dashboard, рассчитанная сразу для всех узлов.
+
+    col_positions - позиции столбцов в df, qmins/qmaxs - их пределы. Значения приводятся к числам
+    (не числа и пустые - 0) и собираются в матрицу строки x узлы. Сутки - строки от первой до
+    последней строки с этой датой в столбце 'Время'. Возвращает словарь:
+    dates - даты (Timestamp), starts/ends - первая и последняя строка суток в df,
+    sums, mins, maxs - сумма, минимум и максимум (сутки x узлы), violations - число строк
+    ниже min (без нулей) или выше max, zero - все значения суток нулевые.
+    """
+    days = pd.to_datetime(df['Время']).dt.normalize().to_numpy()
+    valid_rows = np.flatnonzero(~pd.isna(days))
+    dates, first, inverse = np.unique(days[valid_rows], return_index=True, return_inverse=True)
+    last = np.zeros(len(dates), dtype=np.intp)
+    np.maximum.at(last, inverse, np.arange(len(inverse)))
+    starts = valid_rows[first]
+    ends = valid_rows[last]
+
+    # Матрица по столбцам (порядок F): суммы по столбцу суток совпадают с суммой pandas по срезу
+    # Лишняя нулевая строка в конце нужна reduceat для суток, заканчивающихся последней строкой
+    nrows = len(df)
+    values = np.zeros((nrows + 1, len(col_positions)), dtype=np.float64, order='F')
+    for j, position in enumerate(col_positions):
+        values[:nrows, j] = pd.to_numeric(df.iloc[:, position], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+
+    qmins = np.asarray(qmins, dtype=np.float64)
+    qmaxs = np.asarray(qmaxs, dtype=np.float64)
+    violations = ((values < qmins) & (values != 0)) | (values > qmaxs)
+
+    # Отрезки суток [start, end + 1): reduceat по чередующимся границам, берутся чётные результаты
+    bounds = np.empty(2 * len(dates), dtype=np.intp)
+    bounds[0::2] = starts
+    bounds[1::2] = ends + 1
+    if len(dates):
+        mins = np.minimum.reduceat(values, bounds, axis=0)[0::2]
+        maxs = np.maximum.reduceat(values, bounds, axis=0)[0::2]
+        counts = np.add.reduceat(violations.astype(np.int64), bounds, axis=0)[0::2]
+    else:
+        mins = maxs = np.zeros((0, len(col_positions)))
+        counts = np.zeros((0, len(col_positions)), dtype=np.int64)
+
+    sums = np.zeros((len(dates), len(col_positions)), dtype=np.float64)
+    for d in range(len(dates)):
+        sums[d] = values[starts[d]:ends[d] + 1].sum(axis=0)
+
+    return {
+        'dates': [pd.Timestamp(date) for date in dates],
+        'starts': starts,
+        'ends': ends,
+        'sums': sums,
+        'mins': mins,
+        'maxs': maxs,
+        'violations': counts,
+        'zero': (mins == 0) & (maxs == 0),
+    }
+
+
+def create_dashboard_sheet(writer, df, rules, allowed_columns, formats=None, layout=None):
+    """
+    Создает лист Dashboard с Timeline Heatmap и Sparklines.
+    rules - CompiledRules (или DataFrame правил, который будет скомпилирован).
+    formats - общий FormatRegistry книги (если не передан, создается свой).
+    layout - раскладка данных по листам (data_sheet_layout); по умолчанию - один лист Данные.
+    """
+    try:
+        rules = compile_rules(rules)
+        if layout is None:
+            layout = [DataSheet(DATA_SHEET_NAME, 0, len(df), list(range(len(df.columns))))]
+        workbook = writer.book
+        formats = format_registry(writer, formats)
+        worksheet = workbook.add_worksheet('Dashboard')
+
+        # Базовые шрифты
+        font_name = 'Arial'
+
+        # Стили
+        header_format = formats.get({
+            'bold': True,
+            'text_wrap': True,
+            'valign': 'vcenter',
+            'align': 'center',
+            'border': 1,
+            'bg_color': '#D9D9D9',
+            'font_name': font_name,
+            'font_size': 10
+        })
+
+        node_format = formats.get({
+            'bold': True,
+            'valign': 'vcenter',
+            'align': 'center',
+            'border': 1,
+            'font_name': font_name,
+            'font_size': 10
+        })
+
+        # Для пустой ячейки (A2)
+        empty_corner_format = formats.get({
+            'border': 1,
+            'bg_color': '#FFFFFF'
+        })
+
+        # Для "Итого:" (правое выравнивание)
+        itogo_label_format = formats.get({
+            'bold': True,
+            'valign': 'vcenter',
+            'align': 'right',
+            'border': 1,
+            'bg_color': '#FFFFFF',
+            'font_name': font_name,
+            'font_size': 14
+        })
+
+        # Цвета для статусов (с форматом чисел)
+        num_format = '# ##0.00'
+
+        green_format = formats.get({'bg_color': '#C6EFCE', 'border': 1, 'num_format': num_format, 'valign': 'vcenter', 'align': 'center', 'bold': True, 'font_size': 10, 'font_name': font_name, 'font_color': '#000000'})
+        red_format = formats.get({'bg_color': '#FFC7CE', 'border': 1, 'num_format': num_format, 'valign': 'vcenter', 'align': 'center', 'bold': True, 'font_size': 10, 'font_name': font_name, 'font_color': '#000000'})
+        grey_format = formats.get({'bg_color': '#F2F2F2', 'border': 1, 'num_format': num_format, 'valign': 'vcenter', 'align': 'center', 'bold': True, 'font_size': 10, 'font_name': font_name, 'font_color': '#000000'})
+        yellow_format = formats.get({'bg_color': '#FFF2CC', 'border': 1, 'num_format': num_format, 'valign': 'vcenter', 'align': 'center', 'bold': True, 'font_size': 10, 'font_name': font_name, 'font_color': '#000000'})
+
+        # 1. Подготовка данных
+        # Структура: {NodeName: {FlowCol: col_name, Qmin: val, Qmax: val, Units: str}}
+        node_config = {}
+
+        # Находим столбцы расхода
+        for col in df.columns:
+            if col not in allowed_columns:
+                continue
+
+            # Ищем правило для этого столбца (по NewName)
+            rule_row = rules.first_rows.get(col)
+            if rule_row is not None:
+                param_name = rule_row['parameter']
+                node_name = rule_row['node']
+
+                # Простейшая эвристика для определения "расхода"
+                if "расход" in param_name.lower():
+                    qmin = rule_row['min']
+                    qmax = rule_row['max']
+                    units = rule_row['units']
+
+                    if not units:
+                        units = "тыс. м3/ч"
+
+                    try:
+                        qmin = float(qmin) if pd.notna(qmin) else 0
+                        qmax = float(qmax) if pd.notna(qmax) else float('inf')
+                    except (ValueError, TypeError) as e:
+                        logging.warning(f"Некорректные qmin/qmax для '{col}': {e}")
+                        qmin, qmax = 0, float('inf')
+
+                    node_config[node_name] = {
+                        'col': col,
+                        'qmin': qmin,
+                        'qmax': qmax,
+                        'units': units,
+                        'col_idx': df.columns.get_loc(col)  # Индекс в dataframe (0-based)
+                    }
+
+        if not node_config:
+            worksheet.write(0, 0, "Не найдены параметры расхода для построения Dashboard")
+            return
+
+        # Группировка по датам (дни)
+        if 'Время' not in df.columns:
+            worksheet.write(0, 0, "Ошибка: нет столбца Время")
+            return
+
+        unique_nodes = sorted(node_config.keys())
+
+        # Суточная статистика всех узлов за один проход
+        stats = daily_node_stats(
+            df,
+            [node_config[node]['col_idx'] for node in unique_nodes],
+            [node_config[node]['qmin'] for node in unique_nodes],
+            [node_config[node]['qmax'] for node in unique_nodes],
+        )
+        unique_dates = stats['dates']
+
+        num_days = len(unique_dates)
+
+        # 2. Заголовки
+        worksheet.write(0, 0, "Узел (позиция)", header_format)
+        worksheet.set_column(0, 0, 18)  # Ширина первого столбца
+
+        worksheet.write(0, 1, "Допустимый диапазон", header_format)
+        worksheet.set_column(1, 1, 35)  # Ширина второго столбца
+
+        # Новый столбец статистики с динамическим заголовком
+        worksheet.write(0, 2, f"Выход за диапазон\nза период {num_days} суток", header_format)
+        worksheet.set_column(2, 2, 22)
+
+        worksheet.freeze_panes(2, 3)  # Закрепить заголовки (2 строки) и первые три столбца
+
+        for j, date in enumerate(unique_dates):
+            worksheet.write(0, j + 3, date.strftime('%d.%m.%Y'), header_format)
+            worksheet.set_column(j + 3, j + 3, 22)  # Ширина столбцов с датами
+
+        # 3. Заполнение матрицы из таблицы суточной статистики
+        # Словари для подсчета итогов
+        total_days_sum = 0
+        total_hours_sum = 0
+        daily_sums = [0.0] * num_days
+
+        # Формат для итогов с единицами измерения (белый фон)
+        total_data_format = formats.get({
+            'bold': True,
+            'align': 'center',
+            'valign': 'vcenter',
+            'bg_color': '#FFFFFF',  # Белый фон
+            'border': 1,
+            'font_name': font_name,
+            'font_size': 12,
+            'num_format': '# ##0" (тыс. м3)"'
+        })
+
+        # Строки узлов сначала собираются, а записываются после строки Итого:
+        # строки листа пишутся по порядку (этого требует режим constant_memory)
+        node_rows = []  # [(номер строки, [(столбец, значение, формат)], [(столбец, спарклайн)])]
+        for i, node in enumerate(unique_nodes):
+            row_idx = i + 2  # Смещаем на 2 (Заголовок + Итого)
+            cells = []
+            sparklines = []
+
+            config = node_config[node]
+            qmin = config['qmin']
+            qmax = config['qmax']
+            units = config['units']
+
+            # Формируем раздельные подписи
+            qmin_str = f"{qmin:g}"
+            if qmax == float('inf'):
+                qmax_str = "∞"
+            else:
+                qmax_str = f"{qmax:g}"
+
+            range_label = f"({qmin_str} ... {qmax_str} {units})"
+
+            cells.append((0, node, node_format))
+            cells.append((1, range_label, node_format))
+
+            idx = config['col_idx']  # 0-based column index in df
+
+            # Переменные для статистики по узлу
+            total_violation_days = 0
+            total_violation_hours = 0
+
+            for j in range(num_days):
+                col_idx = j + 3  # Смещаем на 3 столбца (Узел, Диапазон, Статистика)
+
+                # Ячейки суток на листе данных, где записан этот столбец
+                data_range = locate_data_range(layout, idx, stats['starts'][j], stats['ends'][j])
+
+                day_sum = stats['sums'][j, i]
+                daily_sums[j] += day_sum  # Суммируем для итога
+
+                status_format = grey_format  # Default
+                is_zero = bool(stats['zero'][j, i])
+
+                # Статистика нарушений за день
+                day_violation_hours = 0
+
+                if not is_zero:
+                    # Общее количество часов с нарушениями (ниже min без нулей или выше max)
+                    day_violation_hours = stats['violations'][j, i]
+                    has_violation = day_violation_hours > 0
+
+                    # Присвоение цвета
+                    if day_sum <= 12:
+                        status_format = yellow_format
+                        if has_violation:
+                            total_violation_days += 1
+                    elif has_violation:
+                        status_format = red_format
+                        total_violation_days += 1
+                    else:
+                        status_format = green_format
+
+                total_violation_hours += day_violation_hours
+
+                # Пишем сумму в ячейку с форматом фона
+                cells.append((col_idx, day_sum, status_format))
+
+                # Рисуем график только если не ноль
+                if not is_zero and data_range:
+                    spark_color = '#595959'
+                    if status_format == red_format:
+                        spark_color = '#A54040'  # Темно-красный
+                    elif status_format == green_format:
+                        spark_color = '#407040'  # Темно-зеленый
+                    elif status_format == yellow_format:
+                        spark_color = '#B38600'  # Темно-желтый
+
+                    options = {
+                        'range': data_range,
+                        'type': 'line',
+                        'markers': False,
+                        'weight': 1.0,  # Тоньше линия
+                        'series_color': spark_color,
+                        'high_point': False,
+                        'low_point': False,
+                    }
+                    sparklines.append((col_idx, options))
+
+            # Накапливаем итоговую статистику
+            total_days_sum += total_violation_days
+            total_hours_sum += total_violation_hours
+
+            # Записываем статистику в столбец 2 (индекс 2)
+            stats_text = f"{total_violation_days} сут.; {int(total_violation_hours)} ч."
+            stats_fmt = green_format
+            if total_violation_hours > 0:
+                stats_fmt = red_format
+
+            cells.append((2, stats_text, stats_fmt))
+            node_rows.append((row_idx, cells, sparklines))
+
+        # Оформление строки Итого (строка 1)
+        worksheet.write(1, 0, "", empty_corner_format)
+        worksheet.write(1, 1, "Итого:", itogo_label_format)
+
+        # Итог по статистике
+        total_stats_text = f"{total_days_sum} сут.; {int(total_hours_sum)} ч."
+        total_stats_fmt = formats.get({
+            'bold': True,
+            'valign': 'vcenter',
+            'align': 'center',
+            'border': 1,
+            'bg_color': '#FFFFFF',
+            'font_name': font_name,
+            'font_size': 14,
+            'font_color': '#FF0000'
+        })
+        worksheet.write(1, 2, total_stats_text, total_stats_fmt)
+
+        # Итоги по датам
+        for j in range(num_days):
+            worksheet.write_number(1, j + 3, daily_sums[j], total_data_format)
+
+        # Строки узлов
+        for row_idx, cells, sparklines in node_rows:
+            worksheet.set_row(row_idx, 40)  # Увеличиваем высоту строки для наглядности графика
+            for col_idx, value, cell_format in cells:
+                worksheet.write(row_idx, col_idx, value, cell_format)
+            for col_idx, options in sparklines:
+                worksheet.add_sparkline(row_idx, col_idx, options)
+
+        # Делаем лист активным при открытии
+        worksheet.activate()
+
+    except Exception as e:
+        logging.error(f"Ошибка при создании Dashboard: {e}", exc_info=True)
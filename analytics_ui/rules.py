@@ -0,0 +1,213 @@
+import os
+import logging
+import unicodedata
+
+import pandas as pd
+
+
+def normalize_pattern(value):
+    """Приводит шаблон имени файла к виду, в котором он сравнивается с именем файла"""
+    return unicodedata.normalize('NFC', str(value).strip().lower())
+
+
+def default_units(check_name):
+    """Единицы измерения по умолчанию, если в правилах столбец единиц пуст"""
+    if "перепад давления" in check_name:
+        return "кгс/см2"
+    elif "расход" in check_name:
+        return "тыс. м3/ч"
+    elif "температура" in check_name:
+        return "°C"
+    return ""
+
+
+class CompiledRules:
+    """
+    Скомпилированный индекс файла правил.
+
+    Строится один раз при загрузке правил: файл правил проходится за один проход,
+    а все потребители (узлы, переименование, стрелки, форматирование, Dashboard)
+    получают нужные данные из словарей, а не перебором строк rules_df.
+
+    Столбцы файла правил (по позиции):
+    0 - шаблон имени файла, 1 - старое название, 2 - новое название (NewName),
+    3 - узел измерения, 4 - параметр, 5 - min, 6 - max, 7 - единицы (необязательный).
+    """
+
+    def __init__(self, rules_df):
+        self.rules_df = rules_df
+        self.empty = rules_df.empty
+        ncols = len(rules_df.columns)
+
+        # Шаблон файла -> [(номер строки, старое имя, новое имя, параметр)]
+        self.pattern_renames = {}
+        # Шаблон файла -> множество узлов измерения
+        self.pattern_nodes = {}
+        # Параметр -> множество NewName; узел -> множество NewName
+        self.param_to_columns = {}
+        self.node_to_columns = {}
+        # NewName -> узел (последнее правило побеждает, как при переборе строк)
+        self.column_to_node = {}
+        # NewName -> {'min': float, 'max': float} для столбцов со стрелками
+        self.param_limits = {}
+        # NewName -> строка диапазона для заголовка листа Данные
+        self.param_ranges = {}
+        # Исходное значение NewName -> первая строка правил с этим значением
+        self.first_rows = {}
+        # Уникальные параметры в порядке появления
+        self.parameters = []
+
+        self._patterns = []
+        self._match_cache = {}
+
+        if self.empty:
+            return
+
+        seen_parameters = set()
+
+        for row_idx, row in enumerate(rules_df.itertuples(index=False, name=None)):
+            raw_new_name = row[2] if ncols >= 3 else None
+
+            if ncols >= 5 and raw_new_name not in self.first_rows:
+                self.first_rows[raw_new_name] = {
+                    'node': str(row[3]).strip(),
+                    'parameter': str(row[4]).strip(),
+                    'min': row[5] if ncols > 5 else None,
+                    'max': row[6] if ncols > 6 else None,
+                    'units': str(row[7]).strip() if ncols > 7 and pd.notna(row[7]) else "",
+                }
+
+            if ncols >= 5 and pd.notna(row[4]):
+                parameter = str(row[4]).strip()
+                if parameter and parameter not in seen_parameters:
+                    seen_parameters.add(parameter)
+                    self.parameters.append(parameter)
+
+            if ncols < 4:
+                continue
+
+            file_pattern = normalize_pattern(row[0])
+            new_name = str(row[2]).strip()
+            node_name = str(row[3]).strip()
+
+            if new_name and node_name:
+                self.column_to_node[new_name] = node_name
+
+            if file_pattern and node_name and node_name.lower() != 'nan':
+                self.pattern_nodes.setdefault(file_pattern, set()).add(node_name)
+
+            if ncols >= 5:
+                old_name = str(row[1]).strip()
+                parameter = str(row[4]).strip()
+
+                if file_pattern and old_name and new_name and parameter:
+                    self.pattern_renames.setdefault(file_pattern, []).append(
+                        (row_idx, old_name, new_name, parameter)
+                    )
+
+                if new_name and parameter and node_name:
+                    self.param_to_columns.setdefault(parameter, set()).add(new_name)
+                    self.node_to_columns.setdefault(node_name, set()).add(new_name)
+
+            if ncols >= 7 and new_name:
+                self._add_limits(row, ncols, new_name)
+
+        self._patterns = list(dict.fromkeys(list(self.pattern_nodes) + list(self.pattern_renames)))
+
+    def _add_limits(self, row, ncols, new_name):
+        """Заполняет min/max и строку диапазона для NewName"""
+        min_val = row[5]
+        max_val = row[6]
+
+        if pd.notna(min_val) and pd.notna(max_val):
+            try:
+                self.param_limits[new_name] = {'min': float(min_val), 'max': float(max_val)}
+            except (ValueError, TypeError):
+                logging.warning(f"Пропущены некорректные значения min/max для {new_name}")
+
+            units = str(row[7]).strip() if ncols >= 8 and pd.notna(row[7]) else ""
+            if not units:
+                param_name = str(row[4]).strip()
+                units = default_units(param_name.lower() if param_name else new_name.lower())
+
+            self.param_ranges[new_name] = f"({min_val} ... {max_val} {units})".strip()
+
+    def matching_patterns(self, file_path):
+        """Возвращает шаблоны из правил, которым соответствует имя файла"""
+        filename = unicodedata.normalize('NFC', os.path.basename(file_path).lower())
+        patterns = self._match_cache.get(filename)
+        if patterns is None:
+            base_filename = unicodedata.normalize('NFC', os.path.splitext(filename)[0])
+            patterns = [
+                pattern for pattern in self._patterns
+                if pattern in filename or base_filename in pattern
+            ]
+            self._match_cache[filename] = patterns
+        return patterns
+
+    def nodes_for_file(self, file_path):
+        """Узлы измерения, которые правила связывают с файлом"""
+        nodes = set()
+        for pattern in self.matching_patterns(file_path):
+            nodes.update(self.pattern_nodes.get(pattern, ()))
+        return nodes
+
+    def rename_rules(self, file_path, selected_parameters):
+        """
+        Правила переименования для файла с учётом выбранных параметров.
+        Возвращает список (старое имя, новое имя, параметр) в порядке строк файла правил.
+        """
+        selected_parameters = set(selected_parameters)
+        matched = []
+        for pattern in self.matching_patterns(file_path):
+            matched.extend(self.pattern_renames.get(pattern, ()))
+        matched.sort()
+        return [(old, new, param) for _, old, new, param in matched if param in selected_parameters]
+
+    def allowed_columns(self, selected_parameters, selected_nodes):
+        """
+        Возвращает (допустимые столбцы, столбцы выбранных узлов).
+        Допустимые столбцы - пересечение столбцов выбранных параметров и узлов.
+        """
+        param_columns = set()
+        for param in selected_parameters:
+            param_columns.update(self.param_to_columns.get(param, ()))
+
+        node_columns = set()
+        for node in selected_nodes:
+            node_columns.update(self.node_to_columns.get(node, ()))
+
+        return param_columns & node_columns, node_columns
+
+    def column_counts(self, file_columns):
+        """
+        Сколько столбцов каждого параметра и каждого узла есть в файлах.
+        file_columns - {путь файла: имена столбцов файла}. Столбец учитывается, если правило
+        файла переименовывает его в NewName с параметром и узлом; повторы NewName считаются один раз.
+        Возвращает ({параметр: число столбцов}, {узел: число столбцов}).
+        """
+        parameters = set(self.parameters)
+        param_columns = {}
+        node_columns = {}
+        for file_path, columns in file_columns.items():
+            columns = set(columns)
+            for pattern in self.matching_patterns(file_path):
+                for _, old_name, new_name, parameter in self.pattern_renames.get(pattern, ()):
+                    if old_name not in columns or parameter not in parameters:
+                        continue
+                    node = self.column_to_node.get(new_name)
+                    if not node or node.lower() == 'nan':
+                        continue
+                    param_columns.setdefault(parameter, set()).add(new_name)
+                    node_columns.setdefault(node, set()).add(new_name)
+        return (
+            {param: len(names) for param, names in param_columns.items()},
+            {node: len(names) for node, names in node_columns.items()},
+        )
+
+
+def compile_rules(rules):
+    """Возвращает CompiledRules для DataFrame правил (или сам объект, если он уже скомпилирован)"""
+    if isinstance(rules, CompiledRules):
+        return rules
+    return CompiledRules(rules)
@@ -0,0 +1,85 @@
+"""
+Замер записи отчёта с общим набором форматов (FormatRegistry) и без него.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_formats.py --rows 1000 --columns 400
+
+Для каждого варианта выводятся время форматирования листа Данные и создания Dashboard,
+время сохранения книги, число объектов Format, размер файла и styles.xml.
+"""
+import os
+import sys
+import time
+import zipfile
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics_ui.report import FormatRegistry, format_data_workbook, create_dashboard_sheet  # noqa: E402
+
+
+class PlainFormats(FormatRegistry):
+    """Прежнее поведение: новый формат на каждый вызов"""
+
+    def get(self, properties):
+        return self.workbook.add_format(properties)
+
+
+def make_data(rows, columns, nodes):
+    """Синтетические часовые данные и правила: columns столбцов расхода, поровну на nodes узлов"""
+    names = [f"Q{i}" for i in range(columns)]
+    rules = pd.DataFrame({
+        'file': ['bench'] * columns,
+        'old': names,
+        'new': names,
+        'node': [f"Узел {i % nodes}" for i in range(columns)],
+        'parameter': ['Расход'] * columns,
+        'min': [5.0] * columns,
+        'max': [80.0] * columns,
+    })
+    rng = np.random.default_rng(0)
+    values = rng.random((rows, columns)) * 100
+    values[rng.random((rows, columns)) < 0.05] = 0
+    df = pd.DataFrame(values, columns=names)
+    df.insert(0, 'Время', pd.date_range('2024-01-01', periods=rows, freq='h'))
+    return df, rules
+
+
+def run(df, rules, registry_class, path):
+    start = time.perf_counter()
+    with pd.ExcelWriter(path, engine='xlsxwriter', datetime_format='yyyy-mm-dd hh:mm:ss') as writer:
+        df.to_excel(writer, sheet_name='Данные', index=False, startrow=3, header=False)
+        formats = registry_class(writer.book)
+        styled = time.perf_counter()
+        format_data_workbook(writer, 'Данные', df, rules, formats)
+        create_dashboard_sheet(writer, df, rules, set(df.columns), formats)
+        styled = time.perf_counter() - styled
+        format_count = len(writer.book.formats)
+    total = time.perf_counter() - start
+    with zipfile.ZipFile(path) as archive:
+        styles_size = archive.getinfo('xl/styles.xml').file_size
+    return styled, total, format_count, os.path.getsize(path), styles_size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--columns', type=int, default=400)
+    parser.add_argument('--nodes', type=int, default=40)
+    args = parser.parse_args(argv)
+
+    df, rules = make_data(args.rows, args.columns, args.nodes)
+    print(f"{args.rows} строк x {args.columns} столбцов, узлов: {args.nodes}")
+    print(f"{'вариант':<16}{'формат., с':>12}{'всего, с':>10}{'Format':>8}{'файл, КБ':>10}{'styles, КБ':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, registry_class in (('без реестра', PlainFormats), ('FormatRegistry', FormatRegistry)):
+            styled, total, format_count, size, styles_size = run(df, rules, registry_class, os.path.join(tmp, 'bench.xlsx'))
+            print(f"{name:<16}{styled:>12.2f}{total:>10.2f}{format_count:>8}{size / 1024:>10.0f}{styles_size / 1024:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+"""
+Замер этапов объединения на синтетических файлах (benchmarks/synthetic.py).
+
+Запуск из корня репозитория:
+    python benchmarks/bench_merge.py --files 8 --rows 8760 --columns 40 --json merge.json
+    python benchmarks/bench_merge.py --files 8 --rows 8760 --columns 40 --compare merge.json
+
+Замеряются чтение файла (load_excel без кэша - то, что делает read_excel_file при первом чтении),
+add_arrow_columns, format_data_workbook, create_dashboard_sheet и полное объединение run_merge
+без графического интерфейса. Каждый замер повторяется --repeat раз; в JSON сохраняются все
+повторы, минимум и медиана, а для полного объединения - этапы из замеров run_merge (MergeProfile).
+--compare выводит отношение медиан к сохранённому ранее JSON.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import datetime
+import tempfile
+import statistics
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics_ui.rules import compile_rules  # noqa: E402
+from analytics_ui.align import DEFAULT_ALIGN, align_frames  # noqa: E402
+from analytics_ui.readers import load_excel, prepare_frame  # noqa: E402
+from analytics_ui.report import (  # noqa: E402
+    FormatRegistry, add_arrow_columns, arrow_labels, create_dashboard_sheet, format_data_workbook, DATA_FIRST_ROW
+)
+from analytics_ui.profiling import MergeProfile  # noqa: E402
+from analytics_ui.pipeline import DATETIME_FORMAT, build_merge_job, measurement_nodes, run_merge  # noqa: E402
+
+from synthetic import write_dataset  # noqa: E402
+
+
+def timed(func, repeat):
+    """Время выполнения func (с) в каждом из repeat повторов и результат последнего вызова"""
+    runs = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        runs.append(round(time.perf_counter() - start, 4))
+    return runs, result
+
+
+def summary(runs):
+    return {'runs': runs, 'min': min(runs), 'median': round(statistics.median(runs), 4)}
+
+
+def merged_frame(job):
+    """Объединенные данные без стрелок - вход add_arrow_columns, как в run_merge"""
+    prepared = []
+    for i, file in enumerate(job['files']):
+        prepared.append(prepare_frame(load_excel(file), file, i == 0, job['rename_rules'][i], job['allowed_columns']))
+    time_column, df = align_frames(prepared, DEFAULT_ALIGN, None)
+    df.insert(0, 'Время', time_column)
+    return df
+
+
+def write_report(path, df, job, stages):
+    """Запись отчёта с отдельными замерами format_data_workbook и create_dashboard_sheet"""
+    rules = job['rules']
+    with pd.ExcelWriter(path, engine='xlsxwriter', datetime_format=DATETIME_FORMAT) as writer:
+        arrow_labels(df).to_excel(writer, sheet_name='Данные', index=False, startrow=DATA_FIRST_ROW, header=False)
+        formats = FormatRegistry(writer.book)
+        start = time.perf_counter()
+        format_data_workbook(writer, 'Данные', df, rules, formats)
+        stages['format_data_workbook'].append(round(time.perf_counter() - start, 4))
+        start = time.perf_counter()
+        create_dashboard_sheet(writer, df, rules, job['node_allowed_columns'], formats)
+        stages['create_dashboard_sheet'].append(round(time.perf_counter() - start, 4))
+
+
+def run_benchmarks(args, tmp):
+    rules_file, files = write_dataset(args.data_dir or os.path.join(tmp, 'data'), args.files, args.rows,
+                                      args.columns, args.seed)
+    rules = compile_rules(pd.read_excel(rules_file, engine='openpyxl'))
+    nodes = measurement_nodes(rules, files)
+    output_file = os.path.join(tmp, 'merge.xlsx')
+    job = build_merge_job(files, rules, rules.parameters, nodes, None, None, output_file, args.workers)
+    results = {}
+
+    runs, _ = timed(lambda: load_excel(files[0]), args.repeat)
+    results['read_excel_file'] = summary(runs)
+
+    df = merged_frame(job)
+    runs, (arrows_df, _) = timed(lambda: add_arrow_columns(df, rules), args.repeat)
+    results['add_arrow_columns'] = summary(runs)
+    arrows_df = arrows_df.sort_values(by='Время').reset_index(drop=True)
+
+    stages = {'format_data_workbook': [], 'create_dashboard_sheet': []}
+    for _ in range(args.repeat):
+        write_report(os.path.join(tmp, 'report.xlsx'), arrows_df, job, stages)
+    for name, runs in stages.items():
+        results[name] = summary(runs)
+
+    profiles = []
+
+    def merge():
+        profile = MergeProfile(path=os.path.join(tmp, 'profile.jsonl'))
+        profiles.append(profile)
+        return run_merge(job, profile=profile)
+
+    runs, merged_df = timed(merge, args.repeat)
+    results['run_merge'] = summary(runs)
+
+    merge_stages = {}
+    for profile in profiles:
+        for record in profile.records:
+            if record['stage'] not in ('read_file', 'total'):
+                merge_stages.setdefault(record['stage'], []).append(record['wall_s'])
+
+    return {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'dataset': {'files': args.files, 'rows': args.rows, 'columns': args.columns, 'seed': args.seed,
+                    'workers': args.workers, 'merged_rows': len(merged_df), 'merged_columns': len(merged_df.columns)},
+        'results': results,
+        'merge_stages': {name: summary(runs) for name, runs in merge_stages.items()},
+    }
+
+
+def print_report(report, baseline=None):
+    dataset = report['dataset']
+    print(f"{dataset['files']} файлов x {dataset['rows']} строк x {dataset['columns']} столбцов, "
+          f"результат {dataset['merged_rows']} x {dataset['merged_columns']}")
+    header = f"{'замер':<28}{'мин, с':>10}{'медиана, с':>12}"
+    if baseline:
+        header += f"{'было, с':>10}{'отношение':>11}"
+    print(header)
+    for group in ('results', 'merge_stages'):
+        if group == 'merge_stages':
+            print("этапы run_merge:")
+        for name, result in report[group].items():
+            line = f"{name:<28}{result['min']:>10.3f}{result['median']:>12.3f}"
+            previous = (baseline or {}).get(group, {}).get(name)
+            if previous:
+                ratio = result['median'] / previous['median'] if previous['median'] else float('nan')
+                line += f"{previous['median']:>10.3f}{ratio:>11.2f}"
+            print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--files', type=int, default=4)
+    parser.add_argument('--rows', type=int, default=24 * 31)
+    parser.add_argument('--columns', type=int, default=40)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1, help="процессов чтения в run_merge")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--data-dir', help="папка синтетических файлов (по умолчанию - временная)")
+    parser.add_argument('--json', help="сохранить результаты в JSON")
+    parser.add_argument('--compare', help="JSON предыдущего запуска для сравнения")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        report = run_benchmarks(args, tmp)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+    print_report(report, baseline)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as json_file:
+            json.dump(report, json_file, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены: {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Сравнение движков чтения Excel (readers.READERS) на одних и тех же синтетических файлах.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_readers.py --files 4 --rows 8760 --columns 40
+    python benchmarks/bench_readers.py --inputs "archive/*.xlsx" --json readers.json
+
+Для каждого установленного движка замеряется чтение всех файлов целиком и с отбором
+половины столбцов; результаты движков сравниваются с первым движком (должны совпадать).
+"""
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import tempfile
+import statistics
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics_ui.readers import READER_OPENPYXL, available_readers, read_excel  # noqa: E402
+
+from synthetic import write_dataset  # noqa: E402
+
+
+def read_all(files, reader, select):
+    return [read_excel(file, select, reader=reader) for file in files]
+
+
+def half_columns(name):
+    """Отбор каждого второго столбца (по имени, одинаково для всех движков)"""
+    return sum(map(ord, str(name))) % 2 == 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--inputs', nargs='*', help="свои файлы или шаблоны вместо синтетических")
+    parser.add_argument('--files', type=int, default=4)
+    parser.add_argument('--rows', type=int, default=24 * 31)
+    parser.add_argument('--columns', type=int, default=40)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--data-dir', help="папка синтетических файлов (по умолчанию - временная)")
+    parser.add_argument('--json', help="сохранить результаты в JSON")
+    args = parser.parse_args(argv)
+
+    readers = available_readers()
+    if READER_OPENPYXL in readers:
+        # Эталон - прежний движок
+        readers = [READER_OPENPYXL] + [reader for reader in readers if reader != READER_OPENPYXL]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.inputs:
+            files = [file for pattern in args.inputs for file in sorted(glob.glob(pattern))]
+        else:
+            _, files = write_dataset(args.data_dir or tmp, args.files, args.rows, args.columns, args.seed)
+        size = sum(os.path.getsize(file) for file in files)
+        print(f"Файлов: {len(files)}, {size / 1024 / 1024:.1f} МБ; движки: {', '.join(readers)}")
+        print(f"{'движок':<12}{'отбор':<10}{'мин, с':>10}{'медиана, с':>12}{'ускорение':>11}  совпадает")
+
+        results = {}
+        reference = {}
+        for reader in readers:
+            for mode, select in (('все', None), ('половина', half_columns)):
+                runs = []
+                frames = None
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    frames = read_all(files, reader, select)
+                    runs.append(round(time.perf_counter() - start, 4))
+                median = statistics.median(runs)
+
+                if mode not in reference:
+                    reference[mode] = (median, frames)
+                same = True
+                for frame, expected in zip(frames, reference[mode][1]):
+                    try:
+                        pd.testing.assert_frame_equal(frame, expected)
+                    except AssertionError:
+                        same = False
+                speedup = reference[mode][0] / median if median else float('nan')
+                results.setdefault(reader, {})[mode] = {'runs': runs, 'min': min(runs), 'median': median,
+                                                        'identical': same}
+                print(f"{reader:<12}{mode:<10}{min(runs):>10.3f}{median:>12.3f}{speedup:>11.2f}  "
+                      f"{'да' if same else 'НЕТ'}")
+
+    if args.json:
+        report = {'files': len(files), 'size_mb': round(size / 1024 / 1024, 2), 'rows': args.rows,
+                  'columns': args.columns, 'pandas': pd.__version__, 'results': results}
+        with open(args.json, 'w', encoding='utf-8') as json_file:
+            json.dump(report, json_file, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены: {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+Синтетические входные данные для замеров: файл правил и часовые архивы узлов.
+
+Файл правил повторяет раскладку «Правила названия столбцов.xlsx» (шаблон имени файла,
+старое и новое название столбца, узел, параметр, Min, Max и единицы измерения), а архивы -
+выгрузки SCADA: лист со столбцом Время и столбцами узлов. Данные детерминированы (seed),
+поэтому замеры разных версий программы выполняются на одинаковых файлах.
+
+Создать набор файлов из корня репозитория:
+    python benchmarks/synthetic.py /tmp/bench --files 8 --rows 8760 --columns 40
+"""
+import os
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# Столбцы файла правил
+RULES_COLUMNS = ['Название файла', 'Старое название столбца', 'Новое название столбца',
+                 'Наименование узла измерений', 'Параметр', 'Min', 'Max', 'Единицы измерения']
+
+# Параметры узла: (параметр, старое название столбца, единицы, min, max); {n} - номер трубопровода
+NODE_PARAMETERS = [
+    ('Температура', "T_т{n}('C)", '°C', -2.0, 19.0),
+    ('Давление', 'P_т{n}(кгс/cм2)', 'кгс/см2', 52.86, 63.6),
+    ('Расход', 'V_т{n}(Тм3)', 'тыс. м3/ч', 106.372, 344.07),
+    ('Перепад давления', 'dP/Qo_т{n}(кгс/м2)', '', None, None),
+    ('Масса', 'M_т{n}(т)', '', None, None),
+    ('Рабочий расход', 'Vр_т{n}(Тм3)', '', None, None),
+]
+
+# Служебные столбцы узла без параметра (в правилах есть, в отчёт не попадают)
+NODE_SERVICE_COLUMNS = ['tо_т{n}(ч)', 'tи_т{n}(ч)']
+
+# Служебные столбцы файла без узла
+FILE_SERVICE_COLUMNS = ['tи(ч)', 'Pб(кгс/cм2)']
+
+# Доли значений: вне диапазона Min...Max, нулевых и пустых
+OUT_OF_RANGE_SHARE = 0.03
+ZERO_SHARE = 0.01
+EMPTY_SHARE = 0.005
+
+
+def file_pattern(number):
+    """Шаблон имени number-го файла в правилах"""
+    return f"Часовой_архив_узла__{number:03d}_"
+
+
+def file_columns(number, columns):
+    """
+    Столбцы number-го файла: [(старое название, узел, параметр, min, max, единицы)], всего columns.
+    У служебных столбцов узел и параметр - None.
+    """
+    result = [(name, None, None, None, None, '') for name in FILE_SERVICE_COLUMNS[:columns]]
+    pipe = 0
+    while len(result) < columns:
+        pipe += 1
+        node = f"{number:03d}FR{pipe:02d}"
+        for parameter, old_name, units, min_val, max_val in NODE_PARAMETERS:
+            result.append((old_name.format(n=pipe), node, parameter, min_val, max_val, units))
+        for old_name in NODE_SERVICE_COLUMNS:
+            result.append((old_name.format(n=pipe), node, None, None, None, ''))
+    return result[:columns]
+
+
+def make_rules(files, columns):
+    """Правила для files файлов по columns столбцов (DataFrame в раскладке файла правил)"""
+    rows = []
+    for number in range(1, files + 1):
+        pattern = file_pattern(number)
+        prefix = f"{number:03d}"
+        for old_name, node, parameter, min_val, max_val, units in file_columns(number, columns):
+            rows.append((pattern, old_name, f"{node or prefix}_{old_name}", node, parameter,
+                         min_val, max_val, units if min_val is not None else None))
+    return pd.DataFrame(rows, columns=RULES_COLUMNS)
+
+
+def make_export(number, rows, columns, start='2024-01-01', seed=0):
+    """Часовой архив number-го файла: столбец Время и columns столбцов значений"""
+    rng = np.random.default_rng((seed, number))
+    data = {'Время': pd.date_range(start, periods=rows, freq='h')}
+    for old_name, node, parameter, min_val, max_val, units in file_columns(number, columns):
+        low, high = (min_val, max_val) if min_val is not None else (0.0, 400.0)
+        spread = high - low
+        values = low + spread * (0.5 + 0.35 * np.sin(np.arange(rows) * 2 * np.pi / 24) * rng.random())
+        values += rng.normal(0, spread * 0.05, rows)
+        outside = rng.random(rows) < OUT_OF_RANGE_SHARE
+        values[outside] += spread * rng.choice([-1.0, 1.0], outside.sum())
+        values[rng.random(rows) < ZERO_SHARE] = 0
+        values[rng.random(rows) < EMPTY_SHARE] = np.nan
+        data[old_name] = values.round(3)
+    return pd.DataFrame(data)
+
+
+def write_dataset(directory, files, rows, columns, seed=0):
+    """
+    Записывает в directory файл правил и files архивов (rows строк, columns столбцов).
+    Возвращает (путь файла правил, список путей архивов). Существующие файлы с теми же
+    параметрами не перезаписываются.
+    """
+    os.makedirs(directory, exist_ok=True)
+    rules_file = os.path.join(directory, f"rules_{files}x{columns}.xlsx")
+    if not os.path.exists(rules_file):
+        make_rules(files, columns).to_excel(rules_file, index=False, engine='openpyxl')
+
+    paths = []
+    for number in range(1, files + 1):
+        path = os.path.join(directory, f"{file_pattern(number)}{rows}x{columns}_s{seed}.xlsx")
+        if not os.path.exists(path):
+            df = make_export(number, rows, columns, seed=seed)
+            with pd.ExcelWriter(path, engine='xlsxwriter', datetime_format='dd.mm.yyyy hh:mm') as writer:
+                df.to_excel(writer, index=False)
+        paths.append(path)
+    return rules_file, paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('directory')
+    parser.add_argument('--files', type=int, default=4)
+    parser.add_argument('--rows', type=int, default=24 * 31)
+    parser.add_argument('--columns', type=int, default=40)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rules_file, paths = write_dataset(args.directory, args.files, args.rows, args.columns, args.seed)
+    print(f"Правила: {rules_file}")
+    for path in paths:
+        print(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,7 +4,7 @@ block_cipher = None
 
 a = Analysis(
     ['analytics_ui/excel_merger.py'],
-    pathex=[],
+    pathex=['.'],
     binaries=[],
     datas=[
         ('analytics_ui/icon.png', '.'),
@@ -14,6 +14,7 @@ setup(
     entry_points={
         'console_scripts': [
             'analytics-ui=analytics_ui.excel_merger:main',
+            'analytics-ui-batch=analytics_ui.batch:main',
             'analytics-ui-setup=analytics_ui.post_install:create_shortcuts',
             'analytics-ui-uninstall=analytics_ui.post_install:remove_shortcuts',
         ],
@@ -0,0 +1,40 @@
+import pandas as pd
+import pytest
+
+from analytics_ui.rules import compile_rules
+from analytics_ui.profiling import MergeProfile
+from analytics_ui.pipeline import build_merge_job, measurement_nodes
+
+RULES = pd.DataFrame(
+    [('Архив_узла_1', 'T(C)', '1_T', 'Узел 1', 'Температура', -2.0, 19.0, '°C'),
+     ('Архив_узла_1', 'P(кгс)', '1_P', 'Узел 1', 'Давление', 50.0, 60.0, 'кгс/см2')],
+    columns=['Название файла', 'Старое название столбца', 'Новое название столбца',
+             'Наименование узла измерений', 'Параметр', 'Min', 'Max', 'Единицы измерения'],
+)
+
+
+def write_export(path, start='2024-01-01', hours=24):
+    """Часовой архив узла в раскладке выгрузки SCADA"""
+    pd.DataFrame({
+        'Время': pd.date_range(start, periods=hours, freq='h'),
+        'T(C)': [float(hour % 10) for hour in range(hours)],
+        'P(кгс)': [55.0] * hours,
+    }).to_excel(path, index=False)
+    return str(path)
+
+
+def merge_job(files, output_file, start=None, end=None, append_to=None, **options):
+    rules = compile_rules(RULES)
+    nodes = measurement_nodes(rules, files)
+    return build_merge_job(files, rules, rules.parameters, nodes, start, end, str(output_file), 1,
+                           append_to=append_to, **options)
+
+
+@pytest.fixture
+def export_file(tmp_path):
+    return write_export(tmp_path / "Архив_узла_1_2024.xlsx")
+
+
+@pytest.fixture
+def profile(tmp_path):
+    return MergeProfile(path=str(tmp_path / "profile.jsonl"))
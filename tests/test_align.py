@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from analytics_ui.align import ALIGN_EXACT, ALIGN_FFILL, ALIGN_NEAREST, align_frames
+
+
+def part(times, column, values):
+    """Подготовленный файл в виде результата prepare_frame: (столбец времени, DataFrame)"""
+    time_column = pd.Series(pd.to_datetime(times), name='Время')
+    return time_column, pd.DataFrame({column: values})
+
+
+def test_exact_keeps_times_of_all_files():
+    parts = [part(['2024-01-01 00:00', '2024-01-01 01:00', '2024-01-01 02:00'], 'a', [1.0, 2.0, 3.0]),
+             part(['2024-01-01 01:00', '2024-01-01 02:00', '2024-01-01 03:00'], 'b', [20.0, 30.0, 40.0])]
+
+    times, merged = align_frames(parts, ALIGN_EXACT)
+
+    assert list(times) == list(pd.date_range('2024-01-01', periods=4, freq='h'))
+    assert list(merged.index) == [0, 1, 2, 3]
+    np.testing.assert_array_equal(merged['a'], [1.0, 2.0, 3.0, np.nan])
+    np.testing.assert_array_equal(merged['b'], [np.nan, 20.0, 30.0, 40.0])
+
+
+def test_exact_pairs_repeated_times_in_order():
+    # Перевод часов: 02:00 встречается дважды, во втором файле строки не упорядочены
+    parts = [part(['2024-10-27 01:00', '2024-10-27 02:00', '2024-10-27 02:00', '2024-10-27 03:00'],
+                  'a', [1.0, 2.0, 2.5, 3.0]),
+             part(['2024-10-27 03:00', '2024-10-27 02:00', '2024-10-27 02:00'], 'b', [30.0, 20.0, 25.0])]
+
+    times, merged = align_frames(parts, ALIGN_EXACT)
+
+    assert list(times) == list(pd.to_datetime(['2024-10-27 01:00', '2024-10-27 02:00',
+                                               '2024-10-27 02:00', '2024-10-27 03:00']))
+    np.testing.assert_array_equal(merged['a'], [1.0, 2.0, 2.5, 3.0])
+    np.testing.assert_array_equal(merged['b'], [np.nan, 20.0, 25.0, 30.0])
+
+
+def test_exact_drops_rows_without_time():
+    parts = [part(['2024-01-01 00:00', None, '2024-01-01 01:00'], 'a', [1.0, 99.0, 2.0]),
+             part(['2024-01-01 00:00', '2024-01-01 01:00'], 'b', [10.0, 20.0])]
+
+    times, merged = align_frames(parts, ALIGN_EXACT)
+
+    assert len(merged) == 2
+    np.testing.assert_array_equal(merged['a'], [1.0, 2.0])
+
+
+def test_nearest_respects_tolerance():
+    parts = [part(['2024-01-01 00:00', '2024-01-01 01:00', '2024-01-01 02:00'], 'a', [1.0, 2.0, 3.0]),
+             part(['2024-01-01 00:10', '2024-01-01 01:50', '2024-01-01 05:00'], 'b', [10.0, 20.0, 50.0])]
+
+    times, merged = align_frames(parts, ALIGN_NEAREST, pd.Timedelta('15min'))
+
+    assert list(times) == list(pd.date_range('2024-01-01', periods=3, freq='h'))
+    np.testing.assert_array_equal(merged['b'], [10.0, np.nan, 20.0])
+
+
+def test_ffill_takes_previous_row_within_tolerance():
+    parts = [part(['2024-01-01 00:00', '2024-01-01 01:00', '2024-01-01 02:00', '2024-01-01 03:00'],
+                  'a', [1.0, 2.0, 3.0, 4.0]),
+             part(['2024-01-01 00:30', '2024-01-01 01:45'], 'b', [10.0, 20.0])]
+
+    times, merged = align_frames(parts, ALIGN_FFILL, pd.Timedelta('40min'))
+
+    # 00:00 - ещё нет строки; 03:00 - последняя строка (01:45) дальше допуска
+    np.testing.assert_array_equal(merged['b'], [np.nan, 10.0, 20.0, np.nan])
+    np.testing.assert_array_equal(merged['a'], [1.0, 2.0, 3.0, 4.0])
+
+
+def test_ffill_without_tolerance_fills_to_the_end():
+    parts = [part(['2024-01-01 00:00', '2024-01-01 05:00'], 'a', [1.0, 2.0]),
+             part(['2024-01-01 00:00'], 'b', [10.0])]
+
+    times, merged = align_frames(parts, ALIGN_FFILL)
+
+    np.testing.assert_array_equal(merged['b'], [10.0, 10.0])
+
+
+def test_file_without_time_is_joined_by_position():
+    first = part(['2024-01-01 00:00', '2024-01-01 01:00'], 'a', [1.0, 2.0])
+    second = (None, pd.DataFrame({'b': [10.0, 20.0]}))
+
+    times, merged = align_frames([first, second], ALIGN_NEAREST)
+
+    assert times is first[0]
+    np.testing.assert_array_equal(merged['b'], [10.0, 20.0])
+
+
+def test_unknown_mode_raises():
+    with pytest.raises(ValueError):
+        align_frames([part(['2024-01-01'], 'a', [1.0])], 'linear')
@@ -0,0 +1,57 @@
+import os
+
+import pytest
+
+from analytics_ui.readers import MergeCancelled
+from analytics_ui.export import load_result
+from analytics_ui.pipeline import MergeError, run_merge
+
+from conftest import merge_job, write_export
+
+
+@pytest.fixture
+def previous_report(export_file, tmp_path, profile):
+    report = tmp_path / "report.xlsx"
+    run_merge(merge_job([export_file], report), profile=profile)
+    return str(report)
+
+
+def newer_export(tmp_path):
+    return write_export(tmp_path / "Архив_узла_1_2024_02.xlsx", start='2024-01-02', hours=12)
+
+
+def test_cancel_while_writing_keeps_previous_report(previous_report, tmp_path, profile):
+    before = open(previous_report, 'rb').read()
+    writing = []
+    job = merge_job([newer_export(tmp_path)], previous_report, append_to=previous_report)
+
+    with pytest.raises(MergeCancelled):
+        run_merge(job, progress=lambda percent, text: writing.append(text.startswith("Запись листа")),
+                  should_stop=lambda: any(writing), profile=profile)
+
+    assert any(writing)
+    assert open(previous_report, 'rb').read() == before
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        ['Архив_узла_1_2024.xlsx', 'Архив_узла_1_2024_02.xlsx', 'profile.jsonl', 'report.data.feather', 'report.xlsx'])
+
+
+def test_write_error_keeps_previous_report(previous_report, tmp_path, profile, monkeypatch):
+    before = open(previous_report, 'rb').read()
+    job = merge_job([newer_export(tmp_path)], previous_report, append_to=previous_report)
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("диск переполнен")
+    monkeypatch.setattr('analytics_ui.pipeline.create_dashboard_sheet', fail)
+
+    with pytest.raises(MergeError, match="диск переполнен"):
+        run_merge(job, profile=profile)
+    assert open(previous_report, 'rb').read() == before
+
+
+def test_append_in_place_replaces_report_and_sidecar(previous_report, tmp_path, profile):
+    job = merge_job([newer_export(tmp_path)], previous_report, append_to=previous_report)
+
+    run_merge(job, profile=profile)
+
+    assert len(load_result(previous_report)) == 36
+    assert not [name for name in os.listdir(tmp_path) if '.tmp' in name]
@@ -0,0 +1,22 @@
+import pandas as pd
+
+from analytics_ui import readers
+from analytics_ui.file_cache import DiskCache
+from analytics_ui.pipeline import run_merge
+
+from conftest import merge_job
+
+
+def test_other_period_is_taken_from_disk_cache(export_file, tmp_path, profile, monkeypatch):
+    disk_cache = DiskCache(str(tmp_path / "cache"))
+    full = run_merge(merge_job([export_file], tmp_path / "report.xlsx"), disk_cache=disk_cache, profile=profile)
+
+    def fail_read(*args, **kwargs):
+        raise AssertionError("файл разобран повторно")
+
+    monkeypatch.setattr(readers, 'read_excel', fail_read)
+    job = merge_job([export_file], tmp_path / "report.xlsx", start=pd.Timestamp("2024-01-01 12:00"))
+    windowed = run_merge(job, disk_cache=disk_cache, profile=profile)
+
+    assert len(windowed) == 12
+    pd.testing.assert_frame_equal(windowed, full.iloc[12:].reset_index(drop=True))
@@ -0,0 +1,49 @@
+import pandas as pd
+import pytest
+
+from analytics_ui import readers
+from analytics_ui.readers import probe_excel, read_excel
+
+from conftest import write_export
+
+
+@pytest.fixture
+def xlsxwriter_export(tmp_path):
+    """Выгрузка, записанная xlsxwriter (общие строки, даты - числа с форматом)"""
+    path = tmp_path / "Архив_узла_1_xlsxwriter.xlsx"
+    df = pd.DataFrame({'Время': pd.date_range('2024-03-01', periods=50, freq='h'), 'T(C)': range(50)})
+    with pd.ExcelWriter(path, engine='xlsxwriter', datetime_format='dd.mm.yyyy hh:mm') as writer:
+        df.to_excel(writer, index=False)
+    return str(path)
+
+
+def assert_probe_matches_read(file_path):
+    probe = probe_excel(file_path)
+    df = read_excel(file_path)
+    assert probe.columns == [str(column) for column in df.columns]
+    assert probe.rows == len(df)
+    assert probe.time_range() == (df.iloc[:, 0].min(), df.iloc[:, 0].max())
+
+
+@pytest.mark.parametrize('writer', ['openpyxl', 'xlsxwriter'])
+def test_probe_matches_full_read(writer, export_file, xlsxwriter_export):
+    assert_probe_matches_read(export_file if writer == 'openpyxl' else xlsxwriter_export)
+
+
+def test_last_cell_resolves_shared_string(tmp_path):
+    path = tmp_path / "strings.xlsx"
+    pd.DataFrame({'Время': ['первая', 'вторая', 'последняя']}).to_excel(path, index=False, engine='xlsxwriter')
+
+    assert readers._xlsx_last_cell(str(path)) == (4, 'последняя')
+
+
+def test_probe_falls_back_when_package_cannot_be_parsed(xlsxwriter_export, monkeypatch):
+    def broken(archive):
+        raise KeyError('xl/_rels/workbook.xml.rels')
+    monkeypatch.setattr(readers, '_xlsx_first_sheet', broken)
+
+    assert_probe_matches_read(xlsxwriter_export)
+
+
+def test_probe_of_longer_export(tmp_path):
+    assert_probe_matches_read(write_export(tmp_path / "Архив_узла_1_long.xlsx", hours=24 * 40))
@@ -0,0 +1,56 @@
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from analytics_ui.profiling import MergeProfile, current_rss_mb, measure_start, measure_stop
+
+
+def sampler_threads():
+    return [thread for thread in threading.enumerate() if thread.name == "rss-sampler"]
+
+
+@pytest.mark.skipif(current_rss_mb() is None, reason="объём памяти процесса недоступен")
+def test_stage_records_peak_of_freed_memory(tmp_path):
+    profile = MergeProfile(path=str(tmp_path / "profile.jsonl"))
+
+    with profile.stage('align') as record:
+        data = np.ones(100 * 1024 * 1024 // 8)
+        time.sleep(0.2)
+        del data
+
+    assert record['peak_rss_mb'] - record['rss_mb'] > 50
+    assert not sampler_threads()
+
+
+def test_nested_measurement_keeps_outer_traced_peak():
+    tracemalloc.start()
+    try:
+        outer = measure_start()
+        data = bytearray(20 * 1024 * 1024)
+        del data
+        inner = measure_start()
+        inner_record = measure_stop(inner, {})
+        outer_record = measure_stop(outer, {})
+    finally:
+        tracemalloc.stop()
+
+    assert inner_record['tracemalloc_peak_mb'] < 5
+    assert outer_record['tracemalloc_peak_mb'] >= 20
+
+
+def test_failed_stage_is_closed(tmp_path):
+    profile = MergeProfile(path=str(tmp_path / "profile.jsonl"), trace_memory=True)
+    profile.begin()
+
+    with pytest.raises(ValueError):
+        with profile.stage('read'):
+            raise ValueError("ошибка чтения")
+    profile.finish('error')
+
+    assert [record['stage'] for record in profile.records] == ['read', 'total']
+    assert 'tracemalloc_peak_mb' in profile.records[-1]
+    assert not sampler_threads()
+    assert not tracemalloc.is_tracing()
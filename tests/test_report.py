@@ -0,0 +1,130 @@
+import numpy as np
+import openpyxl
+import pandas as pd
+import pytest
+import xlsxwriter
+
+from analytics_ui.pipeline import DATETIME_FORMAT, run_merge
+from analytics_ui.report import (
+    COLOR_MODE_CONDITIONAL, COLOR_MODE_STATIC, DATA_FIRST_ROW, DATA_SHEET_NAME,
+    _column_splits, _row_splits, data_sheet_layout, write_data_rows
+)
+from analytics_ui.rules import compile_rules
+
+from conftest import merge_job, write_export
+
+COLUMNS = ['Время', '1_T', '1_P', '2_T', '2_P', '3_T', '3_P']
+
+
+def node_rules():
+    """Правила трёх узлов по два столбца в каждом"""
+    rows = [(f'Архив_узла_{node}', old, f'{node}_{old}', f'Узел {node}', parameter, None, None, '')
+            for node in (1, 2, 3) for old, parameter in (('T', 'Температура'), ('P', 'Давление'))]
+    return compile_rules(pd.DataFrame(rows, columns=[
+        'Название файла', 'Старое название столбца', 'Новое название столбца',
+        'Наименование узла измерений', 'Параметр', 'Min', 'Max', 'Единицы измерения']))
+
+
+def hourly_frame(hours, columns=COLUMNS):
+    data = {'Время': pd.date_range('2024-01-01', periods=hours, freq='h')}
+    for column in columns[1:]:
+        data[column] = np.arange(hours, dtype=float)
+    return pd.DataFrame(data)
+
+
+def test_rows_are_split_on_day_boundaries():
+    assert _row_splits(hourly_frame(72), 30) == [(0, 24), (24, 48), (48, 72)]
+
+
+def test_day_longer_than_sheet_is_cut_at_the_limit():
+    assert _row_splits(hourly_frame(48), 10) == [(0, 10), (10, 20), (20, 24), (24, 34), (34, 44), (44, 48)]
+
+
+def test_rows_without_time_are_split_at_the_limit():
+    df = pd.DataFrame({'a': range(25)})
+
+    assert _row_splits(df, 10) == [(0, 10), (10, 20), (20, 25)]
+
+
+def test_columns_of_one_node_stay_together():
+    df = hourly_frame(2)
+
+    assert _column_splits(df, node_rules(), 5) == [[0, 1, 2, 3, 4], [0, 5, 6]]
+    assert _column_splits(df, node_rules(), 4) == [[0, 1, 2], [0, 3, 4], [0, 5, 6]]
+
+
+def test_node_wider_than_sheet_is_cut():
+    df = hourly_frame(2, ['Время', '1_T', '1_P', '2_T ⚠', '2_P'])
+
+    assert _column_splits(df, node_rules(), 2) == [[0, 1], [0, 2], [0, 3], [0, 4]]
+    assert _column_splits(df, node_rules(), 3) == [[0, 1, 2], [0, 3, 4]]
+
+
+def test_layout_fits_on_one_sheet():
+    df = hourly_frame(48)
+
+    layout = data_sheet_layout(df, node_rules())
+
+    assert [(sheet.name, sheet.row_start, sheet.row_stop, sheet.columns) for sheet in layout] == \
+        [(DATA_SHEET_NAME, 0, 48, list(range(len(COLUMNS))))]
+    assert layout[0].frame(df) is df
+
+
+def test_layout_splits_rows_and_columns():
+    df = hourly_frame(48)
+
+    layout = data_sheet_layout(df, node_rules(), max_rows=30 + DATA_FIRST_ROW, max_columns=5)
+
+    assert [(sheet.name, sheet.row_start, sheet.row_stop, sheet.columns) for sheet in layout] == [
+        (f'{DATA_SHEET_NAME}_1', 0, 24, [0, 1, 2, 3, 4]),
+        (f'{DATA_SHEET_NAME}_2', 0, 24, [0, 5, 6]),
+        (f'{DATA_SHEET_NAME}_3', 24, 48, [0, 1, 2, 3, 4]),
+        (f'{DATA_SHEET_NAME}_4', 24, 48, [0, 5, 6]),
+    ]
+    assert list(layout[3].frame(df).columns) == ['Время', '3_T', '3_P']
+    # Строки 30..40 данных - строки 6..16 листа после трёх строк заголовка
+    assert layout[3].cell_range(5, 30, 40) == f"'{DATA_SHEET_NAME}_4'!B10:B20"
+
+
+def sheet_values(path, sheet_name):
+    worksheet = openpyxl.load_workbook(path)[sheet_name]
+    return [[(cell.value, cell.fill.fgColor.rgb) for cell in row] for row in worksheet.iter_rows()]
+
+
+def test_streaming_rows_match_to_excel(tmp_path):
+    df = pd.DataFrame({
+        'Время': pd.to_datetime(['2024-01-01 00:00', '2024-01-01 01:00', None, '2024-01-01 03:00', '2024-01-01 04:00']),
+        'x': [1.5, np.nan, np.inf, -np.inf, 0.0],
+        'n': [1, 2, 3, 4, 5],
+        's': ['↑', '', None, 'текст', '↓'],
+        'b': [True, False, True, False, True],
+    })
+
+    streamed = str(tmp_path / "streamed.xlsx")
+    workbook = xlsxwriter.Workbook(streamed, {'constant_memory': True})
+    worksheet = workbook.add_worksheet(DATA_SHEET_NAME)
+    write_data_rows(worksheet, df, DATA_FIRST_ROW, datetime_format=workbook.add_format({'num_format': DATETIME_FORMAT}),
+                    chunk_rows=2)
+    workbook.close()
+
+    written = str(tmp_path / "written.xlsx")
+    with pd.ExcelWriter(written, engine='xlsxwriter', datetime_format=DATETIME_FORMAT) as writer:
+        df.to_excel(writer, sheet_name=DATA_SHEET_NAME, index=False, header=False, startrow=DATA_FIRST_ROW)
+
+    assert sheet_values(streamed, DATA_SHEET_NAME) == sheet_values(written, DATA_SHEET_NAME)
+
+
+@pytest.mark.parametrize('color_mode', [COLOR_MODE_CONDITIONAL, COLOR_MODE_STATIC])
+def test_streaming_report_matches_regular_report(tmp_path, profile, color_mode):
+    export_file = write_export(tmp_path / "Архив_узла_1_2024.xlsx", hours=30)
+    reports = {}
+    for streaming in (False, True):
+        output_file = tmp_path / f"report_{streaming}.xlsx"
+        run_merge(merge_job([export_file], output_file, color_mode=color_mode, streaming=streaming), profile=profile)
+        reports[streaming] = sheet_values(str(output_file), DATA_SHEET_NAME)
+
+    assert len(reports[True]) == 30 + DATA_FIRST_ROW
+    assert reports[True][DATA_FIRST_ROW:] == reports[False][DATA_FIRST_ROW:]
+    # Заголовок Время без объединения ячеек - во второй строке, остальной заголовок тот же
+    assert reports[True][1][0][0] == 'Время'
+    assert [row[1:] for row in reports[True][:DATA_FIRST_ROW]] == [row[1:] for row in reports[False][:DATA_FIRST_ROW]]
@@ -0,0 +1,52 @@
+import os
+
+import pandas as pd
+
+from analytics_ui.file_cache import DataFrameCache
+from analytics_ui.pipeline import run_merge
+
+from conftest import merge_job, write_export
+
+
+def read_sources(profile):
+    return [record.get('source') for record in profile.records if record['stage'] == 'read_file']
+
+
+def test_repeated_merge_uses_session_cache(export_file, tmp_path, profile):
+    cache = DataFrameCache()
+    job = merge_job([export_file], tmp_path / "report.xlsx")
+
+    first = run_merge(job, cache, profile=profile)
+    second = run_merge(job, cache, profile=profile)
+
+    assert read_sources(profile) == [None, 'session cache']
+    pd.testing.assert_frame_equal(first, second)
+
+
+def test_other_period_and_changed_file_are_read_again(export_file, tmp_path, profile):
+    cache = DataFrameCache()
+    run_merge(merge_job([export_file], tmp_path / "report.xlsx"), cache, profile=profile)
+
+    run_merge(merge_job([export_file], tmp_path / "report.xlsx", start=pd.Timestamp("2024-01-01 12:00")),
+              cache, profile=profile)
+    write_export(export_file, hours=30)
+    os.utime(export_file, ns=(1, 1))
+    merged_df = run_merge(merge_job([export_file], tmp_path / "report.xlsx"), cache, profile=profile)
+
+    assert read_sources(profile) == [None, None, None]
+    assert len(merged_df) == 30
+
+
+def test_cache_evicts_least_recently_used():
+    df = pd.DataFrame({'a': range(1000)})
+    cache = DataFrameCache(max_bytes=int(df.memory_usage(index=True, deep=True).sum() * 2.5))
+    files = [__file__, os.path.join(os.path.dirname(__file__), 'conftest.py')]
+    cache.put(files[0], (None, df), 'a')
+    cache.put(files[0], (None, df), 'b')
+    cache.get(files[0], 'a')
+    cache.put(files[1], (None, df))
+
+    assert cache.get(files[0], 'a') is not None
+    assert cache.get(files[0], 'b') is None
+    cache.evict(files[0])
+    assert len(cache) == 1
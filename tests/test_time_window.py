@@ -0,0 +1,51 @@
+import pandas as pd
+import pytest
+
+from analytics_ui.readers import available_readers, prepare_frame, read_excel
+from analytics_ui.pipeline import MergeError, run_merge
+
+from conftest import merge_job
+
+
+def test_prepare_frame_keeps_time_column_for_empty_window():
+    df = pd.DataFrame({'Время': pd.date_range('2024-01-01', periods=3, freq='h'), 'T(C)': [1.0, 2.0, 3.0]})
+    window = (pd.Timestamp("2025-01-01"), None)
+
+    time_column, prepared = prepare_frame(df, "Архив_узла_1.xlsx", True, {'T(C)': '1_T'}, {'1_T'}, window)
+
+    assert len(time_column) == 0
+    assert list(prepared.columns) == ['1_T']
+    assert prepared.empty
+
+
+def test_window_past_last_timestamp_raises_merge_error(export_file, tmp_path, profile):
+    job = merge_job([export_file], tmp_path / "report.xlsx", start=pd.Timestamp("2025-01-01"))
+
+    with pytest.raises(MergeError, match="нет данных в выбранном периоде"):
+        run_merge(job, profile=profile)
+    assert not (tmp_path / "report.xlsx").exists()
+
+
+def test_window_inside_data_is_merged(export_file, tmp_path, profile):
+    job = merge_job([export_file], tmp_path / "report.xlsx", start=pd.Timestamp("2024-01-01 12:00"))
+
+    merged_df = run_merge(job, profile=profile)
+
+    assert len(merged_df) == 12
+    assert merged_df['Время'].min() == pd.Timestamp('2024-01-01 12:00')
+
+
+@pytest.mark.parametrize('reader', available_readers())
+def test_window_in_descending_export(tmp_path, reader):
+    path = str(tmp_path / "Архив_узла_1_2024.xlsx")
+    pd.DataFrame({
+        'Время': pd.date_range('2024-01-01', periods=48, freq='h')[::-1],
+        'T(C)': [float(hour) for hour in range(48)],
+    }).to_excel(path, index=False)
+    window = (pd.Timestamp('2024-01-01 05:00'), pd.Timestamp('2024-01-01 10:00'))
+
+    df = read_excel(path, time_window=window, reader=reader)
+
+    assert len(df) == 6
+    assert df['Время'].min() == window[0]
+    assert df['Время'].max() == window[1]